@@ -5,11 +5,31 @@ from flask_moment import Moment
 from flask_login import LoginManager
 from config import config
 from flask_pagedown import PageDown
+from .mongo import Mongo
+from .last_seen import LastSeenBuffer
+from .renderer import Renderer
+from .page_cache import PageCache
+from .metrics import QueryMonitor
+from .passwords import PasswordHasher
+from .roles import RoleRegistry
+from .fragments import FragmentCache
+from .assets import Assets
+from .streaming import Streaming
 
 bootstrap = Bootstrap()
 mail = Mail()
 moment = Moment()
 pagedown = PageDown()
+db = Mongo()
+last_seen = LastSeenBuffer()
+renderer = Renderer()
+page_cache = PageCache()
+query_monitor = QueryMonitor()
+password_hasher = PasswordHasher()
+roles = RoleRegistry()
+fragments = FragmentCache()
+assets = Assets()
+streaming = Streaming()
 
 login_manager = LoginManager()
 login_manager.session_protection = 'strong'
@@ -26,6 +46,16 @@ def create_app(config_name):
     moment.init_app(app)
     login_manager.init_app(app)
     pagedown.init_app(app)
+    db.init_app(app)
+    query_monitor.init_app(app)
+    password_hasher.init_app(app)
+    roles.init_app(app)
+    last_seen.init_app(app)
+    renderer.init_app(app)
+    page_cache.init_app(app)
+    fragments.init_app(app)
+    assets.init_app(app)
+    streaming.init_app(app)
 
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
@@ -33,4 +63,17 @@ def create_app(config_name):
     from .auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
 
+    from .api import api as api_blueprint
+    app.register_blueprint(api_blueprint, url_prefix='/api/v1')
+
+    from .models import user_cache
+    user_cache.configure(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+    from .search import results, frequencies
+    results.configure(app.config['SEARCH_CACHE_SIZE'], app.config['SEARCH_CACHE_TTL'])
+    frequencies.configure(app.config['SEARCH_TERM_CACHE_SIZE'], app.config['SEARCH_TERM_CACHE_TTL'])
+
+    from .email import mail_queue
+    mail_queue.init_app(app)
+
     return app
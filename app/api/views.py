@@ -0,0 +1,143 @@
+import json
+import zlib
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from flask import request, current_app, Response
+from flask_login import current_user
+from pymongo import ASCENDING
+from . import api
+from .errors import unauthorized
+from .. import db
+from ..async_api import json_default
+from ..exceptions import ValidationError
+from ..pagination import encode_cursor, decode_cursor
+
+POST_FIELDS = ('username', 'user_id', 'issuing_time', 'body', 'body_html', 'comment_count')
+POST_DEFAULT_FIELDS = ('username', 'issuing_time', 'body_html', 'comment_count')
+USER_FIELDS = ('username', 'name', 'location', 'about_me', 'role', 'member_since', 'last_since',
+               'post_count', 'follower_count', 'following_count')
+COMMENT_FIELDS = ('post_id', 'username', 'body', 'created_at')
+
+
+def _list_arg(name):
+    values = [value for value in request.args.get(name, '').split(',') if value]
+    if not values:
+        raise ValidationError('%s is required' % name)
+    if len(values) > current_app.config['API_BATCH_LIMIT']:
+        raise ValidationError('at most %d %s per request' % (current_app.config['API_BATCH_LIMIT'], name))
+    return list(dict.fromkeys(values))
+
+
+def _object_ids(values):
+    try:
+        return [ObjectId(value) for value in values]
+    except InvalidId:
+        raise ValidationError('invalid id')
+
+
+def _projection(allowed, default=None):
+    """Mongo projection for the `fields` argument, limited to `allowed`."""
+    fields = request.args.get('fields')
+    fields = fields.split(',') if fields else (default or allowed)
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise ValidationError('unknown fields: %s' % ', '.join(sorted(unknown)))
+    return dict((field, True) for field in fields)
+
+
+def _stream(items, name='items', **extra):
+    """Stream {name: [...], **extra} as JSON, gzip-compressed when the client accepts it.
+
+    `extra` values may be callables; they are evaluated after the items
+    have been written, so they can depend on what was streamed.
+    """
+    def chunks():
+        yield '{"%s":[' % name
+        for i, item in enumerate(items):
+            yield (',' if i else '') + json.dumps(item, default=json_default, ensure_ascii=False)
+        yield ']'
+        for key, value in extra.items():
+            value = value() if callable(value) else value
+            yield ',%s:%s' % (json.dumps(key), json.dumps(value, default=json_default, ensure_ascii=False))
+        yield '}'
+
+    def gzipped():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks():
+            data = compressor.compress(chunk.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    if 'gzip' in request.accept_encodings:
+        response = Response(gzipped(), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response((chunk.encode('utf-8') for chunk in chunks()), mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@api.route('/posts')
+def posts():
+    """Posts by id, in the order requested; ids that do not exist are skipped."""
+    ids = _object_ids(_list_arg('ids'))
+    found = dict((post['_id'], post) for post in
+                 db.articles.collection.find({'_id': {'$in': ids}},
+                                             _projection(POST_FIELDS, POST_DEFAULT_FIELDS)))
+    return _stream(found[id] for id in ids if id in found)
+
+
+@api.route('/users')
+def users():
+    """Public user cards by username, in the order requested."""
+    usernames = _list_arg('usernames')
+    projection = _projection(USER_FIELDS)
+    projection['username'] = True
+    found = dict((user['username'], user) for user in
+                 db.users.collection.find({'username': {'$in': usernames}}, projection))
+    return _stream(found[username] for username in usernames if username in found)
+
+
+@api.route('/following')
+def following():
+    """Which of the given usernames the current user follows."""
+    if not current_user.is_authenticated:
+        return unauthorized('login required')
+    usernames = _list_arg('usernames')
+    followed = db.follows.following_any(current_user.username, usernames)
+    return _stream(({'username': username, 'following': username in followed} for username in usernames))
+
+
+@api.route('/post/<id>/comments')
+def comments(id):
+    """Comments of a post in order, starting after the `since` cursor."""
+    post_id = _object_ids([id])[0]
+    limit = min(request.args.get('limit', current_app.config['FLASKY_COMMENTS_PER_PAGE'], type=int),
+                current_app.config['API_BATCH_LIMIT'])
+    query = {'post_id': post_id}
+    since = request.args.get('since')
+    if since:
+        decoded = decode_cursor(since)
+        if decoded is None:
+            raise ValidationError('invalid cursor')
+        _, _, created_at, comment_id = decoded
+        query['$or'] = [{'created_at': {'$gt': created_at}}, {'created_at': created_at, '_id': {'$gt': comment_id}}]
+    projection = _projection(COMMENT_FIELDS)
+    projection['created_at'] = True
+    cursor = db.comments.collection.find(query, projection) \
+        .sort([('created_at', ASCENDING), ('_id', ASCENDING)]).limit(max(limit, 1))
+    state = {'last': None}
+
+    def items():
+        for comment in cursor:
+            state['last'] = comment
+            yield comment
+
+    def next_cursor():
+        # With no new comments the client keeps polling with the same cursor.
+        if state['last'] is None:
+            return since
+        return encode_cursor(0, 'next', state['last'], key='created_at')
+
+    return _stream(items(), next=next_cursor)
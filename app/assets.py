@@ -0,0 +1,216 @@
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+import shutil
+from urllib.request import urlopen
+from flask import abort, request, send_file, url_for as flask_url_for
+from markupsafe import Markup
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.ico', '.txt', '.json', '.eot', '.ttf')
+# Third-party scripts the templates otherwise load from CDNs, fetched by `build_assets --vendor`.
+VENDOR = {
+    'moment-with-locales.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/moment.js/2.10.6/moment-with-locales.min.js',
+    'Markdown.Converter.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/pagedown/1.0/Markdown.Converter.min.js',
+    'Markdown.Sanitizer.min.js': 'https://cdnjs.cloudflare.com/ajax/libs/pagedown/1.0/Markdown.Sanitizer.min.js'
+}
+
+
+def _compress(data):
+    """{encoding: bytes} for the variants that are actually smaller than `data`."""
+    variants = {}
+    buffer = io.BytesIO()
+    # mtime=0 keeps the output identical across builds.
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buffer, compresslevel=9, mtime=0) as f:
+        f.write(data)
+    variants['gzip'] = buffer.getvalue()
+    if brotli is not None:
+        variants['br'] = brotli.compress(data)
+    return dict((encoding, body) for encoding, body in variants.items() if len(body) < len(data))
+
+
+def _write(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build(source, dist):
+    """Copy every file under `source` into `dist` under a content-hashed name.
+
+    Compressible files also get .gz (and, with the brotli package, .br)
+    variants. The plain name is written too, so relative references such
+    as a stylesheet's fonts keep working. Returns the manifest, which maps
+    each source path to its hashed path and available encodings.
+    """
+    manifest = {}
+    skip = os.path.abspath(dist)
+    for root, dirs, files in os.walk(source):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != skip]
+        for name in files:
+            path = os.path.join(root, name)
+            logical = os.path.relpath(path, source).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            stem, ext = os.path.splitext(logical)
+            hashed = '%s.%s%s' % (stem, digest, ext)
+            variants = _compress(data) if ext.lower() in COMPRESSIBLE else {}
+            for target in (hashed, logical):
+                _write(os.path.join(dist, target), data)
+                if 'gzip' in variants:
+                    _write(os.path.join(dist, target + '.gz'), variants['gzip'])
+                if 'br' in variants:
+                    _write(os.path.join(dist, target + '.br'), variants['br'])
+            manifest[logical] = {'path': hashed, 'encodings': sorted(variants)}
+    temporary = os.path.join(dist, MANIFEST + '.tmp')
+    _write(temporary, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    os.replace(temporary, os.path.join(dist, MANIFEST))
+    return manifest
+
+
+def vendor(static_folder):
+    """Copy Flask-Bootstrap's files and download VENDOR into static/vendor; returns the files written."""
+    import flask_bootstrap
+    target = os.path.join(static_folder, 'vendor')
+    bootstrap = os.path.join(target, 'bootstrap')
+    if os.path.isdir(bootstrap):
+        shutil.rmtree(bootstrap)
+    shutil.copytree(os.path.join(os.path.dirname(flask_bootstrap.__file__), 'static'), bootstrap)
+    written = ['bootstrap/']
+    for name, url in sorted(VENDOR.items()):
+        _write(os.path.join(target, name), urlopen(url, timeout=30).read())
+        written.append(name)
+    return written
+
+
+_ENCODING_SUFFIX = {'br': '.br', 'gzip': '.gz'}
+_MOMENT_SCRIPT = re.compile(r'<script src="[^"]*/moment\.js/[^"]*"></script>')
+
+
+class Assets:
+    """Serves the output of build() with far-future caching and precompressed variants.
+
+    Templates get a `url_for` that turns static files listed in the
+    manifest into /assets/<name>.<hash>.<ext> URLs; anything not built
+    falls back to the regular static route, so development needs no
+    build step. With ASSETS_VENDOR the Bootstrap, Moment and PageDown
+    scripts come from the vendored copies instead of CDNs.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.manifest = {}
+        self.files = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_DIST_DIR', os.path.join(app.static_folder, 'dist'))
+        app.config.setdefault('ASSETS_URL_PREFIX', '/assets')
+        app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+        app.config.setdefault('ASSETS_VENDOR', False)
+        self.app = app
+        self.load()
+        app.add_url_rule(app.config['ASSETS_URL_PREFIX'] + '/<path:filename>', 'assets', self.serve)
+        app.jinja_env.globals.update(url_for=self.url_for, assets=self)
+        find_resource = app.jinja_env.globals.get('bootstrap_find_resource')
+        if app.config['ASSETS_VENDOR'] and find_resource is not None:
+            app.jinja_env.globals['bootstrap_find_resource'] = self._bootstrap_resource(find_resource)
+
+    def load(self):
+        path = os.path.join(self.app.config['ASSETS_DIST_DIR'], MANIFEST)
+        manifest = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+        files = {}
+        for logical, entry in manifest.items():
+            files[entry['path']] = (entry['encodings'], True)
+            files[logical] = (entry['encodings'], False)
+        self.manifest, self.files = manifest, files
+        return manifest
+
+    def url(self, filename):
+        entry = self.manifest.get(filename)
+        if entry is None:
+            return None
+        return flask_url_for('assets', filename=entry['path'])
+
+    def url_for(self, endpoint, **values):
+        if endpoint == 'static' and len(values) == 1:
+            url = self.url(values.get('filename'))
+            if url is not None:
+                return url
+        return flask_url_for(endpoint, **values)
+
+    def _bootstrap_resource(self, find_resource):
+        def bootstrap_find_resource(filename, cdn, use_minified=None, local=True):
+            if use_minified is None:
+                use_minified = self.app.config.get('BOOTSTRAP_USE_MINIFIED', True)
+            name = '%s.min.%s' % tuple(filename.rsplit('.', 1)) if use_minified else filename
+            return self.url('vendor/bootstrap/' + name) or find_resource(filename, cdn, use_minified, local)
+
+        return bootstrap_find_resource
+
+    def _scripts(self, names):
+        urls = [self.url('vendor/' + name) for name in names]
+        if not self.app.config['ASSETS_VENDOR'] or None in urls:
+            return None
+        return urls
+
+    def include_moment(self, moment):
+        urls = self._scripts(['moment-with-locales.min.js'])
+        if not urls:
+            return moment.include_moment()
+        try:
+            return moment.include_moment(local_js=urls[0])
+        except TypeError:
+            # Flask-Moment before 0.5 has no local_js; swap its CDN tag for ours.
+            return Markup(_MOMENT_SCRIPT.sub(lambda match: '<script src="%s"></script>' % urls[0],
+                                             moment.include_moment(), count=1))
+
+    def include_pagedown(self, pagedown):
+        urls = self._scripts(['Markdown.Converter.min.js', 'Markdown.Sanitizer.min.js'])
+        if not urls:
+            return pagedown.include_pagedown()
+        return Markup(''.join('<script type="text/javascript" src="%s"></script>\n' % url for url in urls))
+
+    def _encoding(self, encodings):
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in encodings and accepted[encoding]:
+                return encoding
+        return None
+
+    def serve(self, filename):
+        entry = self.files.get(filename)
+        if entry is None:
+            abort(404)
+        encodings, immutable = entry
+        encoding = self._encoding(encodings)
+        path = os.path.join(self.app.config['ASSETS_DIST_DIR'], filename)
+        if encoding is not None:
+            path += _ENCODING_SUFFIX[encoding]
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        max_age = self.app.config['ASSETS_MAX_AGE'] if immutable else 0
+        response = send_file(path, mimetype=mimetype, conditional=True, cache_timeout=max_age)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        if immutable:
+            response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % max_age
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
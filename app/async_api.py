@@ -0,0 +1,268 @@
+import asyncio
+import json
+import re
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from itsdangerous import BadSignature
+from pymongo import ASCENDING, DESCENDING
+from . import timeline, roles
+from .async_mongo import AsyncMongo
+from .models import Permission, body_html
+from .pagination import Pagination
+from .renderer import POLICY_VERSION
+from .repositories import ArticleRepository
+
+POST_FIELDS = dict(ArticleRepository.card_fields, body=True)
+USER_FIELDS = ('username', 'name', 'location', 'about_me', 'role', 'member_since', 'post_count',
+               'follower_count', 'following_count')
+
+
+class APIError(Exception):
+    def __init__(self, status, message):
+        super(APIError, self).__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = dict((key, values[-1]) for key, values in
+                         parse_qs(scope.get('query_string', b'').decode('latin-1')).items())
+        cookie = SimpleCookie()
+        for name, value in scope.get('headers', []):
+            if name == b'cookie':
+                cookie.load(value.decode('latin-1'))
+        self.cookies = dict((key, morsel.value) for key, morsel in cookie.items())
+
+    def arg(self, name, default, type=int):
+        try:
+            return type(self.args[name])
+        except (KeyError, ValueError):
+            return default
+
+
+def json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z'
+    raise TypeError(repr(value))
+
+
+def _object_id(id):
+    try:
+        return ObjectId(id)
+    except (InvalidId, TypeError):
+        raise APIError(404, 'not found')
+
+
+def _can(role, permission):
+    return role is not None and role.can(permission)
+
+
+def _card(post):
+    html = post.get('body_html')
+    if html is None or post.get('body_html_version') != POLICY_VERSION:
+        html = body_html(post.get('body') or '')
+    return {'_id': post.get('_id'), 'username': post.get('username'), 'issuing_time': post.get('issuing_time'),
+            'body_html': html, 'comment_count': post.get('comment_count', 0)}
+
+
+def _pagination(page, per_page, total):
+    pagination = Pagination(page, per_page, total, [])
+    return {'page': page, 'per_page': per_page, 'total': total, 'pages': pagination.pages,
+            'has_prev': pagination.has_prev, 'has_next': pagination.has_next}
+
+
+class AsyncAPI:
+    """ASGI application serving the read-only JSON API next to the Flask app.
+
+    Every handler gathers its independent lookups concurrently, so one
+    process keeps many requests in flight while they wait on MongoDB.
+    Requests outside ASYNC_API_PREFIX go to `fallback` (another ASGI
+    application, e.g. the Flask app behind a WSGI adapter) when given.
+    """
+
+    def __init__(self, app, fallback=None):
+        app.config.setdefault('ASYNC_API_PREFIX', '/api')
+        self.app = app
+        self.mongo = AsyncMongo(app)
+        self.fallback = fallback
+        prefix = re.escape(app.config['ASYNC_API_PREFIX'])
+        self.routes = [
+            (re.compile('^%s/feed$' % prefix), self.feed),
+            (re.compile('^%s/user/(?P<username>[^/]+)$' % prefix), self.user),
+            (re.compile('^%s/post/(?P<id>[^/]+)/comments$' % prefix), self.comments),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http':
+            for pattern, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match:
+                    return await self._dispatch(scope, send, handler, match.groupdict())
+        if self.fallback is not None:
+            return await self.fallback(scope, receive, send)
+        await self._respond(send, 404, {'error': 'not found'})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _dispatch(self, scope, send, handler, view_args):
+        if scope['method'] not in ('GET', 'HEAD'):
+            return await self._respond(send, 405, {'error': 'method not allowed'})
+        try:
+            status, payload = 200, await handler(Request(scope), **view_args)
+        except APIError as e:
+            status, payload = e.status, {'error': e.message}
+        except Exception:
+            self.app.logger.exception('Unhandled error in %s', scope['path'])
+            status, payload = 500, {'error': 'internal server error'}
+        await self._respond(send, status, payload, scope['method'] == 'HEAD')
+
+    async def _respond(self, send, status, payload, head=False):
+        body = json.dumps(payload, default=json_default, ensure_ascii=False).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json; charset=utf-8'),
+                                (b'content-length', str(len(body)).encode('ascii'))]})
+        await send({'type': 'http.response.body', 'body': b'' if head else body})
+
+    def _page(self, request, per_page_key):
+        limit = self.app.config[per_page_key]
+        page = max(request.arg('page', 1), 1)
+        per_page = min(max(request.arg('per_page', limit), 1), limit)
+        return page, per_page
+
+    async def viewer(self, request):
+        """The user document and Role for the Flask-Login session cookie, or (None, None)."""
+        token = request.cookies.get(self.app.config['SESSION_COOKIE_NAME'])
+        serializer = self.app.session_interface.get_signing_serializer(self.app)
+        if not token or serializer is None:
+            return None, None
+        try:
+            session = serializer.loads(token, max_age=int(self.app.permanent_session_lifetime.total_seconds()))
+            user_id = ObjectId(session['user_id'])
+        except (BadSignature, KeyError, InvalidId, TypeError):
+            return None, None
+        database = self.mongo.get_database()
+        user = await database.User.find_one({'_id': user_id})
+        if user is None:
+            return None, None
+        if roles.stale():
+            # Flask's before_request hook never runs for this app; the check
+            # queries the database, so keep it off the event loop.
+            await asyncio.get_event_loop().run_in_executor(None, roles.refresh)
+        return user, roles.get(user.get('role'))
+
+    async def feed(self, request):
+        page, per_page = self._page(request, 'FLASKY_POSTS_PER_PAGE')
+        skip = (page - 1) * per_page
+        if request.arg('followed', 0):
+            user, role = await self.viewer(request)
+            if user is None:
+                raise APIError(401, 'login required')
+            total, posts = await self._followed(user.get('username'), skip, per_page)
+        else:
+            articles = self.mongo.get_database().Aritical
+            total, posts = await asyncio.gather(
+                articles.count_documents({}),
+                articles.find({}, POST_FIELDS).sort([('issuing_time', DESCENDING), ('_id', DESCENDING)])
+                .skip(skip).limit(per_page).to_list(per_page))
+        return {'posts': [_card(post) for post in posts], 'pagination': _pagination(page, per_page, total)}
+
+    async def _followed(self, username, skip, limit):
+        # Same merge-on-read as timeline.read(), with the pushed timeline and
+        # the large accounts' posts fetched together.
+        database = self.mongo.get_database()
+        edges = await database.Follow.find({'follower': username}, {'followee': True, '_id': False}).to_list(None)
+        following = [edge.get('followee') for edge in edges]
+        large = []
+        if following:
+            large = [user.get('username') for user in await database.User.find(
+                {'username': {'$in': following}, 'follower_count': {'$gt': self.app.config['FLASKY_FANOUT_LIMIT']}},
+                {'username': True}).to_list(None)]
+        kept = '$posts'
+        if large:
+            # Entries pushed before an author became large are counted from the source.
+            kept = {'$filter': {'input': '$posts', 'as': 'post',
+                                'cond': {'$not': {'$in': ['$$post.username', large]}}}}
+        lookups = [database.Timeline.aggregate([
+            {'$match': {'_id': username}},
+            {'$project': {'posts': kept}},
+            {'$project': {'total': {'$size': '$posts'}, 'posts': {'$slice': ['$posts', 0, skip + limit]}}}
+        ]).to_list(1)]
+        if large:
+            lookups += [database.Aritical.find({'username': {'$in': large}}, {'username': True, 'issuing_time': True})
+                        .sort('issuing_time', DESCENDING).limit(skip + limit).to_list(skip + limit),
+                        database.Aritical.count_documents({'username': {'$in': large}})]
+        results = await asyncio.gather(*lookups)
+        pushed = results[0]
+        total, entries = (pushed[0].get('total'), pushed[0].get('posts')) if pushed else (0, [])
+        posts = []
+        if large:
+            posts = results[1]
+            total += results[2]
+        ids = timeline.merge(entries, large, posts, skip, limit)
+        if not ids:
+            return total, []
+        return total, await database.Aritical.find({'_id': {'$in': ids}}, POST_FIELDS) \
+            .sort('issuing_time', DESCENDING).to_list(limit)
+
+    async def user(self, request, username):
+        page, per_page = self._page(request, 'FLASKY_POSTS_PER_PAGE')
+        database = self.mongo.get_database()
+        (viewer, role), user, posts = await asyncio.gather(
+            self.viewer(request),
+            database.User.find_one({'username': username}),
+            database.Aritical.find({'username': username}, POST_FIELDS)
+            .sort([('issuing_time', DESCENDING), ('_id', DESCENDING)])
+            .skip((page - 1) * per_page).limit(per_page).to_list(per_page))
+        if viewer is None:
+            raise APIError(401, 'login required')
+        if user is None:
+            raise APIError(404, 'not found')
+        # last_since is as stored: the pending timestamps sit in the Flask workers'
+        # buffers and reach the database within LAST_SEEN_FLUSH_INTERVAL seconds.
+        profile = dict((field, user.get(field)) for field in USER_FIELDS + ('last_since',))
+        if _can(role, Permission.ADMINISTER):
+            profile['email'] = user.get('email')
+        is_following = None
+        if _can(role, Permission.FOLLOW) and viewer.get('username') != username:
+            is_following = await database.Follow.find_one(
+                {'follower': viewer.get('username'), 'followee': username}, {'_id': True}) is not None
+        return {'user': profile, 'is_following': is_following, 'posts': [_card(post) for post in posts],
+                'pagination': _pagination(page, per_page, user.get('post_count', 0))}
+
+    async def comments(self, request, id):
+        page, per_page = self._page(request, 'FLASKY_COMMENTS_PER_PAGE')
+        post_id = _object_id(id)
+        database = self.mongo.get_database()
+        (viewer, role), post, total, comments = await asyncio.gather(
+            self.viewer(request),
+            database.Aritical.find_one({'_id': post_id}, POST_FIELDS),
+            database.Comment.count_documents({'post_id': post_id}),
+            database.Comment.find({'post_id': post_id}).sort([('created_at', ASCENDING), ('_id', ASCENDING)])
+            .skip((page - 1) * per_page).limit(per_page).to_list(per_page))
+        if post is None:
+            raise APIError(404, 'not found')
+        author = viewer is not None and viewer.get('username') == post.get('username')
+        return {'post': _card(post),
+                'comments': [{'_id': comment.get('_id'), 'username': comment.get('username'),
+                              'body': comment.get('body'), 'created_at': comment.get('created_at')}
+                             for comment in comments],
+                'pagination': _pagination(page, per_page, total),
+                'can_comment': viewer is not None and not author and _can(role, Permission.COMMENT),
+                'can_delete': author or _can(role, Permission.ADMINISTER)}
@@ -0,0 +1,110 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .mongo import _MongoState
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
+
+class _Cursor:
+    """The subset of motor's cursor API the read API uses, run on a thread pool."""
+
+    def __init__(self, run, make):
+        self._run = run
+        self._make = make
+        self._calls = []
+
+    def sort(self, *args, **kwargs):
+        self._calls.append(('sort', args, kwargs))
+        return self
+
+    def skip(self, *args):
+        self._calls.append(('skip', args, {}))
+        return self
+
+    def limit(self, *args):
+        self._calls.append(('limit', args, {}))
+        return self
+
+    def to_list(self, length):
+        def fetch():
+            cursor = self._make()
+            for name, args, kwargs in self._calls:
+                cursor = getattr(cursor, name)(*args, **kwargs)
+            return list(cursor)[:length] if length is not None else list(cursor)
+
+        return self._run(fetch)
+
+
+class _Collection:
+    def __init__(self, collection, executor):
+        self.collection = collection
+        self.executor = executor
+
+    def _run(self, function, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    def find_one(self, *args, **kwargs):
+        return self._run(self.collection.find_one, *args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        return _Cursor(self._run, lambda: self.collection.find(*args, **kwargs))
+
+    def aggregate(self, pipeline):
+        return _Cursor(self._run, lambda: self.collection.aggregate(pipeline))
+
+    def count_documents(self, query):
+        return self._run(self.collection.count_documents, query)
+
+
+class _Database:
+    def __init__(self, database, executor):
+        self.database = database
+        self.executor = executor
+
+    def __getitem__(self, name):
+        return _Collection(self.database[name], self.executor)
+
+    __getattr__ = __getitem__
+
+
+class AsyncMongo:
+    """Awaitable access to the application's database.
+
+    Uses motor when MONGO_ASYNC_DRIVER is 'motor' and it is installed;
+    otherwise the regular client (or an in-memory stand-in configured for
+    `db`) is driven from a thread pool of MONGO_ASYNC_THREADS threads.
+    """
+
+    def __init__(self, app):
+        app.config.setdefault('MONGO_ASYNC_DRIVER', 'motor')
+        app.config.setdefault('MONGO_ASYNC_THREADS', 16)
+        self.app = app
+        self.state = _MongoState(app.config)
+        self.use_motor = app.config['MONGO_ASYNC_DRIVER'] == 'motor' and AsyncIOMotorClient is not None and \
+            not self.state.uri.startswith('mongomock://')
+        self._database = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get_database(self):
+        # Like the sync client, never reuse a pool or thread pool across fork().
+        if self._database is None or self._pid != os.getpid():
+            with self._lock:
+                if self._database is None or self._pid != os.getpid():
+                    self._database = self._connect()
+                    self._pid = os.getpid()
+        return self._database
+
+    def _connect(self):
+        if self.use_motor:
+            return AsyncIOMotorClient(self.state.uri, **self.state.options)[self.state.dbname]
+        from . import db
+        executor = ThreadPoolExecutor(self.app.config['MONGO_ASYNC_THREADS'])
+        return _Database(db.get_database(self.app), executor)
@@ -2,7 +2,7 @@ from flask_wtf import Form
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, SelectField, TextAreaField
 from wtforms.validators import Required, Length, Email, Regexp, EqualTo
 from wtforms import ValidationError
-from pymongo import MongoClient
+from .. import db
 
 Province_choice = [('北京市', '北京市'), ('天津市', '天津市'), ('上海市', '上海市'), ('天津市', '天津市'), ('重庆市', '重庆市'), ('河北', '河北'),
                    ('山东', '山东'), ('辽宁', '辽宁'), ('黑龙江', '黑龙江'), ('吉林', '吉林'), ('甘肃', '甘肃'), ('青海', '青海'),
@@ -36,13 +36,19 @@ class RegistrationForm(Form):
     about_me = TextAreaField('自我介绍')
     submit = SubmitField('立即注册')
 
-    def validate_email(self, field):
-        if MongoClient().blog.User.find_one({'temp': field.data}):
-            raise ValidationError('邮箱已被注册.')
-
-    def validate_username(self, field):
-        if MongoClient().blog.User.find_one({'username': field.data}):
-            raise ValidationError('用户名已被注册.')
+    # Uniqueness is enforced by the email_unique/username_unique indexes;
+    # the view reports a DuplicateKeyError from the insert through duplicate().
+    def duplicate(self, error):
+        details = error.details or {}
+        keys = details.get('keyPattern') or details.get('keyValue') or {}
+        message = details.get('errmsg') or str(error)
+        if 'email' in keys or 'email_unique' in message:
+            field = self.email
+        elif 'username' in keys or 'username_unique' in message:
+            field = self.username
+        else:
+            field = self.email if db.users.by_email(self.email.data) else self.username
+        field.errors.append('邮箱已被注册.' if field is self.email else '用户名已被注册.')
 
 
 class PasswordResetRequestForm(Form):
@@ -51,7 +57,7 @@ class PasswordResetRequestForm(Form):
     submit = SubmitField('提交')
 
     def validate_email(self, field):
-        if MongoClient().blog.User.find_one({'temp': field.data}) is None:
+        if db.users.by_email(field.data) is None:
             raise ValidationError('邮箱不存在,请重新确认')
 
 
@@ -76,5 +82,5 @@ class ChangeEmailForm(Form):
     submit = SubmitField('修改')
 
     def validate_email(self, field):
-        if MongoClient().blog.User.find_one({'temp': field.data}) is not None:
+        if db.users.by_email(field.data) is not None:
             raise ValidationError('此邮箱已经注册.')
@@ -1,17 +1,17 @@
 from flask import render_template, redirect, request, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
 from . import auth
-from ..models import verify_password, User, Temp, generate_reset_password_confirmation_token, encrypt_passowrd, \
-    generate_change_email_confirmation_token
+from .. import last_seen, password_hasher
+from ..models import verify_password, User, UserDocument, generate_reset_password_confirmation_token, \
+    encrypt_passowrd, generate_change_email_confirmation_token
+from ..exceptions import ConcurrentModification
 from .forms import LoginForm, RegistrationForm, PasswordResetRequestForm, PasswordResetForm, ChangePasswordForm, \
     ChangeEmailForm
-from pymongo import MongoClient
 from ..email import send_email
 from flask import current_app
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer, BadSignature
-from bson.objectid import ObjectId
 import time
-from datetime import datetime
+from pymongo.errors import DuplicateKeyError
 
 
 @auth.before_app_request
@@ -35,15 +35,17 @@ def unconfirmed():
 def login():
     form = LoginForm()
     if form.validate_on_submit():
-        user = MongoClient().blog.User.find_one({'email': form.email.data})
-        if user is not None and verify_password(user.get('password'), form.password.data):
-            user = Temp(id=user.get('_id'), username=user.get('username'), email=user.get('email'),
-                        password=user.get('password'), activate=user.get('activate'), role=user.get('role'),
-                        name=user.get('name'),
-                        location=user.get('location'), about_me=user.get('about_me'), last_since=user.get('last_since'),
-                        member_since=user.get('member_since'))
+        user = UserDocument.by_email(form.email.data)
+        if user is not None and verify_password(user.password_hash, form.password.data):
+            if password_hasher.needs_rehash(user.password_hash):
+                user.password_hash = encrypt_passowrd(form.password.data)
+                try:
+                    user.save()
+                except ConcurrentModification:
+                    # The upgrade is opportunistic; the next login retries it.
+                    pass
             login_user(user, form.remember_me.data)
-            MongoClient().blog.User.update({'email': form.email.data}, {'$set': {'last_since': datetime.utcnow()}})
+            last_seen.touch(user.id)
             return redirect(request.args.get('next') or url_for('main.index'))
         flash('Invalid username or password.')
     return render_template('auth/login.html', form=form)
@@ -61,18 +63,19 @@ def logout():
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
-        User(email=form.email.data,
-             username=form.username.data,
-             password=form.password.data,
-             name=form.name.data,
-             location=form.location.data,
-             about_me=form.about_me.data).new_user()
-        user = MongoClient().blog.User.find_one({'email': form.email.data})
-        temp = Temp(id=user.get('_id'), username=user.get('username'), email=user.get('email'),
-                    password=user.get('password'), activate=False, role=user.get('role'), name=user.get('name'),
-                    location=user.get('location'), about_me=user.get('about_me'), last_since=user.get('last_since'),
-                    member_since=user.get('member_since'))
-        token = temp.generate_confirmation_token
+        user = User(email=form.email.data,
+                    username=form.username.data,
+                    password=form.password.data,
+                    name=form.name.data,
+                    location=form.location.data,
+                    about_me=form.about_me.data)
+        try:
+            user.new_user()
+        except DuplicateKeyError as e:
+            form.duplicate(e)
+            return render_template('auth/register.html', form=form)
+        temp = UserDocument(user.document)
+        token = temp.generate_confirmation_token()
         send_email(temp.email, 'Confirm Your Account',
                    'auth/temp/confirm', user=temp, token=token)
         flash('A confirmation temp has been sent to you by temp.')
@@ -89,15 +92,15 @@ def confirm(token):
     except BadSignature:
         return render_template('Link_expired.html')
     data = s.loads(token)
-    id = data.get('confirm')
-    user = MongoClient().blog.User.find_one({'_id': ObjectId(id)})
+    user = UserDocument.get(data.get('confirm'))
     if user is None:
         flash('The confirmation link is invalid or has expired.')
-    if user.get('activate'):
+        return redirect(url_for('main.index'))
+    if user.activate:
         flash('this Account is already confirm')
         return redirect(url_for('main.index'))
-    MongoClient().blog.User.update({'_id': ObjectId(id)}, {'$set': {'activate': True}})
-    time.sleep(1)
+    user.activate = True
+    user.save()
     flash('You have confirmed your account. Thanks!')
     return redirect(url_for('main.index'))
 
@@ -135,14 +138,14 @@ def password_reset(token):
         return render_template('Link_expired.html')
     data = s.loads(token)
     email = data.get('password_reset')
-    user = MongoClient().blog.User.find_one({'temp': email})
+    user = UserDocument.by_email(email)
     if user is None:
         flash('The confirmation link is invalid or has expired.')
         time.sleep(3)
         return redirect(url_for('main.index'))
     if form.validate_on_submit():
-        password = encrypt_passowrd(form.password.data)
-        MongoClient().blog.User.update({'temp': email}, {'$set': {'password': password}})
+        user.password_hash = encrypt_passowrd(form.password.data)
+        user.save()
         flash('Change Success,you can now login.')
         return redirect(url_for('auth.login'))
     return render_template('auth/reset_password.html', form=form)
@@ -157,8 +160,8 @@ def change_password():
             flash('old password is not correct')
             form.data.clear()
         else:
-            password = encrypt_passowrd(form.password.data)
-            MongoClient().blog.User.update({'temp': current_user.email}, {'$set': {'password': password}})
+            current_user.password_hash = encrypt_passowrd(form.password.data)
+            current_user.save()
             flash('Change Success,you can now login.')
             return redirect(url_for('auth.login'))
     return render_template('auth/change_password.html', form=form)
@@ -170,7 +173,8 @@ def change_email_request():
     form = ChangeEmailForm()
     if form.validate_on_submit():
         email = form.email.data
-        MongoClient().blog.User.update({'temp': current_user.email}, {'$set': {'email_temp': email}})
+        current_user.email_temp = email
+        current_user.save()
         token = generate_change_email_confirmation_token(email=current_user.email)
         send_email(email, 'Reset Your Password',
                    'auth/temp/change_email', user=current_user, token=token)
@@ -188,10 +192,12 @@ def change_email(token):
         return render_template('Link_expired.html')
     data = s.loads(token)
     email = data.get('change_email')
-    email_temp = MongoClient().blog.User.find_one({'temp': email}).get('email_temp')
-    MongoClient().blog.User.update({'temp': email}, {
-        '$set': {'temp': email_temp}})
-    MongoClient().blog.User.update({'temp': email_temp}, {'$unset': {'email_temp': email_temp}})
+    user = UserDocument.by_email(email)
+    if user is None or user.email_temp is None:
+        flash('The confirmation link is invalid or has expired.')
+        return redirect(url_for('main.index'))
+    user.email, user.email_temp = user.email_temp, None
+    user.save()
     logout_user()
     flash('Your e-mail successfully changed, please sign in again.')
     return redirect(url_for('auth.login'))
@@ -0,0 +1,251 @@
+import json
+import math
+import platform
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import build_opener, HTTPCookieProcessor, HTTPRedirectHandler
+from pymongo import ASCENDING, monitoring
+from . import db, timeline, schema
+from .models import encrypt_passowrd
+from .renderer import render_body, POLICY_VERSION
+
+WORDS = ['flask', 'mongo', 'python', 'cache', 'index', 'query', 'page', 'feed', 'timeline', 'worker',
+         '数据库', '性能', '缓存', '索引', '分页', '关注', '评论', '文章', '测试', '优化']
+PASSWORD = 'benchmark'
+SCENARIOS = ['login', 'index_all', 'index_followed', 'user', 'post', 'followers', 'follow', 'comment']
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed(database, users=100, posts=10, follows=10, comments=3, seed=0):
+    """Fill an empty database with a deterministic dataset; returns the scale used.
+
+    The same arguments always produce the same users, posts, follow graph
+    and comments, so results from two runs are comparable.
+    """
+    if database.User.find_one() is not None:
+        raise RuntimeError('database %s is not empty' % database.name)
+    rng = random.Random(seed)
+    schema.ensure_indexes(database)
+    schema.seed_roles(database)
+    start = datetime(2016, 1, 1)
+    password = encrypt_passowrd(PASSWORD)
+    names = ['user%05d' % i for i in range(users)]
+    edges = set()
+    for i, name in enumerate(names):
+        others = [other for other in names if other != name]
+        for followee in rng.sample(others, min(follows, len(others))):
+            edges.add((name, followee))
+    database.Follow.insert_many([{'follower': follower, 'followee': followee,
+                                  'timestamp': start + timedelta(minutes=n)}
+                                 for n, (follower, followee) in enumerate(sorted(edges))])
+    followers = dict((name, 0) for name in names)
+    for follower, followee in edges:
+        followers[followee] += 1
+    database.User.insert_many([{
+        'username': name, 'email': name + '@example.com', 'password': password, 'activate': True,
+        'role': 'User', 'name': name, 'location': '', 'about_me': _text(rng, 5),
+        'member_since': start, 'last_since': start, 'post_count': posts, 'follower_count': followers[name],
+        'following_count': min(follows, users - 1)} for name in names])
+    articles = []
+    for i in range(users * posts):
+        body = _text(rng, 30)
+        articles.append({'username': names[i % users], 'body': body, 'body_html': render_body(body),
+                         'body_html_version': POLICY_VERSION, 'comment_count': comments,
+                         'issuing_time': start + timedelta(minutes=i)})
+    for article, id in zip(articles, database.Aritical.insert_many(articles).inserted_ids):
+        article['_id'] = id
+    for user in database.User.find({}, {'username': True}):
+        database.Aritical.update_many({'username': user['username']}, {'$set': {'user_id': str(user['_id'])}})
+    batch = []
+    for article in articles:
+        for n in range(comments):
+            batch.append({'post_id': article['_id'], 'username': rng.choice(names), 'body': _text(rng, 8),
+                          'created_at': article['issuing_time'] + timedelta(seconds=n + 1)})
+        if len(batch) >= 1000:
+            database.Comment.insert_many(batch)
+            batch = []
+    if batch:
+        database.Comment.insert_many(batch)
+    for name in names:
+        timeline.rebuild(name)
+    return {'users': users, 'posts': posts, 'follows': follows, 'comments': comments, 'seed': seed}
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts commands sent to MongoDB; only sees clients created after it is registered."""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def started(self, event):
+        with self.lock:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class TestClientDriver:
+    def __init__(self, app):
+        self.app = app
+
+    def session(self):
+        return self.app.test_client()
+
+    def request(self, session, method, path, data=None):
+        response = session.open(path, method=method, data=data)
+        # Streamed pages render while the body is read, so read all of it.
+        response.get_data()
+        response.close()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class WSGIServerDriver:
+    """Drives the app through a real local HTTP server on an ephemeral port."""
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server, WSGIRequestHandler
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+        self.base = 'http://127.0.0.1:%d' % self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def session(self):
+        return build_opener(HTTPCookieProcessor(CookieJar()), _NoRedirect())
+
+    def request(self, session, method, path, data=None):
+        body = urlencode(data).encode('utf-8') if data is not None else None
+        try:
+            response = session.open(self.base + path, data=body)
+            response.read()
+            return response.status
+        except HTTPError as e:
+            return e.code
+
+    def close(self):
+        self.server.shutdown()
+
+
+drivers = {
+    'client': TestClientDriver,
+    'wsgi': WSGIServerDriver
+}
+
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(int(math.ceil(percent / 100.0 * len(ordered))) - 1, 0)]
+
+
+def _summary(latencies, errors, ops):
+    total = sum(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / total if total else None,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p95_ms': _percentile(latencies, 95) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+        'mongo_ops_per_request': float(ops) / len(latencies) if ops is not None else None
+    }
+
+
+def run(app, scale, requests=200, scenarios=None, driver='client', counter=None):
+    """Run every scenario `requests` times against a database seeded with `scale`."""
+    rng = random.Random(scale['seed'])
+    names = ['user%05d' % i for i in range(scale['users'])]
+    with app.app_context():
+        post_ids = [str(article['_id']) for article in
+                    db.database.Aritical.find({}, {'_id': True}).sort('issuing_time', ASCENDING)]
+    driver = drivers[driver](app)
+    me = driver.session()
+    driver.request(me, 'POST', '/auth/login', {'email': names[0] + '@example.com', 'password': PASSWORD})
+
+    def login():
+        return driver.request(driver.session(), 'POST', '/auth/login',
+                              {'email': rng.choice(names) + '@example.com', 'password': PASSWORD})
+
+    actions = {
+        'login': login,
+        'index_all': lambda: driver.request(me, 'GET', '/'),
+        'index_followed': lambda: driver.request(me, 'GET', '/'),
+        'user': lambda: driver.request(me, 'GET', '/user/' + rng.choice(names)),
+        'post': lambda: driver.request(me, 'GET', '/post/' + rng.choice(post_ids)),
+        'followers': lambda: driver.request(me, 'GET', '/followers/' + rng.choice(names)),
+        'follow': lambda: driver.request(me, 'GET', '/follow/' + rng.choice(names[1:])),
+        'comment': lambda: driver.request(me, 'POST', '/post/' + rng.choice(post_ids),
+                                          {'body': _text(rng, 8)}),
+    }
+    results = {}
+    try:
+        for name in scenarios or SCENARIOS:
+            # The feed mode is a cookie set by these two views.
+            if name == 'index_followed':
+                driver.request(me, 'GET', '/followed')
+            elif name == 'index_all':
+                driver.request(me, 'GET', '/all')
+            latencies, errors = [], 0
+            ops = counter.count if counter is not None else None
+            for i in range(requests):
+                started = time.time()
+                status = actions[name]()
+                latencies.append(time.time() - started)
+                if status >= 400:
+                    errors += 1
+            if ops is not None:
+                ops = counter.count - ops
+            results[name] = _summary(latencies, errors, ops)
+    finally:
+        driver.close()
+    return {'scale': scale, 'requests': requests, 'driver': driver.__class__.__name__,
+            'mongo_uri': app.config['MONGO_URI'].split('@')[-1], 'python': platform.python_version(),
+            'results': results}
+
+
+def save(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def compare(old, new):
+    """Lines describing how each metric of `new` moved relative to `old`."""
+    lines = []
+    for name in sorted(new['results']):
+        before = old['results'].get(name)
+        if before is None:
+            continue
+        for metric in ('throughput', 'p50_ms', 'p95_ms', 'p99_ms', 'mongo_ops_per_request'):
+            a, b = before.get(metric), new['results'][name].get(metric)
+            if a is None or b is None:
+                continue
+            change = (b - a) / a * 100 if a else 0.0
+            lines.append('%-15s %-22s %10.2f -> %10.2f (%+.1f%%)' % (name, metric, a, b, change))
+    return lines
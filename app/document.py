@@ -0,0 +1,56 @@
+from abc import ABCMeta, abstractmethod
+from .exceptions import ConcurrentModification
+
+
+class Document(metaclass=ABCMeta):
+    """A Mongo document loaded into slots, written back as one versioned `$set`.
+
+    Subclasses list their attributes in `__slots__`, map each one to a
+    document key in `fields` and return their store from repository().
+    Assigning to a mapped attribute records the change; save() sends every
+    recorded change in a single update that only matches while the stored
+    `version` is the one that was loaded, so two editors of the same
+    document cannot silently overwrite each other.
+    """
+
+    __slots__ = ('id', 'version', '_changes')
+    fields = {}
+
+    def __init__(self, document):
+        _setattr = object.__setattr__
+        _setattr(self, 'id', str(document.get('_id')))
+        # Documents written before versioning have no field; {'version': None}
+        # still matches them and $inc starts them at 1.
+        _setattr(self, 'version', document.get('version'))
+        _setattr(self, '_changes', {})
+        for attribute, key in self.fields.items():
+            _setattr(self, attribute, document.get(key))
+
+    def __setattr__(self, name, value):
+        key = self.fields.get(name)
+        if key is not None and getattr(self, name) != value:
+            self._changes[key] = value
+        object.__setattr__(self, name, value)
+
+    @abstractmethod
+    def repository(self):
+        """The Repository that save() writes through."""
+
+    @property
+    def changes(self):
+        return dict(self._changes)
+
+    def save(self):
+        """Write pending changes; returns False when there were none.
+
+        Raises ConcurrentModification if the document changed since it was
+        loaded; the pending changes are kept so the caller can reload.
+        """
+        if not self._changes:
+            return False
+        result = self.repository().save(self.id, self.version, self._changes)
+        if not result.matched_count:
+            raise ConcurrentModification('%s %s was modified concurrently' % (self.__class__.__name__, self.id))
+        object.__setattr__(self, 'version', (self.version or 0) + 1)
+        self._changes.clear()
+        return True
@@ -1,31 +1,275 @@
 # coding=utf-8
-from threading import Thread
-from flask import current_app, render_template
+import atexit
+import os
+import threading
+import time
+import queue
+from flask import render_template, request, has_request_context
 from flask_mail import Message
+from werkzeug.local import LocalProxy
 from . import mail
 import io
 import sys
 
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+if (getattr(sys.stdout, 'encoding', None) or '').lower() != 'utf-8' and hasattr(sys.stdout, 'buffer'):
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
 
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+class MailQueueFull(Exception):
+    pass
+
+
+class SMTPBackend:
+    def __init__(self, app):
+        self.app = app
+
+    def open(self):
+        return _SMTPConnection(mail.connect())
+
+
+class _SMTPConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.connection.__enter__()
+
+    def send(self, msg):
+        self.connection.send(msg)
+
+    def close(self):
+        self.connection.__exit__(None, None, None)
+
+
+class MemoryBackend:
+    def __init__(self, app):
+        self.outbox = []
+        self.lock = threading.Lock()
+
+    def open(self):
+        return self
+
+    def send(self, msg):
+        with self.lock:
+            self.outbox.append(msg)
+
+    def close(self):
+        pass
+
+
+class FileBackend(MemoryBackend):
+    def __init__(self, app):
+        super(FileBackend, self).__init__(app)
+        self.path = app.config['MAIL_FILE_PATH']
+
+    def send(self, msg):
+        with self.lock:
+            with io.open(self.path, 'a', encoding='utf-8') as f:
+                f.write(msg.as_string() + '\n\n')
+
+
+backends = {
+    'smtp': SMTPBackend,
+    'memory': MemoryBackend,
+    'file': FileBackend
+}
+
+
+class MailQueue:
+    """Bounded queue of outgoing mail served by a small pool of worker threads.
+
+    Each worker keeps one backend connection open while there is work and
+    sends up to MAIL_BATCH_SIZE messages over it before checking the queue
+    again; failed messages are retried with exponential backoff.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = None
+        self._queue = None
+        self._workers = []
+        self._pid = None
+        self._exit_registered = False
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.enqueued = self.sent = self.failed = self.retried = self.rejected = 0
+        self.latency_total = self.latency_max = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MAIL_BACKEND', 'smtp')
+        app.config.setdefault('MAIL_FILE_PATH', 'mail.log')
+        app.config.setdefault('MAIL_QUEUE_SIZE', 1000)
+        app.config.setdefault('MAIL_WORKERS', 2)
+        app.config.setdefault('MAIL_BATCH_SIZE', 20)
+        app.config.setdefault('MAIL_ENQUEUE_TIMEOUT', 1.0)
+        app.config.setdefault('MAIL_IDLE_TIMEOUT', 5.0)
+        app.config.setdefault('MAIL_MAX_RETRIES', 3)
+        app.config.setdefault('MAIL_RETRY_BACKOFF', 0.5)
+        self.app = app
+        self.backend = backends[app.config['MAIL_BACKEND']](app)
+        # create_app() runs once per app (and per test); one hook per queue is enough.
+        if not self._exit_registered:
+            atexit.register(self.stop)
+            self._exit_registered = True
+
+    def put(self, job):
+        self._ensure_workers()
+        try:
+            self._queue.put(job, timeout=self.app.config['MAIL_ENQUEUE_TIMEOUT'])
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            raise MailQueueFull('mail queue is full')
+        with self._stats_lock:
+            self.enqueued += 1
+
+    def start(self):
+        self._ensure_workers()
+
+    def _ensure_workers(self):
+        # Queues and threads do not survive fork(); each process gets its own.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.app.config['MAIL_QUEUE_SIZE'])
+            self._workers = []
+            for i in range(self.app.config['MAIL_WORKERS']):
+                worker = threading.Thread(target=self._run, name='mail-worker-%d' % i)
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+            self._pid = os.getpid()
+
+    def _run(self):
+        with self.app.app_context():
+            self._work()
+
+    def _work(self):
+        connection = None
+        jobs = self._queue
+        while True:
+            try:
+                job = jobs.get(timeout=self.app.config['MAIL_IDLE_TIMEOUT'])
+            except queue.Empty:
+                connection = self._close(connection)
+                continue
+            if job is None:
+                self._close(connection)
+                jobs.task_done()
+                return
+            batch = [job]
+            while len(batch) < self.app.config['MAIL_BATCH_SIZE']:
+                try:
+                    job = jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    jobs.put(None)
+                    jobs.task_done()
+                    break
+                batch.append(job)
+            for job in batch:
+                connection = self._deliver(connection, job)
+                jobs.task_done()
+
+    def _deliver(self, connection, job):
+        try:
+            msg = job.render(self.app)
+        except Exception:
+            self.app.logger.exception('Could not render mail to %s', job.to)
+            with self._stats_lock:
+                self.failed += 1
+            return connection
+        for attempt in range(self.app.config['MAIL_MAX_RETRIES'] + 1):
+            try:
+                if connection is None:
+                    connection = self.backend.open()
+                connection.send(msg)
+            except Exception:
+                connection = self._close(connection)
+                if attempt == self.app.config['MAIL_MAX_RETRIES']:
+                    self.app.logger.exception('Giving up on mail to %s', job.to)
+                    with self._stats_lock:
+                        self.failed += 1
+                    return connection
+                with self._stats_lock:
+                    self.retried += 1
+                time.sleep(self.app.config['MAIL_RETRY_BACKOFF'] * 2 ** attempt)
+            else:
+                latency = time.time() - job.created
+                with self._stats_lock:
+                    self.sent += 1
+                    self.latency_total += latency
+                    self.latency_max = max(self.latency_max, latency)
+                return connection
+        return connection
+
+    def _close(self, connection):
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        return None
+
+    def join(self):
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def stop(self, timeout=5.0):
+        if self._pid != os.getpid():
+            return
+        for worker in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+        self._pid = None
+
+    def stats(self):
+        depth = self._queue.qsize() if self._pid == os.getpid() else 0
+        with self._stats_lock:
+            return {
+                'queue_depth': depth,
+                'enqueued': self.enqueued,
+                'sent': self.sent,
+                'failed': self.failed,
+                'retried': self.retried,
+                'rejected': self.rejected,
+                'latency_avg': self.latency_total / self.sent if self.sent else 0.0,
+                'latency_max': self.latency_max
+            }
+
+
+class MailJob:
+    def __init__(self, to, subject, template, url_root, kwargs):
+        self.to = to
+        self.subject = subject
+        self.template = template
+        self.url_root = url_root
+        self.kwargs = kwargs
+        self.created = time.time()
+
+    def render(self, app):
+        # Templates build _external links, so render inside a request context
+        # that points at the site the message was requested from.
+        with app.test_request_context(base_url=self.url_root):
+            msg = Message(app.config['FLASKY_MAIL_SUBJECT_PREFIX'] + 'sss ' + self.subject,
+                          sender=app.config['FLASKY_MAIL_SENDER'], recipients=[self.to])
+            msg.body = render_template(self.template + '.txt', **self.kwargs)
+            msg.html = render_template(self.template + '.html', **self.kwargs)
+        return msg
+
+
+mail_queue = MailQueue()
 
 
 def send_email(to, subject, template, **kwargs):
-    app = current_app._get_current_object()
-    msg = Message(app.config['FLASKY_MAIL_SUBJECT_PREFIX'] + 'sss ' + subject,
-                  sender=app.config['FLASKY_MAIL_SENDER'], recipients=[to])
-    s = render_template(template + '.txt', **kwargs)
-    s1 = render_template(template + '.html', **kwargs)
-    # s = s.decode('utf8')
-    # s1 = s1.decode('utf8')
-    s.encode('gbk')
-    s1.encode('gbk')
-    msg.body = s
-    msg.html = s1
-    thr = Thread(target=send_async_email, args=[app, msg])
-    thr.start()
-    return thr
+    url_root = request.url_root if has_request_context() else None
+    # A proxy such as current_user would resolve on the worker thread, to nobody.
+    kwargs = dict((key, value._get_current_object() if isinstance(value, LocalProxy) else value)
+                  for key, value in kwargs.items())
+    job = MailJob(to, subject, template, url_root, kwargs)
+    mail_queue.put(job)
+    return job
@@ -0,0 +1,6 @@
+class ValidationError(ValueError):
+    pass
+
+
+class ConcurrentModification(Exception):
+    pass
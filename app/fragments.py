@@ -0,0 +1,63 @@
+from flask import render_template
+from flask_login import current_user
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from .cache import LRUCache
+
+
+class FragmentCache:
+    """Rendered post cards and comments, shared by every viewer of the same class.
+
+    A post card depends on the post's version (bumped by edits), its
+    rendering policy, its comment count and whether the viewer is an
+    administrator, the author or anyone else; a comment only on whether
+    its delete link is shown. Entries are kept in an LRU of
+    FRAGMENT_CACHE_SIZE items.
+    """
+
+    def __init__(self, app=None):
+        self.cache = LRUCache()
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE_ENABLED', True)
+        app.config.setdefault('FRAGMENT_CACHE_SIZE', 4096)
+        app.config.setdefault('JINJA_BYTECODE_CACHE', True)
+        app.config.setdefault('JINJA_BYTECODE_CACHE_DIR', None)
+        self.app = app
+        self.cache.configure(app.config['FRAGMENT_CACHE_SIZE'])
+        app.jinja_env.globals.update(post_card=self.post_card, comment_item=self.comment_item)
+        if app.config['JINJA_BYTECODE_CACHE']:
+            # Compiled templates are shared on disk, so new worker processes skip the Jinja compiler.
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])
+
+    def viewer(self, post):
+        if current_user.is_administrator():
+            return 'admin'
+        if current_user.is_authenticated and current_user.id == post.get('user_id'):
+            return 'owner'
+        return 'anonymous'
+
+    def post_card(self, post):
+        viewer = self.viewer(post)
+        key = ('post', str(post.get('_id')), post.get('version') or 0, post.get('body_html_version'),
+               post.get('comment_count', 0), viewer)
+        return self._render(key, '_post_card.html', post=post, viewer=viewer)
+
+    def comment_item(self, comment, post_id, deletable):
+        key = ('comment', str(comment.get('_id')), str(post_id), bool(deletable))
+        return self._render(key, '_comment.html', comment=comment, id=post_id, deletable=deletable)
+
+    def _render(self, key, template, **context):
+        if not self.app.config['FRAGMENT_CACHE_ENABLED']:
+            return Markup(render_template(template, **context))
+        html = self.cache.get(key)
+        if html is None:
+            html = Markup(render_template(template, **context))
+            self.cache.set(key, html)
+        return html
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,99 @@
+import atexit
+import os
+import threading
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from .cache import LRUCache
+
+
+class LastSeenBuffer:
+    """Coalesces last-seen timestamps and writes them with one bulk update.
+
+    A user is recorded at most once per LAST_SEEN_GRANULARITY seconds; the
+    pending timestamps are flushed every LAST_SEEN_FLUSH_INTERVAL seconds,
+    when LAST_SEEN_FLUSH_SIZE users are waiting, and at interpreter exit.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._recent = LRUCache()
+        self._thread = None
+        self._pid = None
+        self._exit_registered = False
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LAST_SEEN_GRANULARITY', 60)
+        app.config.setdefault('LAST_SEEN_FLUSH_INTERVAL', 10)
+        app.config.setdefault('LAST_SEEN_FLUSH_SIZE', 500)
+        self.app = app
+        self._recent.configure(app.config['USER_CACHE_SIZE'], app.config['LAST_SEEN_GRANULARITY'])
+        if not self._exit_registered:
+            atexit.register(self.flush)
+            self._exit_registered = True
+
+    def touch(self, user_id, when=None):
+        when = when or datetime.utcnow()
+        if self._recent.get(user_id) is not None:
+            return
+        self._recent.set(user_id, when)
+        with self._lock:
+            self._pending[user_id] = when
+            full = len(self._pending) >= self.app.config['LAST_SEEN_FLUSH_SIZE']
+        if full or not self.app.config['LAST_SEEN_FLUSH_INTERVAL']:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def latest(self, user_id, stored):
+        with self._lock:
+            pending = self._pending.get(user_id)
+        if pending is not None and (stored is None or pending > stored):
+            return pending
+        return stored
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self.app is None:
+            return
+        from . import db
+        ops = [UpdateOne({'_id': ObjectId(user_id)}, {'$max': {'last_since': when}})
+               for user_id, when in pending.items()]
+        try:
+            db.get_database(self.app).User.bulk_write(ops, ordered=False)
+        except Exception:
+            self.app.logger.exception('Failed to flush %d last-seen updates', len(ops))
+            with self._lock:
+                for user_id, when in pending.items():
+                    self._pending.setdefault(user_id, when)
+
+    def start(self):
+        if self.app.config['LAST_SEEN_FLUSH_INTERVAL']:
+            self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        # The flusher thread does not survive fork(); start one per process.
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='last-seen-flusher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.app.config['LAST_SEEN_FLUSH_INTERVAL']):
+            self.flush()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
@@ -1,5 +1,8 @@
-from flask import render_template
+from flask import render_template, flash, redirect, request
 from . import main
+from ..email import MailQueueFull
+from ..exceptions import ConcurrentModification
+from ..passwords import PasswordHasherBusy
 
 
 @main.app_errorhandler(403)
@@ -15,3 +18,19 @@ def page_not_found(e):
 @main.app_errorhandler(500)
 def internal_server_error(e):
     return render_template('500.html'), 500
+
+
+@main.app_errorhandler(MailQueueFull)
+def mail_queue_full(e):
+    return render_template('500.html'), 503
+
+
+@main.app_errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    return render_template('500.html'), 503
+
+
+@main.app_errorhandler(ConcurrentModification)
+def concurrent_modification(e):
+    flash('This was changed by someone else in the meantime; please review it and try again.')
+    return redirect(request.url)
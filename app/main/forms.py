@@ -1,7 +1,7 @@
 from flask_wtf import Form
 from wtforms import StringField, SubmitField, TextAreaField, SelectField, BooleanField
 from ..auth.forms import Province_choice
-from pymongo import MongoClient
+from .. import db
 from wtforms import ValidationError
 from wtforms.validators import Required, Length, Email, Regexp, EqualTo
 from flask_pagedown.fields import PageDownField
@@ -33,15 +33,15 @@ class EditProfileAdminForm(Form):
         self.user = user
 
     def validate_email(self, field):
-        if field.data == self.user.username:
+        if field.data == self.user.email:
             return
-        if MongoClient().blog.User.find_one({'temp': field.data}):
+        if db.users.by_email(field.data):
             raise ValidationError('邮箱已被注册.')
 
     def validate_username(self, field):
         if field.data == self.user.username:
             return
-        if MongoClient().blog.User.find_one({'username': field.data}):
+        if db.users.by_username(field.data):
             raise ValidationError('用户名已被注册.')
 
 
@@ -1,232 +1,21 @@
-from flask import render_template, abort, flash, request, current_app, make_response
+from bson.objectid import ObjectId
+from flask import render_template, abort, flash, request, current_app, make_response, jsonify
 from . import main
-from pymongo import MongoClient, DESCENDING
-from ..models import Temp, Permission, Post, body_html
+from .. import db, timeline, search, last_seen, page_cache, query_monitor, renderer, roles, fragments, streaming, server
+from ..models import UserDocument, Permission, Post, body_html, user_cache
 from flask_login import login_required, current_user, redirect, url_for
 from .forms import EditProfileForm, EditProfileAdminForm, PostForm, EditPostForm, CommentForm
 from ..decorators import admin_required, permission_required
-from bson.objectid import ObjectId
+from ..pagination import Pagination
+from ..renderer import POLICY_VERSION
+from ..email import mail_queue
+from ..exceptions import ConcurrentModification
 from datetime import datetime
-
-
-class Paginate:
-    def __init__(self, page, show_follow):
-        if show_follow == 0:
-            posts = MongoClient().blog.Aritical.find().sort('issuing_time', DESCENDING)
-            self.total = posts.count()
-            self.posts = posts
-        if show_follow == 1:
-            self.posts = []
-            following = MongoClient().blog.User.find_one({'username': current_user.username}).get('following')
-            artical = MongoClient().blog.Aritical.find().sort('issuing_time', DESCENDING)
-            # following.append([current_user.username, 'date'])
-            for i in range(following.__len__()):
-                for x in range(artical.count()):
-                    if following[i][0] == artical[x].get('username'):
-                        self.posts.append(artical[x])
-                        self.posts.sort(key=lambda x: x.get('issuing_time'), reverse=True)
-            self.total = self.posts.__len__()
-        self.pages = int(self.total / 20)
-        if self.total % 20 != 0:
-            self.pages += 1
-        if page == 1:
-            self.has_prev = False
-        else:
-            self.has_prev = True
-        if page == self.pages:
-            self.has_next = False
-        else:
-            self.has_next = True
-        self.next_num = page + 1
-        self.page = page
-        self.per_page = 20
-        self.prev_num = page - 1
-        self.current_num = self.total - (20 * (page - 1))
-        if self.current_num > 20:
-            self.current_num = 20
-        self.item = []
-        for i in range(self.current_num):
-            self.item.append(self.posts[self.prev_num * 20 + i])
-
-    def iter_pages(self, left_edge=2, left_current=2,
-                   right_current=5, right_edge=2):
-        last = 0
-        for num in range(1, self.pages + 1):
-            if num <= left_edge or \
-                    (self.page - left_current - 1 < num < self.page + right_current) \
-                    or num > self.pages - right_edge:
-                if last + 1 != num:
-                    yield None
-                yield num
-                last = num
-
-
-class PaginateUser:
-    def __init__(self, page, username):
-        posts = MongoClient().blog.Aritical.find({'username': username}).sort('issuing_time', DESCENDING)
-        self.total = posts.count()
-        self.pages = int(self.total / 20)
-        if self.total % 20 != 0:
-            self.pages += 1
-        if page == 1:
-            self.has_prev = False
-        else:
-            self.has_prev = True
-        if page == self.pages:
-            self.has_next = False
-        else:
-            self.has_next = True
-        self.next_num = page + 1
-        self.page = page
-        self.per_page = 20
-        self.prev_num = page - 1
-        self.current_num = self.total - (20 * (page - 1))
-        if self.current_num > 20:
-            self.current_num = 20
-        self.item = []
-        for i in range(self.current_num):
-            self.item.append(posts[self.prev_num * 20 + i])
-
-    def iter_pages(self, left_edge=2, left_current=2,
-                   right_current=5, right_edge=2):
-        last = 0
-        for num in range(1, self.pages + 1):
-            if num <= left_edge or \
-                    (self.page - left_current - 1 < num < self.page + right_current) \
-                    or num > self.pages - right_edge:
-                if last + 1 != num:
-                    yield None
-                yield num
-                last = num
-
-
-class PaginateFollowers:
-    def __init__(self, page, username):
-        conn = MongoClient().blog.User.find_one({'username': username})
-        posts = conn.get('followers')
-        self.total = posts.__len__()
-        self.pages = int(self.total / 20)
-        if self.total % 20 != 0:
-            self.pages += 1
-        if page == 1:
-            self.has_prev = False
-        else:
-            self.has_prev = True
-        if page == self.pages:
-            self.has_next = False
-        else:
-            self.has_next = True
-        self.next_num = page + 1
-        self.page = page
-        self.per_page = 20
-        self.prev_num = page - 1
-        self.current_num = self.total - (20 * (page - 1))
-        if self.current_num > 20:
-            self.current_num = 20
-        self.item = []
-        for i in range(self.current_num):
-            self.item.append(
-                {'username': posts[self.prev_num * 20 + i][0], 'timestamp': posts[self.prev_num * 20 + i][1]})
-
-    def iter_pages(self, left_edge=2, left_current=2,
-                   right_current=5, right_edge=2):
-        last = 0
-        for num in range(1, self.pages + 1):
-            if num <= left_edge or \
-                    (self.page - left_current - 1 < num < self.page + right_current) \
-                    or num > self.pages - right_edge:
-                if last + 1 != num:
-                    yield None
-                yield num
-                last = num
-
-
-class PaginateFollowing:
-    def __init__(self, page, username):
-        posts = MongoClient().blog.User.find_one({'username': username}).get('following')
-        self.total = posts.__len__()
-        self.pages = int(self.total / 20)
-        if self.total % 20 != 0:
-            self.pages += 1
-        if page == 1:
-            self.has_prev = False
-        else:
-            self.has_prev = True
-        if page == self.pages:
-            self.has_next = False
-        else:
-            self.has_next = True
-        self.next_num = page + 1
-        self.page = page
-        self.per_page = 20
-        self.prev_num = page - 1
-        self.current_num = self.total - (20 * (page - 1))
-        if self.current_num > 20:
-            self.current_num = 20
-        self.item = []
-        for i in range(self.current_num):
-            self.item.append(
-                {'username': posts[self.prev_num * 20 + i][0], 'timestamp': posts[self.prev_num * 20 + i][1]})
-
-    def iter_pages(self, left_edge=2, left_current=2,
-                   right_current=5, right_edge=2):
-        last = 0
-        for num in range(1, self.pages + 1):
-            if num <= left_edge or \
-                    (self.page - left_current - 1 < num < self.page + right_current) \
-                    or num > self.pages - right_edge:
-                if last + 1 != num:
-                    yield None
-                yield num
-                last = num
-
-
-class PaginateComments:
-    def __init__(self, page, id):
-        posts = MongoClient().blog.Aritical.find_one({'_id': ObjectId(id)}).get('comments')
-        self.total = posts.__len__()
-        self.pages = int(self.total / 20)
-        if self.total % 20 != 0:
-            self.pages += 1
-        if page == -1:
-            self.page = self.pages
-        else:
-            self.page = page
-        if self.page == 1:
-            self.has_prev = False
-        else:
-            self.has_prev = True
-        if self.page == self.pages:
-            self.has_next = False
-        else:
-            self.has_next = True
-        self.next_num = self.page + 1
-        self.per_page = 20
-        self.prev_num = self.page - 1
-        self.current_num = self.total - (20 * (self.page - 1))
-        if self.current_num > 20:
-            self.current_num = 20
-        self.items = []
-        for i in range(self.current_num):
-            self.items.append(
-                {'body': posts[self.prev_num * 20 + i][0], 'username': posts[self.prev_num * 20 + i][1],
-                 'timestamp': posts[self.prev_num * 20 + i][2]})
-            self.items.reverse()
-
-    def iter_pages(self, left_edge=2, left_current=2,
-                   right_current=5, right_edge=2):
-        last = 0
-        for num in range(1, self.pages + 1):
-            if num <= left_edge or \
-                    (self.page - left_current - 1 < num < self.page + right_current) \
-                    or num > self.pages - right_edge:
-                if last + 1 != num:
-                    yield None
-                yield num
-                last = num
+import os
 
 
 @main.route('/', methods=['GET', 'POST'])
+@page_cache.cached('posts')
 def index():
     form = PostForm()
     if current_user.can(Permission.WRITE_ARTICLES) and \
@@ -234,36 +23,35 @@ def index():
         Post(body=form.body.data).new_article()
         return redirect(url_for('.index'))
     page = request.args.get('page', 1, type=int)
+    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
     show_followed = False
     if current_user.is_authenticated:
         show_followed = bool(request.cookies.get('show_followed', ''))
     if show_followed:
-        pagination = Paginate(page, 1)
+        total, posts = timeline.read(current_user.username, per_page * (page - 1), per_page)
+        pagination = Pagination(page, per_page, total, posts)
     else:
-        pagination = Paginate(page, 0)
-    posts = pagination.item
-    return render_template('index.html', form=form, posts=posts, pagination=pagination, show_followed=show_followed)
+        pagination = db.articles.paginate({}, page, per_page, request.args.get('cursor'), lazy=True)
+    posts = pagination.items
+    return streaming.render('index.html', form=form, posts=posts, pagination=pagination, show_followed=show_followed)
 
 
 @main.route('/user/<username>')
 @login_required
 def user(username):
-    user_temp = MongoClient().blog.User.find_one({'username': username})
+    user_temp = db.users.by_username(username)
     if user_temp is None:
         abort(404)
-    user = Temp(id=user_temp.get('_id'), username=user_temp.get('username'), email=user_temp.get('email'),
-                password=user_temp.get('password'), activate=user_temp.get('activate'), role=user_temp.get('role'),
-                name=user_temp.get('name'),
-                location=user_temp.get('location'), about_me=user_temp.get('about_me'),
-                last_since=user_temp.get('last_since'),
-                member_since=user_temp.get('member_since'))
+    user = UserDocument(user_temp)
+    user.last_since = last_seen.latest(user.id, user.last_since)
     page = request.args.get('page', 1, type=int)
-    pagination = PaginateUser(page, username)
-    posts = pagination.item
-    followers = user_temp.get('followers')
-    following = user_temp.get('following')
-    return render_template('user.html', user=user, posts=posts, pagination=pagination, followers=followers,
-                           following=following)
+    pagination = db.articles.paginate({'username': username}, page, current_app.config['FLASKY_POSTS_PER_PAGE'],
+                                      request.args.get('cursor'), lazy=True)
+    posts = pagination.items
+    followers = user_temp.get('follower_count', 0)
+    following = user_temp.get('following_count', 0)
+    return streaming.render('user.html', user=user, posts=posts, pagination=pagination, followers=followers,
+                            following=following, post_count=user_temp.get('post_count', 0))
 
 
 @main.route('/edit_profile', methods=['GET', 'POST'])
@@ -271,12 +59,10 @@ def user(username):
 def edit_profile():
     form = EditProfileForm()
     if form.validate_on_submit():
-        MongoClient().blog.User.update({'email': current_user.email}, {'$set': {'name': form.name.data}})
-        MongoClient().blog.User.update({'email': current_user.email}, {'$set': {'location': form.location.data}})
-        MongoClient().blog.User.update({'email': current_user.email}, {'$set': {'about_me': form.about_me.data}})
         current_user.name = form.name.data
         current_user.location = form.location.data
         current_user.about_me = form.about_me.data
+        current_user.save()
         flash('更改已保存')
     form.name.data = current_user.name
     form.location.data = current_user.location
@@ -288,30 +74,27 @@ def edit_profile():
 @login_required
 @admin_required
 def edit_profile_admin(id):
-    user = MongoClient().blog.User.find_one({'_id': ObjectId(id)})
-    if user is None:
+    user_temp = UserDocument.get(id)
+    if user_temp is None:
         return abort(404)
-    user_temp = Temp(id=user.get('_id'), username=user.get('username'), email=user.get('email'),
-                     password=user.get('password'), activate=user.get('activate'), role=user.get('role'),
-                     name=user.get('name'),
-                     location=user.get('location'), about_me=user.get('about_me'),
-                     last_since=user.get('last_since'),
-                     member_since=user.get('member_since'))
     form = EditProfileAdminForm(user=user_temp)
     if form.validate_on_submit():
-        MongoClient().blog.User.update({'email': user_temp.email}, {'$set': {'name': form.name.data}})
-        MongoClient().blog.User.update({'email': user_temp.email}, {'$set': {'username': form.username.data}})
-        MongoClient().blog.User.update({'email': user_temp.email}, {'$set': {'email': form.email.data}})
-        MongoClient().blog.User.update({'email': user_temp.email}, {'$set': {'activate': form.activate.data}})
-        MongoClient().blog.User.update({'email': user_temp.email}, {'$set': {'role': form.role.data}})
-        MongoClient().blog.User.update({'email': user_temp.email}, {'$set': {'location': form.location.data}})
-        MongoClient().blog.User.update({'email': user_temp.email}, {'$set': {'about_me': form.about_me.data}})
+        username = user_temp.username
+        user_temp.name = form.name.data
+        user_temp.username = form.username.data
+        user_temp.email = form.email.data
+        user_temp.activate = form.activate.data
+        user_temp.role_name = form.role.data
+        user_temp.location = form.location.data
+        user_temp.about_me = form.about_me.data
+        user_temp.save()
+        page_cache.bump('user:' + username, 'user:' + user_temp.username)
         flash('The profile has been updated.')
         return redirect(url_for('.user', username=user_temp.username))
     form.email.data = user_temp.email
     form.username.data = user_temp.username
     form.activate.data = user_temp.activate
-    form.role.data = user_temp.role.name
+    form.role.data = user_temp.role_name
     form.name.data = user_temp.name
     form.location.data = user_temp.location
     form.about_me.data = user_temp.about_me
@@ -319,35 +102,57 @@ def edit_profile_admin(id):
 
 
 @main.route('/post/<id>', methods=['GET', 'POST'])
+@page_cache.cached('post:{id}')
 def post(id):
-    post = MongoClient().blog.Aritical.find({'_id': ObjectId(id)})
+    post = db.articles.get(id)
+    if post is None:
+        abort(404)
     form = CommentForm()
     if form.validate_on_submit():
-        comments = post[0].get('comments')
-        body = form.body.data
-        comments.append([body, current_user.username, datetime.utcnow()])
-        MongoClient().blog.Aritical.update({'_id': ObjectId(id)}, {'$set': {'comments': comments}})
+        db.comments.add(id, current_user.username, form.body.data, datetime.utcnow())
+        db.articles.increment(id, 'comment_count')
+        page_cache.bump('posts', 'post:' + id)
         flash('评论发布成功.')
         return redirect(url_for('.post', id=id, page=-1))
     page = request.args.get('page', 1, type=int)
-    pagination = PaginateComments(page, id)
+    pagination = db.comments.paginate(id, page, current_app.config['FLASKY_COMMENTS_PER_PAGE'],
+                                      request.args.get('cursor'), lazy=True)
     comments = pagination.items
-    comment = (post[0].get('username') != current_user.username)
-    return render_template('post.html', posts=post, form=form, i=0,
-                           comments=comments, pagination=pagination, author=comment, id=id)
+    comment = current_user.is_authenticated and post.get('username') != current_user.username
+    deletable = current_user.is_authenticated and \
+        (post.get('username') == current_user.username or current_user.is_administrator())
+    return streaming.render('post.html', posts=[post], form=form, i=0, comments=comments,
+                            pagination=pagination, author=comment, deletable=deletable, id=id)
+
+
+@main.route('/search')
+def search_posts():
+    q = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
+    total, posts = search.search(q, page, per_page)
+    pagination = Pagination(page, per_page, total, posts)
+    return streaming.render('search.html', q=q, posts=posts, pagination=pagination)
 
 
 @main.route('/edit/<id>', methods=['GET', 'POST'])
 @login_required
 def edit(id):
-    post = MongoClient().blog.Aritical.find_one({'_id': ObjectId(id)})
+    post = db.articles.get(id)
+    if post is None:
+        abort(404)
     if current_user.id != post.get('user_id') and \
             not current_user.can(Permission.ADMINISTER):
         abort(403)
     form = EditPostForm()
     if form.validate_on_submit():
-        MongoClient().blog.Aritical.update({'_id': ObjectId(id)},
-                                           {'$set': {'body': form.body.data, 'body_html': body_html(form.body.data)}})
+        # The version bump retires the post's cached fragments.
+        if not db.articles.save(id, post.get('version'), {'body': form.body.data,
+                                                         'body_html': body_html(form.body.data),
+                                                         'body_html_version': POLICY_VERSION}).matched_count:
+            raise ConcurrentModification('post %s was modified concurrently' % id)
+        search.index(dict(post, body=form.body.data))
+        page_cache.bump('posts', 'post:' + id)
         flash('修改成功')
         return redirect(url_for('.post', id=post.get('_id')))
     form.body.data = post.get('body')
@@ -358,29 +163,17 @@ def edit(id):
 @login_required
 @permission_required(Permission.FOLLOW)
 def follow(username):
-    user = MongoClient().blog.User.find_one({'username': username})
+    user = db.users.by_username(username)
     if user is None:
         flash('此用户不存在.')
         return redirect(url_for('.index'))
-    very = False
-    temp = MongoClient().blog.User.find_one({'username': current_user.username}).get('following')
-    for i in range(temp.__len__()):
-        if temp[i][0] == username:
-            very = True
-            break
-    if very:
+    if not db.follows.follow(current_user.username, username, datetime.utcnow()):
         flash('您已经关注过了他，不能重复关注.')
         return redirect(url_for('.user', username=username))
-    followers = user.get('followers')
-    time = datetime.utcnow()
-    follow = [current_user.username, time]
-    followers.append(follow)
-    MongoClient().blog.User.update({'username': username}, {'$set': {'followers': followers}})
-    post2 = MongoClient().blog.User.find_one({'username': current_user.username})
-    following = post2.get('following')
-    follow = [user.get('username'), time]
-    following.append(follow)
-    MongoClient().blog.User.update({'username': current_user.username}, {'$set': {'following': following}})
+    db.users.increment(username, 'follower_count')
+    db.users.increment(current_user.username, 'following_count')
+    timeline.backfill(current_user.username, user)
+    page_cache.bump('user:' + username, 'user:' + current_user.username)
     flash('您成功关注了 %s.' % username)
     return redirect(url_for('.user', username=username))
 
@@ -389,59 +182,48 @@ def follow(username):
 @login_required
 @permission_required(Permission.FOLLOW)
 def unfollow(username):
-    user = MongoClient().blog.User.find_one({'username': username})
+    user = db.users.by_username(username)
     if user is None:
         flash('此用户不存在.')
         return redirect(url_for('.index'))
-    very = False
-    temp = MongoClient().blog.User.find_one({'username': current_user.username}).get('following')
-    for i in range(temp.__len__()):
-        if temp[i][0] == username:
-            very = True
-            break
-    if not very:
+    if not db.follows.unfollow(current_user.username, username):
         flash('您没有关注这个用户.')
         return redirect(url_for('.user', username=username))
-    followers = user.get('followers')
-    for i in range(followers.__len__()):
-        if followers[i][0] == current_user.username:
-            followers.remove(followers[i])
-            break
-    MongoClient().blog.User.update({'username': username}, {'$set': {'followers': followers}})
-    post2 = MongoClient().blog.User.find_one({'username': current_user.username})
-    following = post2.get('following')
-    for i in range(following.__len__()):
-        if following[i][0] == username:
-            following.remove(following[i])
-            break
-    MongoClient().blog.User.update({'username': current_user.username}, {'$set': {'following': following}})
+    db.users.increment(username, 'follower_count', -1)
+    db.users.increment(current_user.username, 'following_count', -1)
+    timeline.prune(current_user.username, username)
+    page_cache.bump('user:' + username, 'user:' + current_user.username)
     flash('您取消关注了 %s.' % username)
     return redirect(url_for('.user', username=username))
 
 
 @main.route('/followers/<username>')
+@page_cache.cached('user:{username}')
 def followers(username):
-    user = MongoClient().blog.User.find_one({'username': username})
+    user = db.users.by_username(username)
     if user is None:
         flash('此用户不存在.')
         return redirect(url_for('.index'))
     page = request.args.get('page', 1, type=int)
-    pagination = PaginateFollowers(page=page, username=username)
-    follows = pagination.item
+    pagination = db.follows.followers(username, page, current_app.config['FLASKY_FOLLOWERS_PER_PAGE'],
+                                      request.args.get('cursor'))
+    follows = [{'username': edge.get('follower'), 'timestamp': edge.get('timestamp')} for edge in pagination.items]
     return render_template('followers.html', user=user, title="关注", title1='关注', title2='的人',
                            endpoint='.followers', pagination=pagination,
                            follows=follows)
 
 
 @main.route('/following/<username>')
+@page_cache.cached('user:{username}')
 def following(username):
-    user = MongoClient().blog.User.find_one({'username': username})
+    user = db.users.by_username(username)
     if user is None:
         flash('此用户不存在.')
         return redirect(url_for('.index'))
     page = request.args.get('page', 1, type=int)
-    pagination = PaginateFollowing(page=page, username=username)
-    follows = pagination.item
+    pagination = db.follows.following(username, page, current_app.config['FLASKY_FOLLOWERS_PER_PAGE'],
+                                      request.args.get('cursor'))
+    follows = [{'username': edge.get('followee'), 'timestamp': edge.get('timestamp')} for edge in pagination.items]
     return render_template('followers.html', user=user, title='关注的人', title1='', title2='关注的人',
                            endpoint='.following', pagination=pagination,
                            follows=follows)
@@ -466,15 +248,45 @@ def show_followed():
 @main.route('/delete/<id>')
 @login_required
 def delete(id):
-    user = MongoClient().blog.Aritical.find({'_id': ObjectId(id)})
-    if not current_user.username == user[0].get('username') and not current_user.is_administrator():
-        abort(304)
-    timedata = request.args.get('data')
-    comments = user[0].get('comments')
-    for i in range(comments.__len__()):
-        time = str(comments[i][2])
-        if time == timedata:
-            del comments[i]
-            break
-    MongoClient().blog.Aritical.update({'_id': ObjectId(id)}, {'$set': {'comments': comments}})
+    comment = request.args.get('comment')
+    if not ObjectId.is_valid(id) or not ObjectId.is_valid(comment):
+        abort(404)
+    user = db.articles.get(id)
+    if user is None:
+        abort(404)
+    if not current_user.username == user.get('username') and not current_user.is_administrator():
+        abort(403)
+    if db.comments.remove(id, comment):
+        db.articles.increment(id, 'comment_count', -1)
+        page_cache.bump('posts', 'post:' + id)
     return redirect(url_for('.post', id=id))
+
+
+@main.route('/ready')
+def ready():
+    # Load balancer probe: 503 while this worker drains or cannot reach Mongo.
+    try:
+        db.client.admin.command('ping')
+        mongo = True
+    except Exception:
+        mongo = False
+    draining = server.draining.is_set()
+    status = 200 if mongo and not draining else 503
+    return jsonify(ready=status == 200, mongo=mongo, draining=draining, pid=os.getpid()), status
+
+
+@main.route('/cache-stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify(users=user_cache.stats(), pages=page_cache.stats())
+
+
+@main.route('/metrics')
+@login_required
+@admin_required
+def metrics():
+    return jsonify(endpoints=query_monitor.stats(), users=user_cache.stats(), pages=page_cache.stats(),
+                   renderer=renderer.cache.stats(), search=search.results.stats(),
+                   search_terms=search.frequencies.stats(), mail=mail_queue.stats(),
+                   roles=roles.stats(), fragments=fragments.stats())
@@ -0,0 +1,189 @@
+import bisect
+import threading
+import time
+from collections import Counter
+from flask import request
+from pymongo import monitoring
+
+QUERY_BUCKETS = [1, 2, 5, 10, 20, 50, 100]
+MS_BUCKETS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+
+# Commands whose first argument is the collection name.
+_FILTERS = {'find': 'filter', 'count': 'query', 'distinct': 'query', 'findAndModify': 'query'}
+_LISTS = {'update': ('updates', 'q'), 'delete': ('deletes', 'q')}
+
+_local = threading.local()
+_registered = []
+
+
+def shape(value):
+    """A query with its values replaced by type names, so repeats can be recognised."""
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join('%s: %s' % (key, shape(value[key])) for key in sorted(value))
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join(sorted(set(shape(item) for item in value)))
+    return type(value).__name__
+
+
+def describe(command_name, command):
+    """(collection, query shape) for a command document."""
+    collection = command.get(command_name)
+    if command_name == 'getMore':
+        return command.get('collection'), ''
+    if command_name in _FILTERS:
+        return collection, shape(command.get(_FILTERS[command_name]) or {})
+    if command_name in _LISTS:
+        key, field = _LISTS[command_name]
+        return collection, shape([item.get(field) for item in command.get(key) or []])
+    if command_name == 'aggregate':
+        return collection, shape([stage for stage in command.get('pipeline') or []])
+    return collection if isinstance(collection, str) else None, ''
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        labels = ['le_%s' % bucket for bucket in self.buckets] + ['inf']
+        return {'buckets': dict(zip(labels, self.counts)), 'count': self.count, 'sum': round(self.sum, 3)}
+
+
+class RequestRecord:
+    def __init__(self):
+        self.started = time.time()
+        self.pending = {}
+        self.commands = []
+        self.endpoint = None
+        self.deferred = False
+
+    def start(self, event):
+        collection, query = describe(event.command_name, event.command)
+        self.pending[event.request_id] = (event.command_name, collection, query)
+
+    def finish(self, event, ok):
+        name, collection, query = self.pending.pop(event.request_id, (event.command_name, None, ''))
+        self.commands.append((name, collection, query, event.duration_micros / 1000.0, ok))
+
+    @property
+    def mongo_ms(self):
+        return sum(command[3] for command in self.commands)
+
+    def repeats(self, threshold):
+        shapes = Counter((name, collection, query) for name, collection, query, ms, ok in self.commands
+                         if name != 'getMore')
+        return [(key, count) for key, count in shapes.most_common() if count >= threshold]
+
+
+class QueryListener(monitoring.CommandListener):
+    """Attributes every command to the Flask request running on the same thread."""
+
+    def started(self, event):
+        record = getattr(_local, 'record', None)
+        if record is not None:
+            record.start(event)
+
+    def succeeded(self, event):
+        record = getattr(_local, 'record', None)
+        if record is not None:
+            record.finish(event, True)
+
+    def failed(self, event):
+        record = getattr(_local, 'record', None)
+        if record is not None:
+            record.finish(event, False)
+
+
+class QueryMonitor:
+    """Per-request Mongo command counts, per-endpoint histograms and N+1 warnings.
+
+    Requests issuing more than QUERY_BUDGET commands, or the same query
+    shape QUERY_REPEAT_THRESHOLD times, are logged as warnings. With
+    QUERY_DEBUG_HEADER the totals are sent back in X-Mongo-Queries.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_BUDGET', 25)
+        app.config.setdefault('QUERY_REPEAT_THRESHOLD', 5)
+        app.config.setdefault('QUERY_DEBUG_HEADER', app.debug)
+        self.app = app
+        # Listeners only reach clients created after registration; the Mongo
+        # extension connects lazily, so this runs before the first client.
+        if not _registered:
+            _registered.append(QueryListener())
+            monitoring.register(_registered[0])
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+
+    def current(self):
+        return getattr(_local, 'record', None)
+
+    def _before(self):
+        _local.record = RequestRecord()
+
+    def _after(self, response):
+        record = self.current()
+        if record is None:
+            return response
+        record.endpoint = request.endpoint or 'unknown'
+        if self.app.config['QUERY_DEBUG_HEADER']:
+            response.headers['X-Mongo-Queries'] = 'count=%d; time=%.2fms' % (len(record.commands), record.mongo_ms)
+        if response.is_streamed:
+            # Streamed templates keep querying while the body is sent; count
+            # those too by finishing the record at teardown.
+            record.deferred = True
+        else:
+            self._finish(record)
+        return response
+
+    def _teardown(self, exc):
+        record = self.current()
+        if record is not None and record.deferred:
+            self._finish(record)
+        _local.record = None
+
+    def _finish(self, record):
+        endpoint = record.endpoint
+        queries = len(record.commands)
+        self._observe(endpoint, queries, record.mongo_ms, (time.time() - record.started) * 1000)
+        config = self.app.config
+        if queries > config['QUERY_BUDGET']:
+            self.app.logger.warning('%s issued %d Mongo commands (budget %d)', endpoint, queries,
+                                    config['QUERY_BUDGET'])
+        for (name, collection, query), count in record.repeats(config['QUERY_REPEAT_THRESHOLD']):
+            self.app.logger.warning('%s repeated %s on %s %d times, possible N+1: %s', endpoint, name,
+                                    collection, count, query)
+
+    def _observe(self, endpoint, queries, mongo_ms, latency_ms):
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = {
+                    'queries': Histogram(QUERY_BUCKETS),
+                    'mongo_ms': Histogram(MS_BUCKETS),
+                    'latency_ms': Histogram(MS_BUCKETS)
+                }
+            stats['queries'].observe(queries)
+            stats['mongo_ms'].observe(mongo_ms)
+            stats['latency_ms'].observe(latency_ms)
+
+    def stats(self):
+        with self._lock:
+            return dict((endpoint, dict((name, histogram.to_dict()) for name, histogram in stats.items()))
+                        for endpoint, stats in self.endpoints.items())
@@ -0,0 +1,116 @@
+from pymongo import UpdateOne
+from . import db, schema, timeline
+
+
+def migrate_comments(batch_size=500):
+    """Move embedded Aritical.comments arrays into the Comment collection.
+
+    Safe to re-run: comments are upserted on (post_id, username, created_at)
+    and an article is only counted once, when its array is removed. The
+    counting stays here because main.post and main.delete only $inc
+    comment_count from now on; without it every migrated post would show
+    zero comments until a full reconcile_counters run.
+    """
+    schema.ensure_indexes(db.database, ['Comment'])
+    articles = db.articles.collection
+    comments = db.comments.collection
+    moved = 0
+    comment_ops, article_ops = [], []
+
+    def flush():
+        if comment_ops:
+            comments.bulk_write(comment_ops, ordered=False)
+        if article_ops:
+            articles.bulk_write(article_ops, ordered=False)
+        del comment_ops[:]
+        del article_ops[:]
+
+    for article in articles.find({'comments': {'$exists': True}}, {'comments': True}, batch_size=batch_size):
+        for body, username, created_at in article.get('comments') or []:
+            comment_ops.append(UpdateOne({'post_id': article['_id'], 'username': username, 'created_at': created_at},
+                                         {'$setOnInsert': {'body': body}}, upsert=True))
+        article_ops.append(UpdateOne({'_id': article['_id'], 'comments': {'$exists': True}},
+                                     {'$unset': {'comments': ''},
+                                      '$inc': {'comment_count': len(article.get('comments') or [])}}))
+        moved += len(article.get('comments') or [])
+        if len(comment_ops) >= batch_size or len(article_ops) >= batch_size:
+            flush()
+    flush()
+    return moved
+
+
+def _group_counts(collection, field):
+    pipeline = [{'$group': {'_id': '$' + field, 'count': {'$sum': 1}}}]
+    return dict((row['_id'], row['count']) for row in collection.aggregate(pipeline, allowDiskUse=True))
+
+
+def _reconcile(collection, key, counter, counts, batch_size):
+    fixed = 0
+    ops = []
+    for document in collection.find({}, {key: True, counter: True}, batch_size=batch_size):
+        expected = counts.get(document.get(key), 0)
+        if document.get(counter) != expected:
+            ops.append(UpdateOne({'_id': document['_id']}, {'$set': {counter: expected}}))
+        if len(ops) >= batch_size:
+            fixed += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        fixed += collection.bulk_write(ops, ordered=False).modified_count
+    return fixed
+
+
+def recount_follows(batch_size=500):
+    follows = db.follows.collection
+    users = db.users.collection
+    return {
+        'follower_count': _reconcile(users, 'username', 'follower_count',
+                                     _group_counts(follows, 'followee'), batch_size),
+        'following_count': _reconcile(users, 'username', 'following_count',
+                                      _group_counts(follows, 'follower'), batch_size)
+    }
+
+
+def reconcile_counters(batch_size=500):
+    """Recompute every denormalized counter and fix the documents that drifted.
+
+    Returns the number of documents corrected per counter. Increments that
+    land while the command runs can be overwritten, so run it off-peak.
+    """
+    fixed = recount_follows(batch_size)
+    fixed['post_count'] = _reconcile(db.users.collection, 'username', 'post_count',
+                                     _group_counts(db.articles.collection, 'username'), batch_size)
+    fixed['comment_count'] = _reconcile(db.articles.collection, '_id', 'comment_count',
+                                        _group_counts(db.comments.collection, 'post_id'), batch_size)
+    return fixed
+
+
+def migrate_follows(batch_size=500):
+    """Copy the embedded User.following arrays into Follow edges.
+
+    Edges are upserted, so re-running is harmless; the arrays are dropped
+    and both counters are recomputed from the edges at the end. Fan-out only
+    reaches existing Timeline documents, so every migrated follower's
+    timeline is then rebuilt from the edges.
+    """
+    schema.ensure_indexes(db.database, ['Follow'])
+    users = db.users.collection
+    follows = db.follows.collection
+    ops = []
+    followers = set()
+    for user in users.find({'following': {'$exists': True}}, {'username': True, 'following': True},
+                           batch_size=batch_size):
+        followers.add(user['username'])
+        for followee, timestamp in user.get('following') or []:
+            ops.append(UpdateOne({'follower': user['username'], 'followee': followee},
+                                 {'$setOnInsert': {'timestamp': timestamp}}, upsert=True))
+        if len(ops) >= batch_size:
+            follows.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        follows.bulk_write(ops, ordered=False)
+    users.update_many({}, {'$unset': {'followers': '', 'following': ''}})
+    # Large accounts are told apart by follower_count, so rebuild after the recount.
+    recount_follows(batch_size)
+    for username in followers:
+        timeline.rebuild(username)
+    return follows.estimated_document_count()
@@ -1,13 +1,12 @@
-from werkzeug.security import generate_password_hash, check_password_hash
-from . import login_manager
-from flask_login import UserMixin, AnonymousUserMixin, redirect, url_for, current_user
-from pymongo import MongoClient
-from bson.objectid import ObjectId
+from . import login_manager, db, timeline, search, last_seen, renderer, page_cache, password_hasher, roles
+from .cache import LRUCache
+from .document import Document
+from .roles import Permission, Role
+from .renderer import POLICY_VERSION
+from flask_login import AnonymousUserMixin, redirect, url_for, current_user
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from flask import current_app
+from flask import current_app, _request_ctx_stack
 from datetime import datetime
-from markdown import markdown
-import bleach
 
 
 def generate_reset_password_confirmation_token(email, expiration=3600):
@@ -21,46 +20,44 @@ def generate_change_email_confirmation_token(email, expiration=3600):
 
 
 def encrypt_passowrd(password):
-    return generate_password_hash(password)
+    return password_hasher.hash(password)
 
 
 def verify_password(user_password, password):
-    return check_password_hash(user_password, password)
+    return password_hasher.verify(user_password, password)
 
 
-@login_manager.user_loader
-def load_user(user_id):
-    user = MongoClient().blog.User.find_one({'_id': ObjectId(user_id)})
-    return Temp(id=user.get('_id'), username=user.get('username'), email=user.get('email'),
-                password=user.get('password'), activate=user.get('activate'), role=user.get('role'),
-                name=user.get('name'),
-                location=user.get('location'), about_me=user.get('about_me'), last_since=user.get('last_since'),
-                member_since=user.get('member_since'))
-
-
-class Permission:
-    FOLLOW = 0x01
-    COMMENT = 0x02
-    WRITE_ARTICLES = 0x04
-    MODERATE_COMMENTS = 0x08
-    ADMINISTER = 0x80
+user_cache = LRUCache()
 
 
-class Role:
-    db = MongoClient().blog.Role
-
-    def __init__(self, name, permission, default):
-        self.name = name
-        self.permission = permission
-        self.default = default
-
-    def new_role(self):
-        collection = {
-            'name': self.name,
-            'permission': self.permission,
-            'default': self.default
-        }
-        self.db.insert(collection)
+@login_manager.user_loader
+def load_user(user_id):
+    # Session users are memoized for the request and cached per process as
+    # documents; invalidate_user() drops them after a write.
+    users = _session_users()
+    if user_id not in users:
+        user = user_cache.get(user_id)
+        if user is None:
+            user = db.users.get(user_id)
+            if user is None:
+                return None
+            user_cache.set(user_id, user)
+        users[user_id] = UserDocument(user)
+    return users[user_id]
+
+
+def _session_users():
+    ctx = _request_ctx_stack.top
+    if ctx is None:
+        return {}
+    if not hasattr(ctx, 'session_users'):
+        ctx.session_users = {}
+    return ctx.session_users
+
+
+def invalidate_user(user_id):
+    user_cache.invalidate(str(user_id))
+    _session_users().pop(str(user_id), None)
 
 
 class User:
@@ -68,15 +65,14 @@ class User:
         self.username = username
         self.email = email
         self.password_hash = encrypt_passowrd(password)
-        self.db = MongoClient().blog.User
         self.name = name
         self.location = location
         self.about_me = about_me
-        conn = MongoClient().blog.Role
         if self.email == current_app.config['FLASKY_ADMIN']:
-            self.role = conn.find_one({'permissions': 0xff}).get('name')
+            self.role = 'Administrator'
         else:
-            self.role = conn.find_one({'default': True}).get('name')
+            self.role = roles.default().name
+        self.document = None
 
     def new_user(self):
         collection = {
@@ -90,47 +86,87 @@ class User:
             'about_me': self.about_me,
             'member_since': datetime.utcnow(),
             'last_since': datetime.utcnow(),
-            'followers': [],
-            'following': []
+            'post_count': 0,
+            'follower_count': 0,
+            'following_count': 0
         }
-        self.db.insert(collection)
+        collection['_id'] = db.users.create(collection)
+        self.document = collection
+        return collection['_id']
 
     def __repr__(self):
         return self.username
 
 
-class Temp(UserMixin):
+class UserDocument(Document):
+    """The logged-in (or viewed) user; profile edits go through save()."""
+
+    __slots__ = ('username', 'email', 'email_temp', 'password_hash', 'activate', 'role_name', 'name', 'location',
+                 'about_me', 'last_since', 'member_since')
+    fields = {
+        'username': 'username',
+        'email': 'email',
+        'email_temp': 'email_temp',
+        'password_hash': 'password',
+        'activate': 'activate',
+        'role_name': 'role',
+        'name': 'name',
+        'location': 'location',
+        'about_me': 'about_me',
+        'last_since': 'last_since',
+        'member_since': 'member_since'
+    }
+    is_authenticated = True
     is_active = True
     is_anonymous = False
-    is_authenticated = True
-    email = ''
-    username = ''
 
-    def __init__(self, id, username, email, password, activate, role, name, location, about_me, last_since,
-                 member_since):
-        self.id = str(id)
-        self.username = username
-        self.email = email
-        self.password_hash = password
-        self.activate = activate
-        self.name = name
-        self.location = location
-        self.about_me = about_me
-        self.last_since = last_since
-        self.member_since = member_since
-        conn = MongoClient().blog.Role.find_one({'name': role})
-        self.role = Role(name=role, permission=conn.get('permissions'), default=conn.get('default'))
+    @classmethod
+    def get(cls, id):
+        document = db.users.get(id)
+        return cls(document) if document is not None else None
+
+    @classmethod
+    def by_email(cls, email):
+        document = db.users.by_email(email)
+        return cls(document) if document is not None else None
+
+    def repository(self):
+        return db.users
+
+    def save(self):
+        # Drop cached copies whether the write landed or lost a race, so the
+        # next request reloads the stored document and its version.
+        try:
+            return super(UserDocument, self).save()
+        finally:
+            invalidate_user(self.id)
+
+    @property
+    def role(self):
+        return roles.get(self.role_name)
 
     def get_id(self):
         return self.id
 
+    def __eq__(self, other):
+        if isinstance(other, UserDocument):
+            return self.id == other.id
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(self.id)
+
     def generate_confirmation_token(self, expiration=3600):
         s = Serializer(current_app.config['SECRET_KEY'], expiration)
         return s.dumps({'confirm': self.id})
 
     def can(self, permission):
-        return self.role is not None and \
-               (self.role.permission & permission) == permission
+        role = roles.get(self.role_name)
+        return role is not None and role.can(permission)
 
     def is_administrator(self):
         return self.can(Permission.ADMINISTER)
@@ -139,14 +175,10 @@ class Temp(UserMixin):
         return self.username
 
     def ping(self):
-        MongoClient().blog.User.update({'temp': self.email}, {'$set': {'last_since': datetime.utcnow()}})
+        last_seen.touch(self.id)
 
     def is_following(self, user):
-        temp = MongoClient().blog.User.find_one({'username': self.username}).get('following')
-        for i in range(temp.__len__()):
-            if temp[i][0] == user.username:
-                return True
-        return False
+        return db.follows.is_following(self.username, user.username)
 
 
 class AnonymousUser(AnonymousUserMixin):
@@ -173,17 +205,18 @@ class Post:
             'body': self.body,
             'issuing_time': datetime.utcnow(),
             'body_html': self.body_html,
-            'comments': []
+            'body_html_version': POLICY_VERSION,
+            'comment_count': 0
         }
-        MongoClient().blog.Aritical.insert(collection)
+        collection['_id'] = db.articles.create(collection)
+        timeline.fan_out(db.users.increment_and_get(current_user.username, 'post_count'), collection)
+        search.index(collection)
+        page_cache.bump('posts', 'user:' + current_user.username)
+        return collection['_id']
 
 
 def body_html(body):
-    allowed_tags = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
-                    'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
-                    'h1', 'h2', 'h3', 'p']
-    return bleach.linkify(bleach.clean(markdown(body, output_format='html'),
-                                       tags=allowed_tags, strip=True))
+    return renderer.render(body)
 
 # class PostTemp:
 #     def __init__(self, user_id):
@@ -0,0 +1,116 @@
+import os
+import threading
+from flask import current_app
+from pymongo import MongoClient
+from .repositories import UserRepository, RoleRepository, ArticleRepository, TimelineRepository, \
+    CommentRepository, FollowRepository
+
+
+class _MongoState:
+    def __init__(self, config):
+        self.uri = config['MONGO_URI']
+        self.dbname = config['MONGO_DBNAME']
+        self.options = {
+            'maxPoolSize': config['MONGO_MAX_POOL_SIZE'],
+            'minPoolSize': config['MONGO_MIN_POOL_SIZE'],
+            'connectTimeoutMS': config['MONGO_CONNECT_TIMEOUT_MS'],
+            'socketTimeoutMS': config['MONGO_SOCKET_TIMEOUT_MS'],
+            'serverSelectionTimeoutMS': config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+            'waitQueueTimeoutMS': config['MONGO_WAIT_QUEUE_TIMEOUT_MS'],
+        }
+        self.options.update(config['MONGO_WRITE_CONCERN'])
+        self.client = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def get_client(self):
+        # A client must never be shared across fork(): every worker process
+        # builds its own pool the first time it talks to the database.
+        pid = os.getpid()
+        if self.client is None or self.pid != pid:
+            with self.lock:
+                if self.client is None or self.pid != pid:
+                    self.client = self._connect()
+                    self.pid = pid
+        return self.client
+
+    def _connect(self):
+        if self.uri.startswith('mongomock://'):
+            # In-memory stand-in for tests and benchmarks; optional dependency.
+            import mongomock
+            return mongomock.MongoClient()
+        return MongoClient(self.uri, connect=False, **self.options)
+
+    def close(self):
+        with self.lock:
+            if self.client is not None and self.pid == os.getpid():
+                self.client.close()
+            self.client = None
+            self.pid = None
+
+
+class Mongo:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MONGO_URI', 'mongodb://localhost:27017/')
+        app.config.setdefault('MONGO_DBNAME', 'blog')
+        app.config.setdefault('MONGO_MAX_POOL_SIZE', 100)
+        app.config.setdefault('MONGO_MIN_POOL_SIZE', 0)
+        app.config.setdefault('MONGO_CONNECT_TIMEOUT_MS', 20000)
+        app.config.setdefault('MONGO_SOCKET_TIMEOUT_MS', None)
+        app.config.setdefault('MONGO_SERVER_SELECTION_TIMEOUT_MS', 30000)
+        app.config.setdefault('MONGO_WAIT_QUEUE_TIMEOUT_MS', None)
+        app.config.setdefault('MONGO_WRITE_CONCERN', {'w': 1})
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+        app.extensions['mongo'] = _MongoState(app.config)
+
+    def _state(self, app=None):
+        if app is None:
+            app = current_app
+        return app.extensions['mongo']
+
+    def get_client(self, app=None):
+        return self._state(app).get_client()
+
+    def get_database(self, app=None):
+        state = self._state(app)
+        return state.get_client()[state.dbname]
+
+    def close(self, app=None):
+        self._state(app).close()
+
+    @property
+    def client(self):
+        return self.get_client()
+
+    @property
+    def database(self):
+        return self.get_database()
+
+    @property
+    def users(self):
+        return UserRepository(self.database)
+
+    @property
+    def roles(self):
+        return RoleRepository(self.database)
+
+    @property
+    def articles(self):
+        return ArticleRepository(self.database)
+
+    @property
+    def timelines(self):
+        return TimelineRepository(self.database)
+
+    @property
+    def comments(self):
+        return CommentRepository(self.database)
+
+    @property
+    def follows(self):
+        return FollowRepository(self.database)
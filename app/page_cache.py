@@ -0,0 +1,167 @@
+import hashlib
+import time
+from datetime import datetime
+from functools import wraps
+from flask import request, session, make_response, current_app
+from flask_login import current_user
+from werkzeug.http import http_date, parse_date
+from .cache import LRUCache
+
+
+class MemoryBackend:
+    """Pages and version stamps held in this process only.
+
+    Another worker never sees this process's bumps, so its validators are
+    only trusted for PAGE_CACHE_TTL seconds; run several workers with the
+    mongo backend.
+    """
+
+    shared = False
+
+    def __init__(self, app):
+        self.ttl = app.config['PAGE_CACHE_TTL']
+        self.pages = LRUCache(app.config['PAGE_CACHE_SIZE'], self.ttl)
+        self.stamps = {}
+
+    def window(self):
+        now = time.time()
+        return now - now % self.ttl if self.ttl else now
+
+    def get(self, key):
+        return self.pages.get(key)
+
+    def set(self, key, page):
+        self.pages.set(key, page)
+
+    def versions(self, scopes):
+        return [self.stamps.get(scope, 0) for scope in scopes]
+
+    def bump(self, scopes):
+        now = time.time()
+        for scope in scopes:
+            self.stamps[scope] = now
+
+
+class MongoBackend:
+    """Pages and version stamps shared by every worker through MongoDB."""
+
+    shared = True
+
+    def __init__(self, app):
+        self.app = app
+        self.ttl = app.config['PAGE_CACHE_TTL']
+
+    def _database(self):
+        from . import db
+        return db.get_database(self.app)
+
+    def get(self, key):
+        page = self._database().PageCache.find_one({'_id': key})
+        if page is None or page.get('expires') < datetime.utcnow():
+            return None
+        return page
+
+    def set(self, key, page):
+        page = dict(page, expires=datetime.utcfromtimestamp(time.time() + self.ttl))
+        self._database().PageCache.replace_one({'_id': key}, page, upsert=True)
+
+    def versions(self, scopes):
+        stamps = dict((stamp['_id'], stamp.get('v', 0)) for stamp in
+                      self._database().PageVersion.find({'_id': {'$in': scopes}}))
+        return [stamps.get(scope, 0) for scope in scopes]
+
+    def bump(self, scopes):
+        now = time.time()
+        for scope in scopes:
+            self._database().PageVersion.update_one({'_id': scope}, {'$max': {'v': now}}, upsert=True)
+
+
+backends = {
+    'memory': MemoryBackend,
+    'mongo': MongoBackend
+}
+
+
+class PageCache:
+    """Response cache with ETag/Last-Modified validation for anonymous pages.
+
+    Every cached endpoint names the version scopes it depends on (for
+    example 'posts' or 'post:{id}'); write paths bump those scopes, which
+    changes the ETag and makes older cached copies unusable.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.epoch = time.time()
+        self.hits = self.misses = self.not_modified = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PAGE_CACHE_ENABLED', True)
+        app.config.setdefault('PAGE_CACHE_BACKEND', 'memory')
+        app.config.setdefault('PAGE_CACHE_SIZE', 512)
+        app.config.setdefault('PAGE_CACHE_TTL', 60)
+        backend = app.config['PAGE_CACHE_BACKEND']
+        if isinstance(backend, str):
+            backend = backends[backend]
+        self.backend = backend(app)
+
+    def bump(self, *scopes):
+        self.backend.bump(list(scopes))
+
+    def cached(self, *scopes):
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if not current_app.config['PAGE_CACHE_ENABLED'] or request.method != 'GET' or \
+                        current_user.is_authenticated or '_flashes' in session:
+                    return f(*args, **kwargs)
+                names = [scope.format(**kwargs) for scope in scopes]
+                versions = self.backend.versions(names)
+                if not self.backend.shared:
+                    versions.append(self.backend.window())
+                key = '%s|%s' % (request.full_path, request.cookies.get('show_followed', ''))
+                etag = hashlib.sha1(('%s|%r' % (key, versions)).encode('utf-8')).hexdigest()
+                last_modified = max(versions + [self.epoch])
+                if self._not_modified(etag, last_modified):
+                    self.not_modified += 1
+                    response = current_app.response_class(status=304)
+                else:
+                    page = self.backend.get(key)
+                    if page is not None and page.get('etag') == etag:
+                        self.hits += 1
+                        response = current_app.response_class(page.get('body'), mimetype='text/html')
+                    else:
+                        self.misses += 1
+                        response = make_response(f(*args, **kwargs))
+                        if response.status_code != 200:
+                            return response
+                        self.backend.set(key, {'etag': etag, 'body': response.get_data(as_text=True)})
+                response.set_etag(etag)
+                response.headers['Last-Modified'] = http_date(last_modified)
+                response.headers['Cache-Control'] = 'no-cache'
+                response.vary.add('Cookie')
+                return response
+
+            return decorated_function
+
+        return decorator
+
+    def _not_modified(self, etag, last_modified):
+        if request.if_none_match:
+            return etag in request.if_none_match
+        since = request.headers.get('If-Modified-Since')
+        if since:
+            since = parse_date(since)
+            return since is not None and since >= datetime.utcfromtimestamp(int(last_modified))
+        return False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0
+        }
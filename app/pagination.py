@@ -0,0 +1,113 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def encode_cursor(page, direction, document, key='issuing_time'):
+    data = {'p': page, 'd': direction, 't': document.get(key).strftime(TIME_FORMAT), 'i': str(document.get('_id'))}
+    return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        return int(data['p']), data['d'], datetime.strptime(data['t'], TIME_FORMAT), ObjectId(data['i'])
+    except (ValueError, KeyError, TypeError, InvalidId, binascii.Error):
+        return None
+
+
+class Pagination:
+    prev_cursor = None
+    next_cursor = None
+
+    def __init__(self, page, per_page, total, items):
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.items = items
+        self.pages = (total + per_page - 1) // per_page
+        self.has_prev = page > 1
+        self.has_next = page < self.pages
+        self.prev_num = page - 1
+        self.next_num = page + 1
+
+    @classmethod
+    def from_list(cls, page, per_page, items):
+        start = (page - 1) * per_page
+        return cls(page, per_page, len(items), items[start:start + per_page])
+
+    def iter_pages(self, left_edge=2, left_current=2,
+                   right_current=5, right_edge=2):
+        last = 0
+        for num in range(1, self.pages + 1):
+            if num <= left_edge or \
+                    (self.page - left_current - 1 < num < self.page + right_current) \
+                    or num > self.pages - right_edge:
+                if last + 1 != num:
+                    yield None
+                yield num
+                last = num
+
+
+class KeysetPagination(Pagination):
+    """Pages a collection on (key, _id), newest first unless descending is False.
+
+    Jumping to a page number costs one skip/limit query; following the
+    prev/next cursor tokens costs one range query on the key instead.
+    Page -1 means the last page.
+    """
+
+    def __init__(self, collection, query, page=1, per_page=20, cursor=None, key='issuing_time', projection=None,
+                 descending=True, lazy=False):
+        total = collection.count_documents(query)
+        forward = DESCENDING if descending else ASCENDING
+        decoded = decode_cursor(cursor) if cursor else None
+        reverse = False
+        if decoded is None:
+            if page == -1:
+                page = (total + per_page - 1) // per_page
+            page = max(page, 1)
+            rows = collection.find(query, projection).sort([(key, forward), ('_id', forward)]) \
+                .skip((page - 1) * per_page).limit(per_page)
+        else:
+            page, direction, value, id = decoded
+            if (direction == 'next') == descending:
+                bound, order = '$lt', DESCENDING
+            else:
+                bound, order = '$gt', ASCENDING
+            keyset = {'$or': [{key: {bound: value}}, {key: value, '_id': {bound: id}}]}
+            rows = collection.find({'$and': [query, keyset]}, projection) \
+                .sort([(key, order), ('_id', order)]).limit(per_page)
+            reverse = order != forward
+        super(KeysetPagination, self).__init__(page, per_page, total, [])
+        self.key = key
+        if lazy and not reverse:
+            # Rows are handed to the template as the cursor yields them; the
+            # prev/next tokens exist once the list has been iterated.
+            self.items = self._stream(rows)
+        else:
+            self.items = list(rows)
+            if reverse:
+                self.items.reverse()
+            self._set_cursors(self.items[0] if self.items else None, self.items[-1] if self.items else None)
+
+    def _stream(self, rows):
+        first = last = None
+        for row in rows:
+            if first is None:
+                first = row
+            last = row
+            yield row
+        self._set_cursors(first, last)
+
+    def _set_cursors(self, first, last):
+        if first is not None and self.has_prev:
+            self.prev_cursor = encode_cursor(self.prev_num, 'prev', first, self.key)
+        if last is not None and self.has_next:
+            self.next_cursor = encode_cursor(self.next_num, 'next', last, self.key)
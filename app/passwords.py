@@ -0,0 +1,87 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    """Runs password hashing in a small process pool so it never ties up request threads.
+
+    At most PASSWORD_POOL_QUEUE hashes may be queued or running; beyond
+    that, callers get PasswordHasherBusy at once instead of waiting. With
+    PASSWORD_POOL_SIZE set to 0 hashing runs inline.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pool = None
+        self._pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+        app.config.setdefault('PASSWORD_HASH_ITERATIONS', 150000)
+        app.config.setdefault('PASSWORD_SALT_LENGTH', 16)
+        app.config.setdefault('PASSWORD_POOL_SIZE', 2)
+        app.config.setdefault('PASSWORD_POOL_QUEUE', 32)
+        app.config.setdefault('PASSWORD_POOL_TIMEOUT', 5.0)
+        self.app = app
+
+    @property
+    def method(self):
+        method = self.app.config['PASSWORD_HASH_METHOD']
+        if method.startswith('pbkdf2:'):
+            method = '%s:%d' % (method, self.app.config['PASSWORD_HASH_ITERATIONS'])
+        return method
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.app.config['PASSWORD_SALT_LENGTH'])
+
+    def verify(self, stored, password):
+        return self._run(check_password_hash, stored, password)
+
+    def needs_rehash(self, stored):
+        return (stored or '').split('$', 1)[0] != self.method
+
+    def _run(self, function, *args):
+        if not self.app.config['PASSWORD_POOL_SIZE']:
+            return function(*args)
+        self._ensure_pool()
+        if not self._slots.acquire(False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusy('password hashing pool is saturated')
+        try:
+            future = self._pool.submit(function, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(self.app.config['PASSWORD_POOL_TIMEOUT'])
+        except TimeoutError:
+            raise PasswordHasherBusy('password hashing timed out')
+
+    def _ensure_pool(self):
+        # Worker processes and their queue do not survive fork(); one pool per process.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pool = ProcessPoolExecutor(self.app.config['PASSWORD_POOL_SIZE'])
+            self._slots = threading.BoundedSemaphore(self.app.config['PASSWORD_POOL_QUEUE'])
+            self._pid = os.getpid()
+
+    def shutdown(self):
+        if self._pid == os.getpid():
+            self._pool.shutdown()
+        self._pid = None
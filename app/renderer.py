@@ -0,0 +1,84 @@
+import hashlib
+import os
+from itertools import islice
+from multiprocessing import Pool
+from markdown import markdown
+from pymongo import UpdateOne
+import bleach
+from .cache import LRUCache
+
+ALLOWED_TAGS = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
+                'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
+                'h1', 'h2', 'h3', 'p']
+
+# Bump whenever ALLOWED_TAGS or the markdown/bleach pipeline changes so that
+# `manage.py rerender` picks up every article rendered under the old policy.
+POLICY_VERSION = 1
+
+
+def render_body(body):
+    return bleach.linkify(bleach.clean(markdown(body, output_format='html'),
+                                       tags=ALLOWED_TAGS, strip=True))
+
+
+def _render_batch(batch):
+    return [(id, render_body(body)) for id, body in batch]
+
+
+class Renderer:
+    def __init__(self, app=None):
+        self.cache = LRUCache()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RENDER_CACHE_SIZE', 1024)
+        self.cache.configure(app.config['RENDER_CACHE_SIZE'])
+
+    def render(self, body):
+        key = (hashlib.sha1(body.encode('utf-8')).hexdigest(), POLICY_VERSION)
+        html = self.cache.get(key)
+        if html is None:
+            html = render_body(body)
+            self.cache.set(key, html)
+        return html
+
+    def rerender_all(self, collection, processes=None, batch_size=200):
+        """Re-render every article not rendered under POLICY_VERSION.
+
+        Bodies are streamed from the cursor in batches, rendered by a process
+        pool and written back with one bulk write per batch. The pool is fed
+        two batches per process at a time, so the cursor is only read as fast
+        as the batches are rendered and written.
+        """
+        stale = {'body_html_version': {'$ne': POLICY_VERSION}}
+
+        def batches():
+            batch = []
+            for article in collection.find(stale, {'body': True}, batch_size=batch_size):
+                batch.append((article['_id'], article.get('body') or ''))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        processes = processes or os.cpu_count() or 1
+        pending = batches()
+        pool = Pool(processes)
+        updated = 0
+        try:
+            while True:
+                # imap() alone drains the whole cursor into the pool's task queue.
+                window = list(islice(pending, 2 * processes))
+                if not window:
+                    break
+                for rendered in pool.imap(_render_batch, window):
+                    ops = [UpdateOne({'_id': id, 'body_html_version': {'$ne': POLICY_VERSION}},
+                                     {'$set': {'body_html': html, 'body_html_version': POLICY_VERSION}})
+                           for id, html in rendered]
+                    updated += collection.bulk_write(ops, ordered=False).modified_count
+        finally:
+            pool.close()
+            pool.join()
+        return updated
@@ -0,0 +1,184 @@
+from bson.objectid import ObjectId
+from pymongo import DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from .pagination import KeysetPagination
+
+
+class Repository:
+    collection_name = None
+
+    def __init__(self, database):
+        self.collection = database[self.collection_name]
+
+    def get(self, id):
+        return self.collection.find_one({'_id': ObjectId(id)})
+
+    def create(self, document):
+        return self.collection.insert_one(document).inserted_id
+
+    def update(self, id, fields):
+        return self.collection.update_one({'_id': ObjectId(id)}, {'$set': fields})
+
+    def save(self, id, version, fields):
+        return self.collection.update_one({'_id': ObjectId(id), 'version': version},
+                                          {'$set': fields, '$inc': {'version': 1}})
+
+
+class UserRepository(Repository):
+    collection_name = 'User'
+
+    def by_username(self, username):
+        return self.collection.find_one({'username': username})
+
+    def by_email(self, email):
+        return self.collection.find_one({'email': email})
+
+    def update_by_username(self, username, fields):
+        return self.collection.update_one({'username': username}, {'$set': fields})
+
+    def large_accounts(self, usernames, threshold):
+        cursor = self.collection.find({'username': {'$in': usernames}, 'follower_count': {'$gt': threshold}},
+                                      {'username': True})
+        return [user.get('username') for user in cursor]
+
+    def increment(self, username, field, amount=1):
+        return self.collection.update_one({'username': username}, {'$inc': {field: amount}})
+
+    def increment_and_get(self, username, field, amount=1):
+        return self.collection.find_one_and_update({'username': username}, {'$inc': {field: amount}},
+                                                   return_document=ReturnDocument.AFTER)
+
+
+class RoleRepository(Repository):
+    collection_name = 'Role'
+
+    def all(self):
+        return list(self.collection.find({}, {'name': True, 'permissions': True, 'default': True,
+                                              'version': True}))
+
+    def latest_version(self):
+        latest = self.collection.find_one({}, {'version': True}, sort=[('version', DESCENDING)])
+        return (latest.get('version') or 0) if latest is not None else None
+
+
+class ArticleRepository(Repository):
+    collection_name = 'Aritical'
+    # Everything _post_card.html needs to render a post card, and to key its fragment.
+    card_fields = {'username': True, 'user_id': True, 'issuing_time': True, 'body_html': True,
+                   'body_html_version': True, 'comment_count': True, 'version': True}
+
+    def latest(self):
+        return self.collection.find().sort('issuing_time', DESCENDING)
+
+    def by_username(self, username):
+        return self.collection.find({'username': username}).sort('issuing_time', DESCENDING)
+
+    def paginate(self, query, page, per_page, cursor=None, lazy=False):
+        return KeysetPagination(self.collection, query, page, per_page, cursor, projection=self.card_fields,
+                                lazy=lazy)
+
+    def by_ids(self, ids):
+        return self.collection.find({'_id': {'$in': ids}}, self.card_fields).sort('issuing_time', DESCENDING)
+
+    def by_usernames(self, usernames, limit):
+        return self.collection.find({'username': {'$in': usernames}}, {'username': True, 'issuing_time': True}) \
+            .sort('issuing_time', DESCENDING).limit(limit)
+
+    def count_by_usernames(self, usernames):
+        return self.collection.count_documents({'username': {'$in': usernames}})
+
+    def increment(self, id, field, amount=1):
+        return self.collection.update_one({'_id': ObjectId(id)}, {'$inc': {field: amount}})
+
+    def timeline_entries(self, username, limit):
+        return self.collection.find({'username': username}, {'username': True, 'issuing_time': True}) \
+            .sort('issuing_time', DESCENDING).limit(limit)
+
+
+class TimelineRepository(Repository):
+    collection_name = 'Timeline'
+
+    def push(self, usernames, entries, length):
+        return self.collection.update_many(
+            {'_id': {'$in': usernames}},
+            {'$push': {'posts': {'$each': entries, '$sort': {'issuing_time': DESCENDING}, '$slice': length}}})
+
+    def backfill(self, username, entries, length):
+        return self.collection.update_one(
+            {'_id': username},
+            {'$push': {'posts': {'$each': entries, '$sort': {'issuing_time': DESCENDING}, '$slice': length}}},
+            upsert=True)
+
+    def clear(self, username):
+        return self.collection.delete_one({'_id': username})
+
+    def prune(self, username, author):
+        return self.collection.update_one({'_id': username}, {'$pull': {'posts': {'username': author}}})
+
+    def page(self, username, skip, limit, exclude=None):
+        posts = '$posts'
+        if exclude:
+            posts = {'$filter': {'input': '$posts', 'as': 'post',
+                                 'cond': {'$not': {'$in': ['$$post.username', list(exclude)]}}}}
+        result = list(self.collection.aggregate([
+            {'$match': {'_id': username}},
+            {'$project': {'posts': posts}},
+            {'$project': {'total': {'$size': '$posts'}, 'posts': {'$slice': ['$posts', skip, limit]}}}
+        ]))
+        if not result:
+            return 0, []
+        return result[0].get('total'), result[0].get('posts')
+
+
+class CommentRepository(Repository):
+    collection_name = 'Comment'
+
+    def add(self, post_id, username, body, created_at):
+        return self.create({'post_id': ObjectId(post_id), 'username': username, 'body': body,
+                            'created_at': created_at})
+
+    def remove(self, post_id, id):
+        return self.collection.delete_one({'_id': ObjectId(id), 'post_id': ObjectId(post_id)}).deleted_count
+
+    def paginate(self, post_id, page, per_page, cursor=None, lazy=False):
+        return KeysetPagination(self.collection, {'post_id': ObjectId(post_id)}, page, per_page, cursor,
+                                key='created_at', descending=False, lazy=lazy)
+
+
+class FollowRepository(Repository):
+    collection_name = 'Follow'
+
+    def follow(self, follower, followee, timestamp):
+        try:
+            result = self.collection.update_one({'follower': follower, 'followee': followee},
+                                                {'$setOnInsert': {'timestamp': timestamp}}, upsert=True)
+        except DuplicateKeyError:
+            return False
+        return result.upserted_id is not None
+
+    def unfollow(self, follower, followee):
+        return self.collection.delete_one({'follower': follower, 'followee': followee}).deleted_count == 1
+
+    def is_following(self, follower, followee):
+        return self.collection.find_one({'follower': follower, 'followee': followee}, {'_id': True}) is not None
+
+    def following_any(self, follower, usernames):
+        cursor = self.collection.find({'follower': follower, 'followee': {'$in': list(usernames)}},
+                                      {'followee': True, '_id': False})
+        return set(edge.get('followee') for edge in cursor)
+
+    def follower_names(self, username):
+        return [edge.get('follower') for edge in
+                self.collection.find({'followee': username}, {'follower': True, '_id': False})]
+
+    def followee_names(self, username):
+        return [edge.get('followee') for edge in
+                self.collection.find({'follower': username}, {'followee': True, '_id': False})]
+
+    def followers(self, username, page, per_page, cursor=None):
+        return KeysetPagination(self.collection, {'followee': username}, page, per_page, cursor,
+                                key='timestamp', descending=False)
+
+    def following(self, username, page, per_page, cursor=None):
+        return KeysetPagination(self.collection, {'follower': username}, page, per_page, cursor,
+                                key='timestamp', descending=False)
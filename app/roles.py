@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+from .repositories import RoleRepository
+
+
+class Permission:
+    FOLLOW = 0x01
+    COMMENT = 0x02
+    WRITE_ARTICLES = 0x04
+    MODERATE_COMMENTS = 0x08
+    ADMINISTER = 0x80
+
+
+class Role(namedtuple('Role', 'name permissions default')):
+    __slots__ = ()
+
+    def can(self, permission):
+        return (self.permissions & permission) == permission
+
+
+class RoleRegistry:
+    """Role name -> Role, read from the Role collection once per process.
+
+    Lookups never touch the database. The table is reloaded by reload(),
+    or, checked at most every ROLE_REFRESH_INTERVAL seconds by refresh()
+    (before every Flask request), when the stored roles carry a newer
+    `version` than the one loaded (schema.seed_roles bumps it).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.version = None
+        self.loads = 0
+        self._roles = None
+        self._default = None
+        self._checked = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ROLE_REFRESH_INTERVAL', 60)
+        self.app = app
+        self._roles = None
+        app.before_request(self._refresh)
+
+    def _repository(self):
+        from . import db
+        return RoleRepository(db.get_database(self.app))
+
+    def reload(self):
+        documents = self._repository().all()
+        roles = dict((document['name'], Role(document['name'], document.get('permissions') or 0,
+                                             bool(document.get('default'))))
+                     for document in documents)
+        with self._lock:
+            # An empty collection (roles not seeded yet) is retried on the next lookup.
+            self._roles = MappingProxyType(roles) if roles else None
+            self._default = next((role for role in roles.values() if role.default), None)
+            self.version = max([document.get('version') or 0 for document in documents] or [0])
+            self._checked = time.time()
+            self.loads += 1
+        return self._roles
+
+    def _table(self):
+        roles = self._roles
+        if roles is None:
+            roles = self.reload() or {}
+        return roles
+
+    def get(self, name):
+        return self._table().get(name)
+
+    def default(self):
+        self._table()
+        return self._default
+
+    def names(self):
+        return sorted(self._table())
+
+    def stale(self):
+        interval = self.app.config['ROLE_REFRESH_INTERVAL']
+        return self._roles is None or bool(interval) and time.time() - self._checked >= interval
+
+    def refresh(self):
+        """Load the table, or reload it if the stored roles carry a newer version."""
+        if self._roles is None:
+            return self.reload()
+        if not self.stale():
+            return self._roles
+        self._checked = time.time()
+        version = self._repository().latest_version()
+        if version is not None and version != self.version:
+            self.reload()
+        return self._roles
+
+    def _refresh(self):
+        # Before each Flask request; the first lookup loads the table.
+        if self._roles is not None:
+            self.refresh()
+
+    def stats(self):
+        return {'roles': len(self._roles or {}), 'version': self.version, 'loads': self.loads}
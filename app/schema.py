@@ -0,0 +1,123 @@
+from datetime import datetime
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
+from .roles import Permission
+
+INDEXES = {
+    'User': [
+        IndexModel([('username', ASCENDING)], unique=True, name='username_unique'),
+        IndexModel([('email', ASCENDING)], unique=True, name='email_unique'),
+    ],
+    'Role': [
+        IndexModel([('name', ASCENDING)], unique=True, name='name_unique'),
+        IndexModel([('default', ASCENDING)], name='default'),
+        IndexModel([('permissions', ASCENDING)], name='permissions'),
+        IndexModel([('version', DESCENDING)], name='version'),
+    ],
+    'Aritical': [
+        IndexModel([('issuing_time', DESCENDING), ('_id', DESCENDING)], name='issuing_time'),
+        IndexModel([('username', ASCENDING), ('issuing_time', DESCENDING), ('_id', DESCENDING)],
+                   name='username_issuing_time'),
+        IndexModel([('body_html_version', ASCENDING)], name='body_html_version'),
+    ],
+    'Comment': [
+        IndexModel([('post_id', ASCENDING), ('created_at', ASCENDING), ('_id', ASCENDING)], name='post_created_at'),
+    ],
+    'Follow': [
+        IndexModel([('follower', ASCENDING), ('followee', ASCENDING)], unique=True, name='follower_followee'),
+        IndexModel([('followee', ASCENDING), ('follower', ASCENDING)], unique=True, name='followee_follower'),
+        IndexModel([('followee', ASCENDING), ('timestamp', ASCENDING), ('_id', ASCENDING)],
+                   name='followee_timestamp'),
+        IndexModel([('follower', ASCENDING), ('timestamp', ASCENDING), ('_id', ASCENDING)],
+                   name='follower_timestamp'),
+    ],
+    'SearchIndex': [
+        IndexModel([('terms', ASCENDING), ('issuing_time', DESCENDING)], name='terms_issuing_time'),
+    ],
+    'PageCache': [
+        IndexModel([('expires', ASCENDING)], expireAfterSeconds=0, name='expires'),
+    ],
+}
+
+ROLES = {
+    'User': (Permission.FOLLOW |
+             Permission.COMMENT |
+             Permission.WRITE_ARTICLES, True),
+    'Moderator': (Permission.FOLLOW |
+                  Permission.COMMENT |
+                  Permission.WRITE_ARTICLES |
+                  Permission.MODERATE_COMMENTS, False),
+    'Administrator': (0xff, False)
+}
+
+# (collection, filter, sort) for every query shape the application issues.
+_now = datetime.utcnow()
+_id = ObjectId()
+QUERIES = [
+    ('User', {'_id': _id}, None),
+    ('User', {'username': 'name'}, None),
+    ('User', {'email': 'name@example.com'}, None),
+    ('User', {'username': {'$in': ['name']}, 'follower_count': {'$gt': 1000}}, None),
+    ('Role', {}, [('version', DESCENDING)]),
+    ('Aritical', {}, [('issuing_time', DESCENDING), ('_id', DESCENDING)]),
+    ('Aritical', {'$or': [{'issuing_time': {'$lt': _now}}, {'issuing_time': _now, '_id': {'$lt': _id}}]},
+     [('issuing_time', DESCENDING), ('_id', DESCENDING)]),
+    ('Aritical', {'username': 'name'}, [('issuing_time', DESCENDING), ('_id', DESCENDING)]),
+    ('Aritical', {'username': {'$in': ['name']}}, [('issuing_time', DESCENDING)]),
+    ('Aritical', {'_id': {'$in': [_id]}}, [('issuing_time', DESCENDING)]),
+    ('Aritical', {'body_html_version': {'$ne': 1}}, None),
+    ('Comment', {'post_id': _id}, [('created_at', ASCENDING), ('_id', ASCENDING)]),
+    ('Comment', {'post_id': _id, '$or': [{'created_at': {'$gt': _now}}, {'created_at': _now, '_id': {'$gt': _id}}]},
+     [('created_at', ASCENDING), ('_id', ASCENDING)]),
+    ('Follow', {'follower': 'name', 'followee': 'other'}, None),
+    ('Follow', {'follower': 'name', 'followee': {'$in': ['other']}}, None),
+    ('Follow', {'followee': 'name'}, [('timestamp', ASCENDING), ('_id', ASCENDING)]),
+    ('Follow', {'follower': 'name'}, [('timestamp', ASCENDING), ('_id', ASCENDING)]),
+    ('Timeline', {'_id': 'name'}, None),
+    ('SearchIndex', {'terms': 'word'}, None),
+    ('SearchIndex', {'terms': {'$all': ['word', 'other']}}, [('issuing_time', DESCENDING)]),
+]
+
+
+def ensure_indexes(database, names=None):
+    """Create the declared indexes; returns a list of (collection, error) failures."""
+    failures = []
+    for name in names or sorted(INDEXES):
+        try:
+            database[name].create_indexes(INDEXES[name])
+        except OperationFailure as e:
+            failures.append((name, str(e)))
+    return failures
+
+
+def seed_roles(database):
+    # The version bump tells every process's role registry to reload.
+    ops = [UpdateOne({'name': name}, {'$set': {'permissions': permissions, 'default': default},
+                                      '$inc': {'version': 1}}, upsert=True)
+           for name, (permissions, default) in ROLES.items()]
+    return database.Role.bulk_write(ops, ordered=False)
+
+
+def _stages(plan):
+    yield plan.get('stage')
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            for stage in _stages(plan[key]):
+                yield stage
+    for child in plan.get('inputStages', []):
+        for stage in _stages(child):
+            yield stage
+
+
+def check_queries(database):
+    """Explain every known query shape; returns the ones that scan a collection."""
+    scans = []
+    for name, query, sort in QUERIES:
+        cursor = database[name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+        if 'COLLSCAN' in set(_stages(plan)):
+            scans.append((name, query, sort))
+    return scans
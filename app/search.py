@@ -0,0 +1,123 @@
+import math
+import re
+import time
+from collections import Counter
+from flask import current_app
+from pymongo import DESCENDING, ReplaceOne
+from . import db, page_cache
+from .cache import LRUCache
+
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_TOKENS = re.compile('[%s]+|[^\\W%s]+' % (_CJK, _CJK))
+_CJK_RUN = re.compile('[%s]' % _CJK)
+
+# Matches on the author's name count as this many occurrences in the body.
+USERNAME_WEIGHT = 3
+
+# Ranked ids per query, keyed on the shared 'search' version so that an
+# index write in any worker retires them.
+results = LRUCache()
+# Document frequency per term; IDF barely moves as posts are added.
+frequencies = LRUCache()
+
+
+def tokenize(text):
+    """Lowercased words, plus single characters and bigrams for runs of CJK text."""
+    for run in _TOKENS.findall(text or ''):
+        if _CJK_RUN.match(run):
+            for i, char in enumerate(run):
+                yield char
+                if i + 1 < len(run):
+                    yield run[i:i + 2]
+        else:
+            yield run.lower()
+
+
+def query_terms(text):
+    # A CJK query longer than one character is matched on its bigrams only.
+    terms = []
+    for run in _TOKENS.findall(text or ''):
+        if _CJK_RUN.match(run):
+            terms.extend([run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)])
+        else:
+            terms.append(run.lower())
+    return sorted(set(terms))
+
+
+def _document(post):
+    tf = Counter(tokenize(post.get('body')))
+    for term in tokenize(post.get('username')):
+        tf[term] += USERNAME_WEIGHT
+    return {'terms': list(tf), 'tf': dict(tf), 'username': post.get('username'),
+            'issuing_time': post.get('issuing_time'), 'built': time.time()}
+
+
+def index(post):
+    db.database.SearchIndex.replace_one({'_id': post.get('_id')}, _document(post), upsert=True)
+    page_cache.bump('search')
+
+
+def _frequency(collection, term):
+    count = frequencies.get(term)
+    if count is None:
+        count = collection.count_documents({'terms': term})
+        frequencies.set(term, count)
+    return count
+
+
+def ranked(terms):
+    """Ids of the posts containing every term, best match first."""
+    key = (tuple(terms), page_cache.backend.versions(['search'])[0])
+    ids = results.get(key)
+    if ids is not None:
+        return ids
+    collection = db.database.SearchIndex
+    total = collection.estimated_document_count() or 1
+    idf = dict((term, math.log(1.0 + float(total) / (_frequency(collection, term) or 1))) for term in terms)
+    projection = dict(('tf.' + term, True) for term in terms)
+    projection['issuing_time'] = True
+    matches = collection.find({'terms': {'$all': terms}}, projection) \
+        .sort('issuing_time', DESCENDING).limit(current_app.config['SEARCH_MAX_RESULTS'])
+    scored = []
+    for match in matches:
+        tf = match.get('tf', {})
+        score = sum((1.0 + math.log(tf.get(term, 1))) * idf[term] for term in terms)
+        scored.append((score, match.get('issuing_time'), match.get('_id')))
+    scored.sort(reverse=True)
+    ids = [id for score, issuing_time, id in scored]
+    results.set(key, ids)
+    return ids
+
+
+def search(text, page, per_page):
+    """(total, posts) for one page of results; posts are in rank order."""
+    terms = query_terms(text)
+    if not terms:
+        return 0, []
+    ids = ranked(terms)
+    window = ids[(page - 1) * per_page:page * per_page]
+    posts = dict((post.get('_id'), post) for post in db.articles.by_ids(window))
+    return len(ids), [posts[id] for id in window if id in posts]
+
+
+def rebuild(batch_size=500):
+    """Re-index every article in batches and drop entries for articles that no longer exist."""
+    built = time.time()
+    collection = db.database.SearchIndex
+    indexed = 0
+    ops = []
+    for post in db.articles.collection.find({}, {'body': True, 'username': True, 'issuing_time': True},
+                                            batch_size=batch_size):
+        ops.append(ReplaceOne({'_id': post.get('_id')}, _document(post), upsert=True))
+        if len(ops) >= batch_size:
+            collection.bulk_write(ops, ordered=False)
+            indexed += len(ops)
+            ops = []
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+        indexed += len(ops)
+    # Anything not rewritten since the rebuild started belongs to a deleted article.
+    collection.delete_many({'built': {'$lt': built}})
+    frequencies.clear()
+    page_cache.bump('search')
+    return indexed
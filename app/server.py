@@ -0,0 +1,283 @@
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer
+
+# Set in a worker once it stops taking new requests; /ready reports 503 from then on.
+draining = threading.Event()
+
+
+def _log(message, *args):
+    sys.stderr.write('[%d] %s\n' % (os.getpid(), message % args))
+    sys.stderr.flush()
+
+
+def preload(app):
+    """Work done once in the master so every worker inherits it copy-on-write.
+
+    Only pure in-memory state belongs here: nothing that opens a socket or
+    starts a thread, since neither survives fork().
+    """
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        app.jinja_env.get_template(name)
+
+
+def post_fork(app):
+    """Give a freshly forked worker its own connections, threads and caches."""
+    from . import db, roles, last_seen, fragments, renderer, search, assets
+    from .email import mail_queue
+    from .models import user_cache
+    draining.clear()
+    for cache in (user_cache, fragments.cache, renderer.cache, search.results, search.frequencies):
+        cache.clear()
+    # Never reuse the parent's client; close() leaves its sockets alone.
+    db.close(app)
+    db.get_client(app)
+    with app.app_context():
+        try:
+            roles.reload()
+        except Exception:
+            # The worker still starts; /ready reports it until Mongo is back.
+            app.logger.exception('Could not load roles after fork')
+    # Picks up a `build_assets` run since the master started, so SIGHUP is enough.
+    assets.load()
+    mail_queue.start()
+    last_seen.start()
+
+
+def worker_exit(app):
+    """Flush what the worker buffered before its process goes away."""
+    from . import db, last_seen, password_hasher
+    from .email import mail_queue
+    last_seen.stop()
+    mail_queue.stop()
+    password_hasher.shutdown()
+    db.close(app)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug's server with a fixed pool of request threads.
+
+    A connection is only accepted while a thread is free, so a busy worker
+    leaves the rest of the backlog to its siblings on the shared socket.
+    After `max_requests` requests, on SIGTERM, or when the master goes
+    away, it stops accepting and lets the requests in flight finish.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, max_requests=0, **kwargs):
+        BaseWSGIServer.__init__(self, host, port, app, **kwargs)
+        self.pool = ThreadPoolExecutor(threads)
+        self.slots = threading.BoundedSemaphore(threads)
+        self.max_requests = max_requests
+        self.handled = 0
+        self.parent = os.getppid()
+        self._count_lock = threading.Lock()
+
+    def get_request(self):
+        request, address = self.socket.accept()
+        # The shared listener is non-blocking; the connection itself must not be.
+        request.setblocking(True)
+        return request, address
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        try:
+            self.pool.submit(self._process, request, client_address)
+        except Exception:
+            self.slots.release()
+            self.shutdown_request(request)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+        with self._count_lock:
+            self.handled += 1
+            recycle = self.max_requests and self.handled >= self.max_requests
+        if recycle and not draining.is_set():
+            _log('worker served %d requests, recycling', self.handled)
+            self.drain()
+
+    def service_actions(self):
+        if os.getppid() != self.parent and not draining.is_set():
+            _log('master went away, stopping')
+            self.drain()
+
+    def drain(self):
+        if draining.is_set():
+            return
+        draining.set()
+        # shutdown() blocks until serve_forever() returns, so never call it on the serving thread.
+        threading.Thread(target=self.shutdown, name='worker-drain').start()
+
+    def server_close(self):
+        BaseWSGIServer.server_close(self)
+        self.pool.shutdown(wait=True)
+
+
+class PreforkServer:
+    """Binds once, preloads the app and keeps `workers` forked processes serving it.
+
+    SIGHUP starts a fresh set of workers and then gracefully stops the old
+    ones; SIGTERM and SIGINT stop every worker, waiting `graceful_timeout`
+    seconds for requests in flight before killing them. A worker that exits
+    (for instance after `max_requests`) is replaced. The code itself is
+    loaded once in the master, so deploying new code needs a restart.
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=8000, workers=2, threads=4, max_requests=0,
+                 max_requests_jitter=0, graceful_timeout=30, backlog=2048):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self.listener = None
+        self.children = {}
+        self.generation = 0
+        self._reload = False
+        self._stop = False
+
+    @classmethod
+    def from_config(cls, app, **overrides):
+        config = app.config
+        options = dict(host=config['SERVER_HOST'], port=config['SERVER_PORT'],
+                       workers=config['SERVER_WORKERS'], threads=config['SERVER_THREADS'],
+                       max_requests=config['SERVER_MAX_REQUESTS'],
+                       max_requests_jitter=config['SERVER_MAX_REQUESTS_JITTER'],
+                       graceful_timeout=config['SERVER_GRACEFUL_TIMEOUT'], backlog=config['SERVER_BACKLOG'])
+        options.update((key, value) for key, value in overrides.items() if value is not None)
+        return cls(app, **options)
+
+    def bind(self):
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        listener = socket.socket(family, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(self.backlog)
+        # Workers poll the same socket; non-blocking so a lost accept() race does not hang one.
+        listener.setblocking(False)
+        self.listener = listener
+        self.port = listener.getsockname()[1]
+        return listener
+
+    def run(self):
+        if self.listener is None:
+            self.bind()
+        preload(self.app)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        _log('serving on http://%s:%d with %d workers x %d threads',
+             self.host, self.port, self.workers, self.threads)
+        try:
+            while not self._stop:
+                self.reap()
+                if self._reload:
+                    self._reload = False
+                    self.roll()
+                self.spawn_missing()
+                time.sleep(0.5)
+        finally:
+            self.stop()
+            self.listener.close()
+
+    def _on_reload(self, signum, frame):
+        self._reload = True
+
+    def _on_stop(self, signum, frame):
+        self._stop = True
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if not pid:
+                return
+            if self.children.pop(pid, None) is not None and os.WIFSIGNALED(status):
+                _log('worker %d killed by signal %d', pid, os.WTERMSIG(status))
+
+    def current(self):
+        return [pid for pid, generation in self.children.items() if generation == self.generation]
+
+    def spawn_missing(self):
+        for i in range(self.workers - len(self.current())):
+            self.spawn()
+
+    def roll(self):
+        _log('reloading workers')
+        old = list(self.children)
+        self.generation += 1
+        self.spawn_missing()
+        self.kill(old, signal.SIGTERM)
+
+    def kill(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                self.children.pop(pid, None)
+
+    def stop(self):
+        self.kill(list(self.children), signal.SIGTERM)
+        deadline = time.time() + self.graceful_timeout
+        while self.children and time.time() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        if self.children:
+            _log('killing %d workers that did not stop in time', len(self.children))
+            self.kill(list(self.children), signal.SIGKILL)
+            while self.children:
+                self.reap()
+                time.sleep(0.1)
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = self.generation
+            return pid
+        code = 0
+        try:
+            self.work()
+        except BaseException:
+            self.app.logger.exception('Worker failed')
+            code = 1
+        finally:
+            # Never fall back into the master's stack or run its atexit hooks.
+            os._exit(code)
+
+    def work(self):
+        # The master handles Ctrl-C and hangups for the whole group.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        post_fork(self.app)
+        max_requests = self.max_requests
+        if max_requests and self.max_requests_jitter:
+            # Spread recycling out so the workers do not all restart at once.
+            max_requests += random.SystemRandom().randint(0, self.max_requests_jitter)
+        server = PooledWSGIServer(self.host, self.port, self.app, self.threads, max_requests,
+                                  fd=self.listener.fileno())
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.drain())
+        _log('worker booted')
+        try:
+            server.serve_forever()
+        finally:
+            worker_exit(self.app)
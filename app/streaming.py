@@ -0,0 +1,62 @@
+from flask import current_app, request, render_template, get_flashed_messages, stream_with_context, \
+    _request_ctx_stack
+from flask_login import current_user
+
+
+class Streaming:
+    """Renders list pages as a stream, so the head and navigation go out first.
+
+    Views call render() instead of render_template(); with
+    STREAM_TEMPLATES off, or for views marked with exempt() or listed in
+    STREAM_TEMPLATES_EXEMPT, it is plain render_template(). Jinja output
+    is sent in groups of STREAM_TEMPLATES_BUFFER chunks.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._exempt = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STREAM_TEMPLATES', True)
+        app.config.setdefault('STREAM_TEMPLATES_BUFFER', 8)
+        app.config.setdefault('STREAM_TEMPLATES_EXEMPT', ())
+        self.app = app
+
+    def exempt(self, view):
+        self._exempt.add('%s.%s' % (view.__module__, view.__name__))
+        return view
+
+    def enabled(self):
+        config = current_app.config
+        if not config['STREAM_TEMPLATES'] or request.endpoint in config['STREAM_TEMPLATES_EXEMPT']:
+            return False
+        view = current_app.view_functions.get(request.endpoint)
+        return view is not None and '%s.%s' % (view.__module__, view.__name__) not in self._exempt
+
+    def _settle_session(self):
+        # The session cookie is written before the first chunk is sent, so
+        # whatever the templates would change in it has to happen now: popping
+        # flashed messages, Flask-Login's session checks and the CSRF token.
+        get_flashed_messages()
+        current_user._get_current_object()
+        if current_app.config.get('WTF_CSRF_ENABLED', True) and current_app.config.get('CSRF_ENABLED', True):
+            from flask_wtf.csrf import generate_csrf
+            generate_csrf()
+
+    def render(self, template_name, **context):
+        if not self.enabled():
+            return render_template(template_name, **context)
+        app = current_app._get_current_object()
+        self._settle_session()
+        app.update_template_context(context)
+        stream = app.jinja_env.get_or_select_template(template_name).stream(context)
+        stream.enable_buffering(app.config['STREAM_TEMPLATES_BUFFER'])
+        ctx = _request_ctx_stack.top
+        session = ctx.session
+        body = stream_with_context(stream)
+        # Flask 0.10 reopens the session from the cookie when stream_with_context()
+        # pushes the context again; keep the settled one for the cookie and the templates.
+        ctx.session = session
+        return app.response_class(body, mimetype='text/html')
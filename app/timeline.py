@@ -0,0 +1,63 @@
+from flask import current_app
+from . import db
+
+
+def _entry(post):
+    return {'_id': post.get('_id'), 'username': post.get('username'), 'issuing_time': post.get('issuing_time')}
+
+
+def is_large_account(user):
+    return user.get('follower_count', 0) > current_app.config['FLASKY_FANOUT_LIMIT']
+
+
+def fan_out(author, post):
+    # Accounts with a very large audience are not pushed to their followers'
+    # timelines; readers merge their posts in at read time instead.
+    if is_large_account(author):
+        return
+    followers = db.follows.follower_names(author.get('username'))
+    if followers:
+        db.timelines.push(followers, [_entry(post)], current_app.config['FLASKY_TIMELINE_LENGTH'])
+
+
+def backfill(username, followee):
+    if is_large_account(followee):
+        return
+    length = current_app.config['FLASKY_TIMELINE_LENGTH']
+    entries = list(db.articles.timeline_entries(followee.get('username'), length))
+    db.timelines.backfill(username, entries, length)
+
+
+def prune(username, followee):
+    db.timelines.prune(username, followee)
+
+
+def read(username, skip, limit):
+    following = db.follows.followee_names(username)
+    large = db.users.large_accounts(following, current_app.config['FLASKY_FANOUT_LIMIT']) if following else []
+    if not large:
+        total, entries = db.timelines.page(username, skip, limit)
+        return total, list(db.articles.by_ids([entry.get('_id') for entry in entries]))
+    # Merge-on-read: take enough of both sources to cover the requested page.
+    # Entries pushed before an author became a large account are left out of
+    # the page and the total; those posts are counted from the source.
+    total, entries = db.timelines.page(username, 0, skip + limit, exclude=large)
+    ids = merge(entries, large, db.articles.by_usernames(large, skip + limit), skip, limit)
+    total += db.articles.count_by_usernames(large)
+    return total, list(db.articles.by_ids(ids))
+
+
+def merge(entries, large, posts, skip, limit):
+    """Ids of the requested page of pushed entries merged with large accounts' posts."""
+    merged = [entry for entry in entries if entry.get('username') not in large]
+    merged.extend(_entry(post) for post in posts)
+    merged.sort(key=lambda entry: entry.get('issuing_time'), reverse=True)
+    return [entry.get('_id') for entry in merged[skip:skip + limit]]
+
+
+def rebuild(username):
+    db.timelines.clear(username)
+    for followee in db.follows.followee_names(username):
+        followee = db.users.by_username(followee)
+        if followee is not None:
+            backfill(username, followee)
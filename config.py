@@ -8,6 +8,74 @@ class Config:
     FLASKY_MAIL_SENDER = os.environ.get('MAIL_USERNAME')
     FLASKY_ADMIN = os.environ.get('FLASKY_ADMIN')
     FLASKY_POSTS_PER_PAGE = 20
+    FLASKY_FOLLOWERS_PER_PAGE = 20
+    FLASKY_COMMENTS_PER_PAGE = 20
+    FLASKY_TIMELINE_LENGTH = 800
+    FLASKY_FANOUT_LIMIT = 1000
+    MONGO_URI = os.environ.get('MONGO_URI') or 'mongodb://localhost:27017/'
+    MONGO_DBNAME = os.environ.get('MONGO_DBNAME') or 'blog'
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE') or 100)
+    MONGO_MIN_POOL_SIZE = 0
+    MONGO_CONNECT_TIMEOUT_MS = 5000
+    MONGO_SOCKET_TIMEOUT_MS = 10000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = 5000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = 2000
+    MONGO_WRITE_CONCERN = {'w': 1}
+    MONGO_ASYNC_DRIVER = os.environ.get('MONGO_ASYNC_DRIVER') or 'motor'
+    MONGO_ASYNC_THREADS = 16
+    ASYNC_API_PREFIX = '/api'
+    API_BATCH_LIMIT = 100
+    QUERY_BUDGET = 25
+    QUERY_REPEAT_THRESHOLD = 5
+    QUERY_DEBUG_HEADER = bool(os.environ.get('QUERY_DEBUG_HEADER'))
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = 300
+    LAST_SEEN_GRANULARITY = 60
+    LAST_SEEN_FLUSH_INTERVAL = 10
+    LAST_SEEN_FLUSH_SIZE = 500
+    RENDER_CACHE_SIZE = 1024
+    FRAGMENT_CACHE_ENABLED = True
+    FRAGMENT_CACHE_SIZE = 4096
+    JINJA_BYTECODE_CACHE = True
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+    ASSETS_MAX_AGE = 365 * 24 * 3600
+    STREAM_TEMPLATES = True
+    STREAM_TEMPLATES_BUFFER = 8
+    STREAM_TEMPLATES_EXEMPT = ()
+    ASSETS_VENDOR = bool(os.environ.get('ASSETS_VENDOR'))
+    BOOTSTRAP_SERVE_LOCAL = ASSETS_VENDOR
+    SEARCH_CACHE_SIZE = 256
+    SEARCH_CACHE_TTL = 60
+    SEARCH_TERM_CACHE_SIZE = 4096
+    SEARCH_TERM_CACHE_TTL = 600
+    SEARCH_MAX_RESULTS = 1000
+    PAGE_CACHE_ENABLED = True
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND') or 'memory'
+    PAGE_CACHE_SIZE = 512
+    PAGE_CACHE_TTL = 60
+    MAIL_BACKEND = os.environ.get('MAIL_BACKEND') or 'smtp'
+    MAIL_FILE_PATH = os.environ.get('MAIL_FILE_PATH') or 'mail.log'
+    MAIL_QUEUE_SIZE = 1000
+    MAIL_WORKERS = 2
+    MAIL_BATCH_SIZE = 20
+    MAIL_ENQUEUE_TIMEOUT = 1.0
+    MAIL_MAX_RETRIES = 3
+    MAIL_RETRY_BACKOFF = 0.5
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256'
+    PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS') or 150000)
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_POOL_SIZE = 2
+    PASSWORD_POOL_QUEUE = 32
+    PASSWORD_POOL_TIMEOUT = 5.0
+    ROLE_REFRESH_INTERVAL = 60
+    SERVER_HOST = os.environ.get('SERVER_HOST') or '127.0.0.1'
+    SERVER_PORT = int(os.environ.get('SERVER_PORT') or 8000)
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS') or 2)
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS') or 4)
+    SERVER_MAX_REQUESTS = 10000
+    SERVER_MAX_REQUESTS_JITTER = 1000
+    SERVER_GRACEFUL_TIMEOUT = 30
+    SERVER_BACKLOG = 2048
 
     @staticmethod
     def init_app(app):
@@ -16,18 +84,40 @@ class Config:
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    QUERY_DEBUG_HEADER = True
     MAIL_SERVER = 'smtp.163.com'
     MAIL_PORT = 465
     MAIL_USE_SSL = True
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    SERVER_WORKERS = 1
+    SERVER_MAX_REQUESTS = 0
+
+
+class ProductionConfig(Config):
+    MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.163.com'
+    MAIL_PORT = int(os.environ.get('MAIL_PORT') or 465)
+    MAIL_USE_SSL = True
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    # Several workers: the in-process page cache cannot see the others' writes.
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND') or 'mongo'
+    SERVER_HOST = os.environ.get('SERVER_HOST') or '0.0.0.0'
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS') or 2 * (os.cpu_count() or 1) + 1)
 
 
 class TestingConfig(Config):
     TESTING = True
+    WTF_CSRF_ENABLED = False
+    MONGO_URI = os.environ.get('TEST_MONGO_URI') or 'mongomock://localhost'
+    MONGO_DBNAME = 'blog_test'
+    MAIL_BACKEND = 'memory'
+    PASSWORD_HASH_ITERATIONS = 1000
 
 
 config = {
     'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
     'default': DevelopmentConfig
 }
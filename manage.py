@@ -1,6 +1,8 @@
 import os
-from app import create_app
+import json
+from app import create_app, db, timeline, migrations, renderer, schema, search, benchmark as bench, assets
 from flask_script import Manager, Shell
+from pymongo import monitoring
 
 
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
@@ -12,5 +14,138 @@ def make_shell_context():
 
 manager.add_command('shell', Shell(make_context=make_shell_context))
 
+
+@manager.option('-c', '--check', dest='check', action='store_true', default=False,
+                help='Explain the known queries and report collection scans')
+def schema_sync(check):
+    """Create the declared indexes and seed the roles (idempotent)."""
+    database = db.database
+    if check:
+        scans = schema.check_queries(database)
+        for name, query, sort in scans:
+            print('COLLSCAN %s %s sort=%s' % (name, query, sort))
+        print('%d of %d queries scan a collection.' % (len(scans), len(schema.QUERIES)))
+        return 1 if scans else 0
+    for name, error in schema.ensure_indexes(database):
+        print('Could not build indexes on %s: %s' % (name, error))
+    schema.seed_roles(database)
+    print('Indexes and roles are up to date.')
+
+
+@manager.option('--vendor', dest='vendor', action='store_true', default=False,
+                help='Copy Bootstrap and download Moment/PageDown into static/vendor first')
+def build_assets(vendor):
+    """Write fingerprinted, precompressed copies of the static files for /assets."""
+    from app.assets import build, vendor as vendor_assets
+    if vendor:
+        for name in vendor_assets(app.static_folder):
+            print('vendored %s' % name)
+    manifest = build(app.static_folder, app.config['ASSETS_DIST_DIR'])
+    assets.load()
+    print('%d assets built into %s.' % (len(manifest), app.config['ASSETS_DIST_DIR']))
+
+
+@manager.command
+def rebuild_timelines():
+    """Rebuild every user's home timeline from who they follow."""
+    for user in db.database.User.find({}, {'username': True}):
+        timeline.rebuild(user.get('username'))
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=500)
+def migrate_comments(batch_size):
+    """Move comments embedded in articles into the Comment collection."""
+    print('%d comments migrated.' % migrations.migrate_comments(batch_size))
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=500)
+def migrate_follows(batch_size):
+    """Move follower/following arrays into the Follow edge collection."""
+    print('%d follow edges.' % migrations.migrate_follows(batch_size))
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=500)
+def reconcile_counters(batch_size):
+    """Recompute post, comment and follow counters from the source collections."""
+    for counter, fixed in sorted(migrations.reconcile_counters(batch_size).items()):
+        print('%s: %d documents corrected' % (counter, fixed))
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=500)
+def rebuild_search(batch_size):
+    """Rebuild the full-text search index from every article."""
+    print('%d articles indexed.' % search.rebuild(batch_size))
+
+
+@manager.option('-p', '--processes', dest='processes', type=int, default=None)
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=200)
+def rerender(processes, batch_size):
+    """Re-render articles whose HTML predates the current sanitizer policy."""
+    print('%d articles re-rendered.' % renderer.rerender_all(db.articles.collection, processes, batch_size))
+
+
+@manager.option('-u', '--users', dest='users', type=int, default=100)
+@manager.option('-p', '--posts', dest='posts', type=int, default=10, help='Posts per user')
+@manager.option('-f', '--follows', dest='follows', type=int, default=10, help='Users each user follows')
+@manager.option('-c', '--comments', dest='comments', type=int, default=3, help='Comments per post')
+@manager.option('-n', '--requests', dest='requests', type=int, default=200, help='Requests per scenario')
+@manager.option('-s', '--seed', dest='seed', type=int, default=0)
+@manager.option('-d', '--driver', dest='driver', choices=sorted(bench.drivers), default='client')
+@manager.option('-o', '--output', dest='output', default='benchmark.json')
+@manager.option('--compare', dest='compare', default=None, help='Earlier result file to diff against')
+@manager.option('--only', dest='only', default=None, help='Comma-separated scenarios to run')
+@manager.option('--drop', dest='drop', action='store_true', default=False,
+                help='Drop MONGO_DBNAME before seeding')
+def benchmark(users, posts, follows, comments, requests, seed, driver, output, compare, only, drop):
+    """Seed a deterministic dataset into MONGO_DBNAME and measure endpoint latency."""
+    counter = None
+    if not app.config['MONGO_URI'].startswith('mongomock://'):
+        # Must be registered before the first client is created.
+        counter = bench.CommandCounter()
+        monitoring.register(counter)
+    with app.app_context():
+        if drop:
+            db.client.drop_database(app.config['MONGO_DBNAME'])
+        scale = bench.seed(db.database, users, posts, follows, comments, seed)
+    app.config['WTF_CSRF_ENABLED'] = False
+    report = bench.run(app, scale, requests, only.split(',') if only else None, driver, counter)
+    bench.save(report, output)
+    for name, result in sorted(report['results'].items()):
+        print('%-15s %8.1f req/s  p50 %7.2fms  p95 %7.2fms  p99 %7.2fms  errors %d' % (
+            name, result['throughput'], result['p50_ms'], result['p95_ms'], result['p99_ms'], result['errors']))
+    if compare:
+        with open(compare) as f:
+            for line in bench.compare(json.load(f), report):
+                print(line)
+
+
+@manager.option('-h', '--host', dest='host', default=None)
+@manager.option('-p', '--port', dest='port', type=int, default=None)
+@manager.option('-w', '--workers', dest='workers', type=int, default=None)
+@manager.option('-t', '--threads', dest='threads', type=int, default=None, help='Request threads per worker')
+@manager.option('-m', '--max-requests', dest='max_requests', type=int, default=None,
+                help='Recycle a worker after this many requests (0 never)')
+def serve(host, port, workers, threads, max_requests):
+    """Preload the app and serve it from forked workers (SIGHUP reloads them, SIGTERM stops)."""
+    from app.server import PreforkServer
+    PreforkServer.from_config(app, host=host, port=port, workers=workers, threads=threads,
+                              max_requests=max_requests).run()
+
+
+@manager.option('-h', '--host', dest='host', default='127.0.0.1')
+@manager.option('-p', '--port', dest='port', type=int, default=8000)
+def serve_api(host, port):
+    """Serve the asyncio read API (requires uvicorn; asgiref mounts the site too)."""
+    import uvicorn
+    from app.async_api import AsyncAPI
+    try:
+        from asgiref.wsgi import WsgiToAsgi
+    except ImportError:
+        fallback = None
+    else:
+        fallback = WsgiToAsgi(app)
+    uvicorn.run(AsyncAPI(app, fallback), host=host, port=port)
+
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,150 @@
+import gzip
+import itertools
+import json
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+import mongomock
+from bson.objectid import ObjectId
+from app import create_app, db, schema, query_monitor
+from app.models import User
+
+_request_ids = itertools.count()
+
+
+class Event:
+    def __init__(self, command_name, command):
+        self.request_id = next(_request_ids)
+        self.command_name = command_name
+        self.command = command
+        self.duration_micros = 0
+
+
+def _reporting(method, command_name, key):
+    # mongomock sends no command events; report finds the way pymongo's monitoring would.
+    def wrapper(self, filter=None, *args, **kwargs):
+        record = query_monitor.current()
+        if record is not None:
+            event = Event(command_name, {command_name: self.name, key: filter or {}})
+            record.start(event)
+            record.finish(event, True)
+        return method(self, filter, *args, **kwargs)
+
+    return wrapper
+
+
+class APITestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        schema.ensure_indexes(db.database)
+        schema.seed_roles(db.database)
+        for username in ('cat', 'dog', 'fox'):
+            user_id = User(username, username + '@example.com', 'cat', '', '', '').new_user()
+            db.database.User.update_one({'_id': user_id}, {'$set': {'activate': True}})
+        start = datetime(2016, 1, 1)
+        self.post_ids = db.database.Aritical.insert_many([
+            {'username': 'cat', 'body': 'post %d' % i, 'body_html': '<p>post %d</p>' % i, 'comment_count': 0,
+             'issuing_time': start + timedelta(minutes=i)} for i in range(30)]).inserted_ids
+        self.client = self.app.test_client()
+        self.patches = [mock.patch.object(mongomock.collection.Collection, name,
+                                          _reporting(getattr(mongomock.collection.Collection, name), *command))
+                        for name, command in (('find', ('find', 'filter')), ('find_one', ('find', 'filter')))]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def get(self, path, gzipped=False):
+        response = self.client.get(path, headers={'Accept-Encoding': 'gzip' if gzipped else 'identity'})
+        data = response.get_data()
+        response.close()
+        if response.headers.get('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        return response, json.loads(data.decode('utf-8'))
+
+    def ids(self, posts):
+        return ','.join(str(id) for id in posts)
+
+    def queries(self, endpoint):
+        stats = query_monitor.stats().get(endpoint)
+        return stats['queries']['sum'] if stats else 0
+
+    def test_posts_in_requested_order(self):
+        wanted = [self.post_ids[3], ObjectId(), self.post_ids[1]]
+        response, payload = self.get('/api/v1/posts?ids=' + self.ids(wanted))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post['_id'] for post in payload['items']], [str(self.post_ids[3]), str(self.post_ids[1])])
+        self.assertEqual(set(payload['items'][0]), {'_id', 'username', 'issuing_time', 'body_html', 'comment_count'})
+
+    def test_posts_query_count_does_not_grow_with_batch(self):
+        before = self.queries('api.posts')
+        self.get('/api/v1/posts?ids=' + self.ids(self.post_ids[:1]))
+        one = self.queries('api.posts') - before
+        self.get('/api/v1/posts?ids=' + self.ids(self.post_ids))
+        self.assertEqual(self.queries('api.posts') - before - one, one)
+        self.assertEqual(one, 1)
+
+    def test_users_query_count_does_not_grow_with_batch(self):
+        before = self.queries('api.users')
+        self.get('/api/v1/users?usernames=cat')
+        one = self.queries('api.users') - before
+        response, payload = self.get('/api/v1/users?usernames=fox,cat,dog,nobody')
+        self.assertEqual(self.queries('api.users') - before - one, one)
+        self.assertEqual([user['username'] for user in payload['items']], ['fox', 'cat', 'dog'])
+
+    def test_field_selection(self):
+        response, payload = self.get('/api/v1/posts?fields=body&ids=' + self.ids(self.post_ids[:2]))
+        self.assertEqual(set(payload['items'][0]), {'_id', 'body'})
+        response, payload = self.get('/api/v1/users?fields=post_count&usernames=cat')
+        self.assertEqual(set(payload['items'][0]), {'_id', 'username', 'post_count'})
+        response, payload = self.get('/api/v1/users?fields=password&usernames=cat')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', payload['message'])
+
+    def test_gzip_and_streaming(self):
+        response, payload = self.get('/api/v1/posts?ids=' + self.ids(self.post_ids), gzipped=True)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(len(payload['items']), 30)
+        response, payload = self.get('/api/v1/posts?ids=' + self.ids(self.post_ids[:1]))
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(len(payload['items']), 1)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.get('/api/v1/posts?ids=nope')[0].status_code, 400)
+        self.assertEqual(self.get('/api/v1/posts')[0].status_code, 400)
+        self.app.config['API_BATCH_LIMIT'] = 5
+        response, payload = self.get('/api/v1/posts?ids=' + self.ids(self.post_ids[:6]))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('at most 5', payload['message'])
+        self.assertEqual(self.get('/api/v1/post/nope/comments')[0].status_code, 400)
+        self.assertEqual(self.get('/api/v1/post/%s/comments?since=garbage' % self.post_ids[0])[0].status_code, 400)
+
+    def test_following_requires_login(self):
+        self.assertEqual(self.get('/api/v1/following?usernames=dog')[0].status_code, 401)
+        self.client.post('/auth/login', data={'email': 'cat@example.com', 'password': 'cat'})
+        db.follows.follow('cat', 'dog', datetime.utcnow())
+        response, payload = self.get('/api/v1/following?usernames=dog,fox')
+        self.assertEqual(payload['items'], [{'username': 'dog', 'following': True},
+                                            {'username': 'fox', 'following': False}])
+
+    def test_comments_since_cursor(self):
+        post_id = self.post_ids[0]
+        start = datetime(2016, 2, 1)
+        for i in range(5):
+            db.comments.add(post_id, 'dog', 'comment %d' % i, start + timedelta(minutes=i))
+        response, payload = self.get('/api/v1/post/%s/comments?limit=3' % post_id)
+        self.assertEqual([comment['body'] for comment in payload['items']], ['comment 0', 'comment 1', 'comment 2'])
+        response, payload = self.get('/api/v1/post/%s/comments?limit=3&since=%s' % (post_id, payload['next']))
+        self.assertEqual([comment['body'] for comment in payload['items']], ['comment 3', 'comment 4'])
+        since = payload['next']
+        response, payload = self.get('/api/v1/post/%s/comments?since=%s' % (post_id, since))
+        self.assertEqual(payload['items'], [])
+        self.assertEqual(payload['next'], since)
@@ -0,0 +1,62 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, assets
+from app.assets import build
+
+
+class AssetsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        with open(os.path.join(self.source, 'site.css'), 'w') as f:
+            f.write('body { margin: 0; }\n' * 50)
+        with open(os.path.join(self.source, 'logo.png'), 'wb') as f:
+            f.write(b'\x89PNG')
+        self.dist = os.path.join(self.source, 'dist')
+        self.manifest = build(self.source, self.dist)
+        self.app = create_app('testing')
+        self.app.config['ASSETS_DIST_DIR'] = self.dist
+        assets.load()
+        self.context = self.app.test_request_context('/')
+        self.context.push()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.context.pop()
+        shutil.rmtree(self.source)
+
+    def test_build_fingerprints_and_compresses(self):
+        entry = self.manifest['site.css']
+        self.assertRegex(entry['path'], r'^site\.[0-9a-f]{12}\.css$')
+        self.assertIn('gzip', entry['encodings'])
+        self.assertEqual(self.manifest['logo.png']['encodings'], [])
+        self.assertEqual(build(self.source, self.dist), self.manifest)
+
+    def test_url_for_uses_manifest(self):
+        self.assertEqual(assets.url_for('static', filename='site.css'), '/assets/' + self.manifest['site.css']['path'])
+        self.assertEqual(assets.url_for('static', filename='other.css'), '/static/other.css')
+
+    def test_serves_negotiated_encoding(self):
+        url = assets.url('site.css')
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertEqual(gzip.decompress(response.data), b'body { margin: 0; }\n' * 50)
+        response = self.client.get(url, headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(self.client.get('/assets/missing.css').status_code, 404)
+
+    def test_moment_uses_vendored_script(self):
+        os.makedirs(os.path.join(self.source, 'vendor'))
+        with open(os.path.join(self.source, 'vendor', 'moment-with-locales.min.js'), 'w') as f:
+            f.write('// moment\n')
+        manifest = build(self.source, self.dist)
+        assets.load()
+        self.app.config['ASSETS_VENDOR'] = True
+        html = assets.include_moment(self.app.extensions['moment'])
+        self.assertIn('src="/assets/%s"' % manifest['vendor/moment-with-locales.min.js']['path'], html)
+        self.assertNotIn('cdnjs', html)
+        self.assertIn('flask_moment_render', html)
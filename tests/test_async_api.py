@@ -0,0 +1,98 @@
+import asyncio
+import json
+import unittest
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from app import create_app, db, schema, roles, timeline
+from app.async_api import AsyncAPI
+from app.models import User
+
+
+class AsyncAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['MONGO_ASYNC_DRIVER'] = 'threads'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        schema.ensure_indexes(db.database)
+        schema.seed_roles(db.database)
+        self.user_id = User('cat', 'cat@example.com', 'cat', '', '', '').new_user()
+        start = datetime(2016, 1, 1)
+        db.database.Aritical.insert_many([{'username': 'cat', 'body': 'post %d' % i, 'body_html': '<p>post %d</p>' % i,
+                                           'body_html_version': 0, 'comment_count': 0,
+                                           'issuing_time': start + timedelta(minutes=i)} for i in range(3)])
+        self.api = AsyncAPI(self.app)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def cookie(self, user_id):
+        serializer = self.app.session_interface.get_signing_serializer(self.app)
+        token = serializer.dumps({'user_id': str(user_id)})
+        return '%s=%s' % (self.app.config['SESSION_COOKIE_NAME'], token)
+
+    def get(self, path, query='', cookie=None):
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode('ascii'),
+                 'headers': [(b'cookie', cookie.encode('latin-1'))] if cookie else []}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        self.loop.run_until_complete(self.api(scope, receive, send))
+        return messages[0]['status'], json.loads(messages[1]['body'].decode('utf-8'))
+
+    def test_feed(self):
+        status, payload = self.get('/api/feed', 'per_page=2')
+        self.assertEqual(status, 200)
+        self.assertEqual([post['body_html'] for post in payload['posts']], ['<p>post 2</p>', '<p>post 1</p>'])
+        self.assertEqual(payload['pagination']['total'], 3)
+        self.assertTrue(payload['pagination']['has_next'])
+
+    def test_comments_of_missing_or_invalid_post(self):
+        self.assertEqual(self.get('/api/post/%s/comments' % ObjectId())[0], 404)
+        self.assertEqual(self.get('/api/post/not-an-id/comments')[0], 404)
+
+    def test_comments(self):
+        post_id = db.database.Aritical.find_one()['_id']
+        db.database.Comment.insert_one({'post_id': post_id, 'username': 'dog', 'body': 'hi',
+                                        'created_at': datetime(2016, 1, 2)})
+        status, payload = self.get('/api/post/%s/comments' % post_id)
+        self.assertEqual(status, 200)
+        self.assertEqual(payload['pagination']['total'], 1)
+        self.assertEqual(payload['comments'][0]['body'], 'hi')
+        self.assertFalse(payload['can_comment'])
+
+    def test_user_requires_login(self):
+        self.assertEqual(self.get('/api/user/cat')[0], 401)
+        status, payload = self.get('/api/user/cat', cookie=self.cookie(self.user_id))
+        self.assertEqual(status, 200)
+        self.assertEqual(payload['user']['username'], 'cat')
+        self.assertNotIn('email', payload['user'])
+
+    def test_role_changes_are_picked_up(self):
+        self.app.config['ROLE_REFRESH_INTERVAL'] = 1
+        cookie = self.cookie(self.user_id)
+        self.assertNotIn('email', self.get('/api/user/cat', cookie=cookie)[1]['user'])
+        db.database.Role.update_one({'name': 'User'}, {'$set': {'permissions': 0xff}, '$inc': {'version': 1}})
+        roles._checked -= 1
+        self.assertEqual(self.get('/api/user/cat', cookie=cookie)[1]['user']['email'], 'cat@example.com')
+
+    def test_followed_feed_merges_large_accounts(self):
+        self.app.config['FLASKY_FANOUT_LIMIT'] = 0
+        db.follows.follow('dog', 'cat', datetime.utcnow())
+        timeline.rebuild('dog')
+        db.database.User.update_one({'username': 'cat'}, {'$set': {'follower_count': 1}})
+        dog = User('dog', 'dog@example.com', 'dog', '', '', '').new_user()
+        self.assertEqual(self.get('/api/feed', 'followed=1')[0], 401)
+        status, payload = self.get('/api/feed', 'followed=1', cookie=self.cookie(dog))
+        self.assertEqual(status, 200)
+        self.assertEqual(payload['pagination']['total'], 3)
+        self.assertEqual([post['body_html'] for post in payload['posts']],
+                         ['<p>post 2</p>', '<p>post 1</p>', '<p>post 0</p>'])
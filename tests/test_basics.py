@@ -8,11 +8,9 @@ class BasicsTestCase(unittest.TestCase):
         self.app = create_app('testing')
         self.app_context = self.app.app_context()
         self.app_context.push()
-        db.create_all()
 
     def tearDown(self):
-        db.session.remove()
-        db.drop_all()
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
         self.app_context.pop()
 
     def test_app_exists(self):
@@ -0,0 +1,37 @@
+import unittest
+from app import create_app, db
+from app.benchmark import seed, run
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def test_seed_is_deterministic(self):
+        scale = seed(db.database, users=5, posts=2, follows=2, comments=1, seed=7)
+        self.assertEqual(db.database.User.count_documents({}), 5)
+        self.assertEqual(db.database.Aritical.count_documents({}), 10)
+        self.assertEqual(db.database.Comment.count_documents({}), 10)
+        edges = sorted((e['follower'], e['followee']) for e in db.database.Follow.find())
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        seed(db.database, **scale)
+        self.assertEqual(sorted((e['follower'], e['followee']) for e in db.database.Follow.find()), edges)
+
+    def test_seed_refuses_non_empty_database(self):
+        seed(db.database, users=2, posts=1, follows=1, comments=0)
+        with self.assertRaises(RuntimeError):
+            seed(db.database, users=2, posts=1, follows=1, comments=0)
+
+    def test_run_reports_every_scenario(self):
+        scale = seed(db.database, users=4, posts=2, follows=2, comments=1)
+        report = run(self.app, scale, requests=3)
+        for name, result in report['results'].items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertEqual(result['requests'], 3)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
@@ -0,0 +1,57 @@
+import unittest
+from bson.objectid import ObjectId
+from app import create_app, db, schema
+from app.models import User
+
+
+class CommentViewsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        schema.ensure_indexes(db.database)
+        schema.seed_roles(db.database)
+        self.clients = {}
+        for username in ('cat', 'dog'):
+            user_id = User(username, username + '@example.com', 'cat', '', '', '').new_user()
+            db.database.User.update_one({'_id': user_id}, {'$set': {'activate': True}})
+            self.clients[username] = client = self.app.test_client()
+            client.post('/auth/login', data={'email': username + '@example.com', 'password': 'cat'})
+        self.clients['cat'].post('/', data={'body': 'first post'})
+        self.post_id = str(db.database.Aritical.find_one()['_id'])
+        self.clients['dog'].post('/post/' + self.post_id, data={'body': 'a comment'})
+        self.comment_id = str(db.database.Comment.find_one()['_id'])
+
+    def tearDown(self):
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def delete(self, username, comment=None, post_id=None):
+        path = '/delete/%s' % (post_id or self.post_id)
+        if comment is not None:
+            path += '?comment=' + comment
+        response = self.clients[username].get(path)
+        response.close()
+        return response.status_code
+
+    def comment_count(self):
+        return db.database.Aritical.find_one()['comment_count']
+
+    def test_author_deletes_comment(self):
+        self.assertEqual(self.comment_count(), 1)
+        self.assertEqual(self.delete('cat', self.comment_id), 302)
+        self.assertEqual(db.database.Comment.count_documents({}), 0)
+        self.assertEqual(self.comment_count(), 0)
+        self.assertEqual(self.delete('cat', self.comment_id), 302)
+        self.assertEqual(self.comment_count(), 0)
+
+    def test_other_users_may_not_delete(self):
+        self.assertEqual(self.delete('dog', self.comment_id), 403)
+        self.assertEqual(db.database.Comment.count_documents({}), 1)
+
+    def test_invalid_ids_are_not_found(self):
+        self.assertEqual(self.delete('cat'), 404)
+        self.assertEqual(self.delete('cat', 'not-an-id'), 404)
+        self.assertEqual(self.delete('cat', self.comment_id, post_id='not-an-id'), 404)
+        self.assertEqual(self.delete('cat', self.comment_id, post_id=str(ObjectId())), 404)
+        self.assertEqual(self.comment_count(), 1)
@@ -0,0 +1,88 @@
+import unittest
+from unittest import mock
+from app import create_app, db, schema
+from app.email import MailQueue, MailJob, mail_queue
+from app.models import User
+
+
+class BrokenJob(MailJob):
+    def render(self, app):
+        raise ValueError('cannot render')
+
+
+class MailQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config.update(MAIL_WORKERS=1, MAIL_RETRY_BACKOFF=0, MAIL_IDLE_TIMEOUT=0.1)
+        self.queue = MailQueue(self.app)
+
+    def tearDown(self):
+        self.queue.stop()
+
+    def job(self, to='cat@example.com'):
+        return MailJob(to, 'Confirm Your Account', 'auth/email/confirm', 'http://example.com/',
+                       {'user': {'username': 'cat'}, 'token': 'abc'})
+
+    def test_queue_sends_through_backend(self):
+        for i in range(3):
+            self.queue.put(self.job('user%d@example.com' % i))
+        self.queue.join()
+        outbox = self.queue.backend.outbox
+        self.assertEqual([msg.recipients for msg in outbox],
+                         [['user0@example.com'], ['user1@example.com'], ['user2@example.com']])
+        self.assertIn('http://example.com/auth/confirm/abc', outbox[0].body)
+        self.assertTrue(outbox[0].subject.endswith('Confirm Your Account'))
+        stats = self.queue.stats()
+        self.assertEqual((stats['enqueued'], stats['sent'], stats['failed'], stats['queue_depth']), (3, 3, 0, 0))
+
+    def test_backend_failure_does_not_kill_the_worker(self):
+        self.app.config['MAIL_MAX_RETRIES'] = 1
+        with mock.patch.object(self.queue.backend, 'send', side_effect=IOError('connection reset')):
+            self.queue.put(self.job())
+            self.queue.join()
+        self.queue.put(BrokenJob('fox@example.com', '', '', None, {}))
+        self.queue.put(self.job('dog@example.com'))
+        self.queue.join()
+        self.assertEqual([msg.recipients for msg in self.queue.backend.outbox], [['dog@example.com']])
+        self.assertTrue(all(worker.is_alive() for worker in self.queue._workers))
+        stats = self.queue.stats()
+        self.assertEqual((stats['sent'], stats['failed'], stats['retried']), (1, 2, 1))
+
+    def test_exit_hook_registered_once(self):
+        queue = MailQueue()
+        with mock.patch('atexit.register') as register:
+            for i in range(3):
+                queue.init_app(self.app)
+        register.assert_called_once_with(queue.stop)
+
+
+class MailViewsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        schema.ensure_indexes(db.database)
+        schema.seed_roles(db.database)
+        User('cat', 'cat@example.com', 'cat', '', '', '').new_user()
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'email': 'cat@example.com', 'password': 'cat'})
+
+    def tearDown(self):
+        mail_queue.stop()
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def sent(self):
+        mail_queue.join()
+        outbox, mail_queue.backend.outbox = mail_queue.backend.outbox, []
+        return outbox
+
+    def test_queued_mail_is_addressed_to_the_logged_in_user(self):
+        self.client.get('/auth/confirm')
+        msg, = self.sent()
+        self.assertEqual(msg.recipients, ['cat@example.com'])
+        self.assertTrue(msg.body.startswith('Dear cat,'))
+        self.client.post('/auth/change_email_request', data={'email': 'kitten@example.com'})
+        msg, = self.sent()
+        self.assertEqual(msg.recipients, ['kitten@example.com'])
+        self.assertTrue(msg.body.startswith('亲爱的 cat,'))
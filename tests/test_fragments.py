@@ -0,0 +1,41 @@
+import unittest
+from datetime import datetime
+from bson.objectid import ObjectId
+from app import create_app, fragments
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.context = self.app.test_request_context('/')
+        self.context.push()
+        fragments.cache.clear()
+        self.post = {'_id': ObjectId(), 'username': 'cat', 'user_id': 'x', 'issuing_time': datetime(2016, 1, 1),
+                     'body_html': '<p>hello</p>', 'body_html_version': 1, 'comment_count': 2}
+
+    def tearDown(self):
+        self.context.pop()
+
+    def test_reuses_rendered_card(self):
+        first = fragments.post_card(self.post)
+        hits = fragments.cache.hits
+        self.assertEqual(fragments.post_card(dict(self.post)), first)
+        self.assertEqual(fragments.cache.hits, hits + 1)
+        self.assertIn('<p>hello</p>', first)
+        self.assertIn('2 评论', first)
+
+    def test_version_and_comment_count_change_key(self):
+        fragments.post_card(self.post)
+        edited = fragments.post_card(dict(self.post, version=1, body_html='<p>edited</p>'))
+        self.assertIn('edited', edited)
+        self.assertIn('3 评论', fragments.post_card(dict(self.post, comment_count=3)))
+        self.assertEqual(len(fragments.cache), 3)
+
+    def test_anonymous_viewer_gets_no_edit_link(self):
+        self.assertEqual(fragments.viewer(self.post), 'anonymous')
+        self.assertNotIn('/edit/', fragments.post_card(self.post))
+
+    def test_disabled(self):
+        self.app.config['FRAGMENT_CACHE_ENABLED'] = False
+        fragments.post_card(self.post)
+        self.assertEqual(len(fragments.cache), 0)
@@ -0,0 +1,44 @@
+import unittest
+from datetime import datetime
+from bson.objectid import ObjectId
+from app.metrics import shape, describe, Histogram, RequestRecord
+
+
+class Event:
+    def __init__(self, request_id, command_name, command, duration_micros=1000):
+        self.request_id = request_id
+        self.command_name = command_name
+        self.command = command
+        self.duration_micros = duration_micros
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_shape_ignores_values(self):
+        self.assertEqual(shape({'username': 'a', 'follower_count': {'$gt': 3}}),
+                         shape({'follower_count': {'$gt': 10}, 'username': 'b'}))
+        self.assertNotEqual(shape({'_id': ObjectId()}), shape({'_id': 'name'}))
+
+    def test_describe(self):
+        self.assertEqual(describe('find', {'find': 'User', 'filter': {'_id': ObjectId()}}),
+                         ('User', '{_id: ObjectId}'))
+        self.assertEqual(describe('update', {'update': 'Aritical', 'updates': [{'q': {'_id': 1}, 'u': {}}]}),
+                         ('Aritical', '[{_id: int}]'))
+        self.assertEqual(describe('getMore', {'getMore': 1, 'collection': 'Comment'}), ('Comment', ''))
+
+    def test_repeated_shapes(self):
+        record = RequestRecord()
+        for i in range(6):
+            record.start(Event(i, 'find', {'find': 'User', 'filter': {'username': 'user%d' % i}}))
+            record.finish(Event(i, 'find', {}), True)
+        record.start(Event(9, 'find', {'find': 'Aritical', 'filter': {'issuing_time': datetime.utcnow()}}))
+        record.finish(Event(9, 'find', {}), True)
+        self.assertEqual(len(record.commands), 7)
+        self.assertAlmostEqual(record.mongo_ms, 7.0)
+        self.assertEqual(record.repeats(5), [(('find', 'User', '{username: str}'), 6)])
+
+    def test_histogram(self):
+        histogram = Histogram([1, 5])
+        for value in (0, 1, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.to_dict()['buckets'], {'le_1': 2, 'le_5': 1, 'inf': 1})
+        self.assertEqual(histogram.count, 4)
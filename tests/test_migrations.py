@@ -0,0 +1,134 @@
+import unittest
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from app import create_app, db, migrations, timeline
+
+
+class MigrationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.start = datetime(2016, 1, 1)
+
+    def tearDown(self):
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def comments(self, post_id):
+        return [(comment['body'], comment['username'], comment['created_at'])
+                for comment in db.comments.paginate(post_id, 1, 50).items]
+
+    def test_migrate_comments(self):
+        embedded = [['first', 'dog', self.start + timedelta(minutes=2)],
+                    ['second', 'fox', self.start + timedelta(minutes=1)],
+                    ['third', 'dog', self.start + timedelta(minutes=3)]]
+        post_id = db.database.Aritical.insert_one({'username': 'cat', 'comments': embedded}).inserted_id
+        empty_id = db.database.Aritical.insert_one({'username': 'cat', 'comments': []}).inserted_id
+        plain_id = db.database.Aritical.insert_one({'username': 'cat', 'comment_count': 0}).inserted_id
+        self.assertEqual(migrations.migrate_comments(batch_size=2), 3)
+        self.assertEqual(self.comments(post_id), [('second', 'fox', self.start + timedelta(minutes=1)),
+                                                  ('first', 'dog', self.start + timedelta(minutes=2)),
+                                                  ('third', 'dog', self.start + timedelta(minutes=3))])
+        post = db.database.Aritical.find_one({'_id': post_id})
+        self.assertNotIn('comments', post)
+        self.assertEqual(post['comment_count'], 3)
+        self.assertNotIn('comments', db.database.Aritical.find_one({'_id': empty_id}))
+        self.assertEqual(db.database.Aritical.find_one({'_id': plain_id})['comment_count'], 0)
+
+    def test_migrate_comments_is_idempotent(self):
+        embedded = [['body %d' % i, 'dog', self.start + timedelta(minutes=i)] for i in range(5)]
+        post_id = db.database.Aritical.insert_one({'username': 'cat', 'comments': embedded}).inserted_id
+        migrations.migrate_comments(batch_size=2)
+        self.assertEqual(migrations.migrate_comments(batch_size=2), 0)
+        self.assertEqual(db.database.Comment.count_documents({'post_id': post_id}), 5)
+        self.assertEqual(db.database.Aritical.find_one({'_id': post_id})['comment_count'], 5)
+
+    def test_migrate_comments_resumes_after_an_interrupted_run(self):
+        embedded = [['body %d' % i, 'dog', self.start + timedelta(minutes=i)] for i in range(3)]
+        post_id = db.database.Aritical.insert_one({'username': 'cat', 'comments': embedded}).inserted_id
+        # A run that died after writing the comments but before unsetting the array.
+        db.database.Comment.insert_one({'post_id': post_id, 'username': 'dog', 'body': 'body 0',
+                                        'created_at': self.start})
+        migrations.migrate_comments()
+        self.assertEqual([comment[0] for comment in self.comments(post_id)], ['body 0', 'body 1', 'body 2'])
+        self.assertEqual(db.database.Aritical.find_one({'_id': post_id})['comment_count'], 3)
+
+    def edges(self):
+        return sorted((edge['follower'], edge['followee'], edge['timestamp'])
+                      for edge in db.database.Follow.find())
+
+    def counts(self, username):
+        user = db.database.User.find_one({'username': username})
+        return user.get('follower_count'), user.get('following_count')
+
+    def test_migrate_follows(self):
+        db.database.User.insert_many([
+            {'username': 'cat', 'following': [['dog', self.start], ['fox', self.start + timedelta(minutes=1)]],
+             'followers': [['dog', self.start]]},
+            {'username': 'dog', 'following': [['cat', self.start]], 'followers': [['cat', self.start]]},
+            {'username': 'fox', 'following': [], 'followers': [['cat', self.start + timedelta(minutes=1)]]}])
+        self.assertEqual(migrations.migrate_follows(batch_size=2), 3)
+        self.assertEqual(self.edges(), [('cat', 'dog', self.start),
+                                        ('cat', 'fox', self.start + timedelta(minutes=1)),
+                                        ('dog', 'cat', self.start)])
+        self.assertEqual(self.counts('cat'), (1, 2))
+        self.assertEqual(self.counts('dog'), (1, 1))
+        self.assertEqual(self.counts('fox'), (1, 0))
+        for user in db.database.User.find():
+            self.assertNotIn('following', user)
+            self.assertNotIn('followers', user)
+
+    def test_migrate_follows_rerun_creates_no_duplicates(self):
+        db.database.User.insert_many([{'username': 'cat', 'following': [['dog', self.start]]},
+                                      {'username': 'dog'}])
+        migrations.migrate_follows()
+        # An array restored from a backup after the first run.
+        db.database.User.update_one({'username': 'cat'}, {'$set': {'following': [['dog', self.start],
+                                                                                 ['dog', self.start]]}})
+        self.assertEqual(migrations.migrate_follows(), 1)
+        self.assertEqual(self.edges(), [('cat', 'dog', self.start)])
+        self.assertEqual(self.counts('dog'), (1, 0))
+        with self.assertRaises(DuplicateKeyError):
+            db.database.Follow.insert_one({'follower': 'cat', 'followee': 'dog', 'timestamp': self.start})
+
+    def test_migrate_follows_builds_timelines(self):
+        self.app.config['FLASKY_FANOUT_LIMIT'] = 1
+        db.database.User.insert_many([
+            {'username': 'cat', 'email': 'cat@example.com', 'following': [['dog', self.start], ['fox', self.start]]},
+            {'username': 'dog', 'email': 'dog@example.com', 'following': [['fox', self.start]]},
+            {'username': 'fox', 'email': 'fox@example.com'}])
+        for i, username in enumerate(('dog', 'fox', 'dog')):
+            db.database.Aritical.insert_one({'username': username, 'body_html': '%s %d' % (username, i),
+                                             'issuing_time': self.start + timedelta(minutes=i)})
+        migrations.migrate_follows()
+        total, posts = timeline.read('cat', 0, 10)
+        self.assertEqual((total, [post['body_html'] for post in posts]), (3, ['dog 2', 'fox 1', 'dog 0']))
+        # fox has two followers, so it is merged on read rather than pushed.
+        self.assertEqual([entry['username'] for entry in db.database.Timeline.find_one({'_id': 'cat'})['posts']],
+                         ['dog', 'dog'])
+        self.assertEqual(timeline.read('dog', 0, 10)[0], 1)
+
+    def test_reconcile_counters_repairs_drift(self):
+        db.database.User.insert_many([
+            {'username': 'cat', 'post_count': 5, 'follower_count': 0, 'following_count': 1},
+            {'username': 'dog', 'post_count': 0, 'follower_count': 1, 'following_count': 0},
+            {'username': 'fox'}])
+        post_ids = db.database.Aritical.insert_many([{'username': 'cat', 'comment_count': 0},
+                                                     {'username': 'cat', 'comment_count': 7},
+                                                     {'username': 'dog', 'comment_count': 1}]).inserted_ids
+        db.database.Follow.insert_many([{'follower': 'dog', 'followee': 'cat', 'timestamp': self.start},
+                                        {'follower': 'fox', 'followee': 'cat', 'timestamp': self.start}])
+        for post_id in post_ids[:2]:
+            db.database.Comment.insert_one({'post_id': post_id, 'username': 'dog', 'body': 'hi',
+                                            'created_at': self.start})
+        self.assertEqual(migrations.reconcile_counters(batch_size=2),
+                         {'post_count': 3, 'follower_count': 3, 'following_count': 3, 'comment_count': 3})
+        self.assertEqual([db.database.User.find_one({'username': username}, {'_id': False}) for username in
+                          ('cat', 'dog', 'fox')],
+                         [{'username': 'cat', 'post_count': 2, 'follower_count': 2, 'following_count': 0},
+                          {'username': 'dog', 'post_count': 1, 'follower_count': 0, 'following_count': 1},
+                          {'username': 'fox', 'post_count': 0, 'follower_count': 0, 'following_count': 1}])
+        self.assertEqual([post['comment_count'] for post in db.database.Aritical.find().sort('_id', 1)], [1, 1, 0])
+        self.assertEqual(migrations.reconcile_counters(),
+                         {'post_count': 0, 'follower_count': 0, 'following_count': 0, 'comment_count': 0})
@@ -0,0 +1,99 @@
+import unittest
+from unittest import mock
+from flask import Flask
+from app import create_app, db, schema
+from app.models import User
+from app.page_cache import PageCache
+
+
+class PageCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.cache = PageCache(self.app)
+
+    def test_bump_changes_only_named_scopes(self):
+        backend = self.cache.backend
+        self.assertEqual(backend.versions(['posts', 'post:1']), [0, 0])
+        self.cache.bump('post:1')
+        posts, post = backend.versions(['posts', 'post:1'])
+        self.assertEqual(posts, 0)
+        self.assertGreater(post, 0)
+
+    def test_memory_backend_stores_pages(self):
+        backend = self.cache.backend
+        self.assertIsNone(backend.get('/|'))
+        backend.set('/|', {'etag': 'abc', 'body': '<html></html>'})
+        self.assertEqual(backend.get('/|')['etag'], 'abc')
+
+    def test_memory_validators_expire_with_ttl(self):
+        backend = self.cache.backend
+        with mock.patch('time.time', return_value=1000.0):
+            first = backend.window()
+        with mock.patch('time.time', return_value=1000.0 + self.app.config['PAGE_CACHE_TTL']):
+            self.assertGreater(backend.window(), first)
+
+
+class PageCacheViewTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        schema.ensure_indexes(db.database)
+        schema.seed_roles(db.database)
+        user_id = User('cat', 'cat@example.com', 'cat', '', '', '').new_user()
+        db.database.User.update_one({'_id': user_id}, {'$set': {'activate': True}})
+        self.author = self.app.test_client()
+        self.author.post('/auth/login', data={'email': 'cat@example.com', 'password': 'cat'})
+        self.author.post('/', data={'body': 'first post'})
+        self.post_id = str(db.database.Aritical.find_one()['_id'])
+        self.anonymous = self.app.test_client()
+
+    def tearDown(self):
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def get(self, path, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        response = self.anonymous.get(path, headers=headers)
+        body = response.get_data(as_text=True)
+        response.close()
+        return response.status_code, response.headers.get('ETag'), body
+
+    def test_unchanged_page_is_not_modified(self):
+        status, etag, body = self.get('/')
+        self.assertEqual(status, 200)
+        self.assertEqual(self.get('/', etag)[0], 304)
+
+    def test_new_post_changes_index_etag(self):
+        status, etag, body = self.get('/')
+        self.author.post('/', data={'body': 'second post'})
+        status, new_etag, body = self.get('/', etag)
+        self.assertEqual(status, 200)
+        self.assertNotEqual(new_etag, etag)
+        self.assertIn('second post', body)
+
+    def test_comment_changes_post_etag(self):
+        path = '/post/' + self.post_id
+        status, etag, body = self.get(path)
+        self.author.post(path, data={'body': 'a comment'})
+        status, new_etag, body = self.get(path, etag)
+        self.assertEqual(status, 200)
+        self.assertNotEqual(new_etag, etag)
+        self.assertIn('a comment', body)
+
+    def test_logged_in_pages_are_not_cached(self):
+        response = self.author.get('/')
+        response.close()
+        self.assertNotIn('ETag', response.headers)
+
+    def test_only_author_sees_comment_delete_links(self):
+        path = '/post/' + self.post_id
+        self.author.post(path, data={'body': 'a comment'})
+        status, etag, body = self.get(path)
+        self.assertIn('a comment', body)
+        self.assertNotIn('/delete/', body)
+        # The cached page and fragments must not carry a link either.
+        self.assertNotIn('/delete/', self.get(path)[2])
+        response = self.author.get(path)
+        self.assertIn('/delete/' + self.post_id, response.get_data(as_text=True))
+        response.close()
@@ -0,0 +1,39 @@
+import unittest
+from datetime import datetime
+from bson.objectid import ObjectId
+from app.pagination import Pagination, encode_cursor, decode_cursor
+
+
+class PaginationTestCase(unittest.TestCase):
+    def test_page_counts(self):
+        p = Pagination(1, 20, 41, [])
+        self.assertEqual(p.pages, 3)
+        self.assertFalse(p.has_prev)
+        self.assertTrue(p.has_next)
+        p = Pagination(3, 20, 41, [])
+        self.assertTrue(p.has_prev)
+        self.assertFalse(p.has_next)
+
+    def test_empty(self):
+        p = Pagination(1, 20, 0, [])
+        self.assertEqual(p.pages, 0)
+        self.assertFalse(p.has_next)
+        self.assertEqual(list(p.iter_pages()), [])
+
+    def test_from_list(self):
+        p = Pagination.from_list(2, 3, list(range(8)))
+        self.assertEqual(p.items, [3, 4, 5])
+        self.assertEqual(p.total, 8)
+
+    def test_iter_pages_gaps(self):
+        p = Pagination(10, 1, 20, [])
+        self.assertEqual(list(p.iter_pages()), [1, 2, None, 8, 9, 10, 11, 12, 13, 14, None, 19, 20])
+
+    def test_cursor_round_trip(self):
+        document = {'_id': ObjectId(), 'issuing_time': datetime(2016, 8, 1, 12, 30, 5, 123000)}
+        token = encode_cursor(4, 'next', document)
+        self.assertEqual(decode_cursor(token), (4, 'next', document['issuing_time'], document['_id']))
+
+    def test_bad_cursor(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        self.assertIsNone(decode_cursor(''))
@@ -0,0 +1,42 @@
+import unittest
+from flask import Flask
+from app.passwords import PasswordHasher, PasswordHasherBusy
+
+
+class PasswordHasherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['PASSWORD_HASH_ITERATIONS'] = 1000
+        self.app.config['PASSWORD_POOL_SIZE'] = 0
+        self.hasher = PasswordHasher(self.app)
+
+    def test_hash_and_verify(self):
+        stored = self.hasher.hash('cat')
+        self.assertTrue(stored.startswith('pbkdf2:sha256:1000$'))
+        self.assertTrue(self.hasher.verify(stored, 'cat'))
+        self.assertFalse(self.hasher.verify(stored, 'dog'))
+
+    def test_needs_rehash_when_cost_changes(self):
+        stored = self.hasher.hash('cat')
+        self.assertFalse(self.hasher.needs_rehash(stored))
+        self.app.config['PASSWORD_HASH_ITERATIONS'] = 2000
+        self.assertTrue(self.hasher.needs_rehash(stored))
+
+    def test_pool(self):
+        self.app.config['PASSWORD_POOL_SIZE'] = 1
+        try:
+            self.assertTrue(self.hasher.verify(self.hasher.hash('cat'), 'cat'))
+        finally:
+            self.hasher.shutdown()
+
+    def test_saturated_pool_rejects(self):
+        self.app.config['PASSWORD_POOL_SIZE'] = 1
+        self.app.config['PASSWORD_POOL_QUEUE'] = 1
+        try:
+            self.hasher._ensure_pool()
+            self.hasher._slots.acquire()
+            with self.assertRaises(PasswordHasherBusy):
+                self.hasher.hash('cat')
+            self.assertEqual(self.hasher.rejected, 1)
+        finally:
+            self.hasher.shutdown()
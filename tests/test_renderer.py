@@ -0,0 +1,72 @@
+import importlib
+import unittest
+from unittest import mock
+from app import create_app, db, renderer
+from app.renderer import POLICY_VERSION, render_body
+
+# `app.renderer` is the Renderer instance; the module is shadowed by it.
+renderer_module = importlib.import_module('app.renderer')
+
+
+class RendererTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        renderer.cache.clear()
+
+    def tearDown(self):
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def test_render_body(self):
+        html = render_body('**bold** <script>alert(1)</script> http://example.com')
+        self.assertIn('<strong>bold</strong>', html)
+        self.assertNotIn('<script>', html)
+        self.assertIn('<a href="http://example.com" rel="nofollow">http://example.com</a>', html)
+
+    def test_render_is_cached_per_policy_version(self):
+        with mock.patch.object(renderer_module, 'render_body', wraps=render_body) as render:
+            first = renderer.render('*hello*')
+            self.assertEqual(renderer.render('*hello*'), first)
+            self.assertEqual(render.call_count, 1)
+            renderer.render('*other*')
+            self.assertEqual(render.call_count, 2)
+            with mock.patch.object(renderer_module, 'POLICY_VERSION', POLICY_VERSION + 1):
+                self.assertEqual(renderer.render('*hello*'), first)
+            self.assertEqual(render.call_count, 3)
+
+    def test_rerender_all(self):
+        collection = db.articles.collection
+        stale = collection.insert_many([{'body': 'post *%d*' % i, 'body_html': 'old', 'body_html_version': 0}
+                                        for i in range(9)]).inserted_ids
+        collection.insert_one({'body': 'current', 'body_html': 'kept', 'body_html_version': POLICY_VERSION})
+        collection.insert_one({'body_html': 'legacy'})
+        self.assertEqual(renderer.rerender_all(collection, processes=1, batch_size=2), 10)
+        self.assertEqual(collection.find_one({'_id': stale[4]})['body_html'], '<p>post <em>4</em></p>')
+        self.assertEqual(collection.find_one({'body': 'current'})['body_html'], 'kept')
+        self.assertEqual(collection.find_one({'body': {'$exists': False}})['body_html'], '')
+        self.assertEqual(collection.count_documents({'body_html_version': POLICY_VERSION}), 11)
+        self.assertEqual(renderer.rerender_all(collection, processes=1, batch_size=2), 0)
+
+    def test_rerender_all_reads_the_cursor_one_window_at_a_time(self):
+        collection = db.articles.collection
+        collection.insert_many([{'body': 'post %d' % i, 'body_html_version': 0} for i in range(20)])
+        read = []
+        written = []
+        find = collection.find
+
+        def counting_find(*args, **kwargs):
+            for article in find(*args, **kwargs):
+                read.append(article['_id'])
+                yield article
+
+        def recording_bulk_write(ops, **kwargs):
+            written.append(len(read))
+            return type(collection).bulk_write(collection, ops, **kwargs)
+
+        with mock.patch.object(collection, 'find', counting_find), \
+                mock.patch.object(collection, 'bulk_write', recording_bulk_write):
+            self.assertEqual(renderer.rerender_all(collection, processes=1, batch_size=2), 20)
+        # One process renders a window of two batches (four articles) at a time.
+        self.assertEqual(written[:4], [4, 4, 8, 8])
@@ -0,0 +1,49 @@
+import unittest
+from app import create_app, db, schema, roles
+from app.models import User, UserDocument
+from app.roles import Permission
+
+
+class RoleRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        schema.ensure_indexes(db.database)
+        schema.seed_roles(db.database)
+
+    def tearDown(self):
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def test_lookup(self):
+        self.assertEqual(roles.names(), ['Administrator', 'Moderator', 'User'])
+        self.assertEqual(roles.default().name, 'User')
+        self.assertTrue(roles.get('Moderator').can(Permission.MODERATE_COMMENTS))
+        self.assertFalse(roles.get('User').can(Permission.MODERATE_COMMENTS))
+        self.assertIsNone(roles.get('Nobody'))
+        with self.assertRaises(TypeError):
+            roles._table()['User'] = None
+
+    def test_permission_checks_do_not_reload(self):
+        u = UserDocument.get(User('cat', 'cat@example.com', 'cat', '', '', '').new_user())
+        loads = roles.loads
+        db.database.Role.drop()
+        self.assertTrue(u.can(Permission.WRITE_ARTICLES))
+        self.assertFalse(u.is_administrator())
+        self.assertEqual(roles.loads, loads)
+
+    def test_version_bump_reloads(self):
+        self.app.config['ROLE_REFRESH_INTERVAL'] = 1
+        roles.get('User')
+        version = roles.version
+        db.database.Role.update_one({'name': 'User'}, {'$set': {'permissions': Permission.FOLLOW}})
+        roles._checked = 0
+        roles._refresh()
+        self.assertTrue(roles.get('User').can(Permission.COMMENT))
+        schema.seed_roles(db.database)
+        db.database.Role.update_one({'name': 'User'}, {'$set': {'permissions': Permission.FOLLOW}})
+        roles._checked = 0
+        roles._refresh()
+        self.assertGreater(roles.version, version)
+        self.assertFalse(roles.get('User').can(Permission.COMMENT))
@@ -0,0 +1,86 @@
+import unittest
+from unittest import mock
+import mongomock
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from app import create_app, db, schema
+from app.models import Permission
+
+
+def _explain(stages):
+    # mongomock cannot explain; build the winning plan a server would return.
+    def explain(cursor):
+        plan = {'stage': 'FETCH', 'inputStage': {'stage': stages(cursor.collection.name)}}
+        return {'queryPlanner': {'winningPlan': {'stage': 'SORT', 'inputStage': plan}}}
+
+    return explain
+
+
+class SchemaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.database = db.database
+
+    def tearDown(self):
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def test_ensure_indexes(self):
+        self.assertEqual(schema.ensure_indexes(self.database), [])
+        for name, indexes in schema.INDEXES.items():
+            information = self.database[name].index_information()
+            for index in indexes:
+                self.assertIn(index.document['name'], information)
+        self.assertTrue(self.database.Follow.index_information()['follower_followee'].get('unique'))
+        self.assertEqual(schema.ensure_indexes(self.database), [])
+        self.database.User.insert_one({'username': 'cat', 'email': 'cat@example.com'})
+        with self.assertRaises(DuplicateKeyError):
+            self.database.User.insert_one({'username': 'cat', 'email': 'dog@example.com'})
+
+    def test_ensure_indexes_reports_failures(self):
+        create_indexes = mongomock.collection.Collection.create_indexes
+
+        def failing(collection, indexes, *args, **kwargs):
+            if collection.name == 'Follow':
+                raise OperationFailure('Index with name: follower_followee already exists with different options')
+            return create_indexes(collection, indexes, *args, **kwargs)
+
+        with mock.patch.object(mongomock.collection.Collection, 'create_indexes', failing):
+            failures = schema.ensure_indexes(self.database, ['Comment', 'Follow'])
+        self.assertEqual([name for name, error in failures], ['Follow'])
+        self.assertIn('already exists', failures[0][1])
+        self.assertIn('post_created_at', self.database.Comment.index_information())
+
+    def test_seed_roles_is_idempotent_and_bumps_version(self):
+        schema.seed_roles(self.database)
+        roles = dict((role['name'], role) for role in self.database.Role.find())
+        self.assertEqual(set(roles), set(schema.ROLES))
+        self.assertTrue(roles['User']['default'])
+        self.assertEqual(roles['Moderator']['permissions'] & Permission.MODERATE_COMMENTS,
+                         Permission.MODERATE_COMMENTS)
+        self.assertEqual(roles['Administrator']['permissions'], 0xff)
+        self.database.Role.update_one({'name': 'User'}, {'$set': {'permissions': 0}})
+        schema.seed_roles(self.database)
+        self.assertEqual(self.database.Role.count_documents({}), 3)
+        user = self.database.Role.find_one({'name': 'User'})
+        self.assertEqual(user['permissions'], schema.ROLES['User'][0])
+        self.assertEqual(user['version'], roles['User']['version'] + 1)
+        self.assertEqual(db.roles.latest_version(), 2)
+
+    def test_check_queries_reports_collection_scans(self):
+        def scanned(name):
+            return 'COLLSCAN' if name == 'Comment' else 'IXSCAN'
+
+        with mock.patch.object(mongomock.collection.Cursor, 'explain', _explain(scanned), create=True):
+            scans = schema.check_queries(self.database)
+        self.assertEqual(scans, [query for query in schema.QUERIES if query[0] == 'Comment'])
+        self.assertEqual(len(scans), 2)
+        with mock.patch.object(mongomock.collection.Cursor, 'explain', _explain(lambda name: 'IXSCAN'), create=True):
+            self.assertEqual(schema.check_queries(self.database), [])
+
+    def test_stages_walks_nested_plans(self):
+        plan = {'stage': 'OR', 'inputStages': [{'stage': 'IXSCAN'},
+                                               {'stage': 'FETCH', 'inputStage': {'stage': 'COLLSCAN'}}]}
+        self.assertEqual(list(schema._stages({'stage': 'SUBPLAN', 'inputStage': plan})),
+                         ['SUBPLAN', 'OR', 'IXSCAN', 'FETCH', 'COLLSCAN'])
@@ -0,0 +1,102 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from app import create_app, db, schema, search, page_cache
+from app.search import tokenize, query_terms
+
+
+class TokenizeTestCase(unittest.TestCase):
+    def test_words_are_lowercased(self):
+        self.assertEqual(list(tokenize('Hello Flask_App')), ['hello', 'flask_app'])
+
+    def test_cjk_runs_give_characters_and_bigrams(self):
+        self.assertEqual(list(tokenize('数据库')), ['数', '数据', '据', '据库', '库'])
+
+    def test_mixed_text(self):
+        self.assertEqual(list(tokenize('用Flask')), ['用', 'flask'])
+
+    def test_query_uses_bigrams_for_longer_cjk_runs(self):
+        self.assertEqual(query_terms('数据库 Flask'), ['flask', '据库', '数据'])
+        self.assertEqual(query_terms('库'), ['库'])
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        schema.ensure_indexes(db.database)
+        search.results.clear()
+        search.frequencies.clear()
+        self.start = datetime(2016, 1, 1)
+        self.minute = 0
+
+    def tearDown(self):
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def post(self, username, body, indexed=True):
+        self.minute += 1
+        post = {'username': username, 'body': body, 'body_html': body,
+                'issuing_time': self.start + timedelta(minutes=self.minute)}
+        post['_id'] = db.articles.create(post)
+        if indexed:
+            search.index(post)
+        return post['_id']
+
+    def bodies(self, text, page=1, per_page=10):
+        total, posts = search.search(text, page, per_page)
+        return total, [post['body_html'] for post in posts]
+
+    def test_index_and_rank(self):
+        self.post('cat', 'flask and mongo')
+        self.post('dog', 'flask flask flask mongo')
+        self.post('fox', 'only mongo here')
+        self.post('flask', 'nothing else')
+        self.assertEqual(self.bodies('Flask'), (3, ['nothing else', 'flask flask flask mongo', 'flask and mongo']))
+        self.assertEqual(self.bodies('flask mongo'), (2, ['flask flask flask mongo', 'flask and mongo']))
+        self.assertEqual(self.bodies('数据库'), (0, []))
+        self.assertEqual(self.bodies('   '), (0, []))
+
+    def test_paging(self):
+        for i in range(5):
+            self.post('cat', 'word %d' % i)
+        self.assertEqual(self.bodies('word', per_page=2), (5, ['word 4', 'word 3']))
+        self.assertEqual(self.bodies('word', page=3, per_page=2), (5, ['word 0']))
+        self.assertEqual(self.bodies('word', page=4, per_page=2), (5, []))
+
+    def test_cached_results_follow_index_writes(self):
+        self.post('cat', 'mongo one')
+        self.assertEqual(self.bodies('mongo')[0], 1)
+        # Another worker indexes a post: its own caches are the only ones it clears.
+        post_id = self.post('dog', 'mongo two', indexed=False)
+        db.database.SearchIndex.replace_one({'_id': post_id}, search._document(db.articles.get(post_id)),
+                                            upsert=True)
+        self.assertEqual(self.bodies('mongo')[0], 1)
+        page_cache.bump('search')
+        self.assertEqual(self.bodies('mongo'), (2, ['mongo two', 'mongo one']))
+
+    def test_term_frequencies_are_cached(self):
+        self.post('cat', 'mongo flask')
+        counted = []
+        count_documents = db.database.SearchIndex.count_documents
+
+        def counting(filter, *args, **kwargs):
+            counted.append(filter.get('terms'))
+            return count_documents(filter, *args, **kwargs)
+
+        with mock.patch.object(db.database.SearchIndex, 'count_documents', counting):
+            search.search('mongo flask', 1, 10)
+            self.post('dog', 'mongo')
+            self.assertEqual(self.bodies('mongo flask')[0], 1)
+            self.assertEqual(self.bodies('mongo')[0], 2)
+        self.assertEqual(sorted(term for term in counted if term), ['flask', 'mongo'])
+
+    def test_rebuild(self):
+        kept = self.post('cat', 'kept post', indexed=False)
+        gone = self.post('dog', 'gone post')
+        db.database.Aritical.delete_one({'_id': gone})
+        self.assertEqual(self.bodies('post'), (1, []))
+        self.assertEqual(search.rebuild(batch_size=1), 1)
+        self.assertEqual(self.bodies('post'), (1, ['kept post']))
+        self.assertEqual([entry['_id'] for entry in db.database.SearchIndex.find()], [kept])
@@ -0,0 +1,53 @@
+import json
+import threading
+import unittest
+from urllib.request import urlopen
+from app import create_app, server
+from app.server import PooledWSGIServer, PreforkServer
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        server.draining.clear()
+
+    def tearDown(self):
+        server.draining.clear()
+
+    def test_ready(self):
+        response = self.app.test_client().get('/ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.get_data(as_text=True))['mongo'])
+
+    def test_not_ready_while_draining(self):
+        server.draining.set()
+        response = self.app.test_client().get('/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(json.loads(response.get_data(as_text=True))['draining'])
+
+    def test_worker_recycles_after_max_requests(self):
+        self.app.config['PAGE_CACHE_ENABLED'] = False
+        prefork = PreforkServer.from_config(self.app, port=0, workers=1)
+        listener = prefork.bind()
+        worker = PooledWSGIServer(prefork.host, prefork.port, self.app, 2, max_requests=2,
+                                  fd=listener.fileno())
+        thread = threading.Thread(target=worker.serve_forever)
+        thread.start()
+        try:
+            for i in range(2):
+                urlopen('http://127.0.0.1:%d/ready' % prefork.port, timeout=5).read()
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+            self.assertTrue(server.draining.is_set())
+            self.assertEqual(worker.handled, 2)
+        finally:
+            if thread.is_alive():
+                worker.shutdown()
+            listener.close()
+
+    def test_config_per_environment(self):
+        self.assertEqual(create_app('development').config['SERVER_WORKERS'], 1)
+        self.assertGreaterEqual(create_app('production').config['SERVER_WORKERS'], 3)
+        prefork = PreforkServer.from_config(self.app, workers=5, threads=None)
+        self.assertEqual(prefork.workers, 5)
+        self.assertEqual(prefork.threads, self.app.config['SERVER_THREADS'])
@@ -0,0 +1,64 @@
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, schema, streaming
+
+
+class StreamingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['PAGE_CACHE_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        schema.ensure_indexes(db.database)
+        schema.seed_roles(db.database)
+        start = datetime(2016, 1, 1)
+        db.database.Aritical.insert_many([{'username': 'cat', 'body': 'post %d' % i, 'body_html': '<p>post %d</p>' % i,
+                                           'body_html_version': 1, 'comment_count': 0,
+                                           'issuing_time': start + timedelta(minutes=i)} for i in range(25)])
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def get(self, path):
+        response = self.client.get(path, buffered=False)
+        streamed = 'Content-Length' not in response.headers
+        body = response.get_data(as_text=True)
+        response.close()
+        return streamed, body
+
+    def test_index_streams_posts_and_pagination(self):
+        streamed, body = self.get('/')
+        self.assertTrue(streamed)
+        self.assertIn('<p>post 24</p>', body)
+        self.assertNotIn('<p>post 4</p>', body)
+        self.assertIn('cursor=', body)
+
+    def test_exempt_endpoint_renders_in_one_piece(self):
+        self.app.config['STREAM_TEMPLATES_EXEMPT'] = ('main.index',)
+        streamed, body = self.get('/')
+        self.assertFalse(streamed)
+        self.assertIn('<p>post 24</p>', body)
+
+    def test_disabled(self):
+        self.app.config['STREAM_TEMPLATES'] = False
+        streamed, body = self.get('/')
+        self.assertFalse(streamed)
+
+    def test_session_is_settled_before_streaming(self):
+        with self.client.session_transaction() as session:
+            session['_flashes'] = [('message', 'hello once')]
+        streamed, body = self.get('/')
+        self.assertIn('hello once', body)
+        streamed, body = self.get('/')
+        self.assertNotIn('hello once', body)
+
+    def test_exempt_decorator(self):
+        view = self.app.view_functions['main.index']
+        streaming.exempt(view)
+        try:
+            streamed, body = self.get('/')
+            self.assertFalse(streamed)
+        finally:
+            streaming._exempt.discard('%s.%s' % (view.__module__, view.__name__))
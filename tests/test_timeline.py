@@ -0,0 +1,89 @@
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, schema, timeline
+
+
+class TimelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_FANOUT_LIMIT'] = 2
+        self.app.config['FLASKY_TIMELINE_LENGTH'] = 5
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        schema.ensure_indexes(db.database)
+        for username in ('cat', 'dog', 'fox', 'star'):
+            db.database.User.insert_one({'username': username, 'email': username + '@example.com',
+                                         'follower_count': 0})
+        self.start = datetime(2016, 1, 1)
+        self.minute = 0
+
+    def tearDown(self):
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
+        self.app_context.pop()
+
+    def follow(self, follower, followee):
+        db.follows.follow(follower, followee, datetime.utcnow())
+        db.users.increment(followee, 'follower_count')
+        timeline.backfill(follower, db.users.by_username(followee))
+
+    def post(self, username, fan_out=True):
+        self.minute += 1
+        post = {'username': username, 'body_html': '%s %d' % (username, self.minute),
+                'issuing_time': self.start + timedelta(minutes=self.minute)}
+        post['_id'] = db.articles.create(post)
+        if fan_out:
+            timeline.fan_out(db.users.by_username(username), post)
+        return post['_id']
+
+    def bodies(self, username, skip=0, limit=10):
+        total, posts = timeline.read(username, skip, limit)
+        return total, [post.get('body_html') for post in posts]
+
+    def test_fan_out_pushes_newest_first_and_caps_length(self):
+        self.follow('cat', 'dog')
+        for i in range(7):
+            self.post('dog')
+        total, bodies = self.bodies('cat')
+        self.assertEqual(total, 5)
+        self.assertEqual(bodies, ['dog 7', 'dog 6', 'dog 5', 'dog 4', 'dog 3'])
+        self.assertEqual(self.bodies('fox'), (0, []))
+
+    def test_backfill_and_prune(self):
+        self.post('dog')
+        self.post('fox')
+        self.follow('cat', 'dog')
+        self.assertEqual(self.bodies('cat'), (1, ['dog 1']))
+        self.follow('cat', 'fox')
+        self.assertEqual(self.bodies('cat'), (2, ['fox 2', 'dog 1']))
+        timeline.prune('cat', 'dog')
+        self.assertEqual(self.bodies('cat'), (1, ['fox 2']))
+
+    def test_large_accounts_are_merged_on_read(self):
+        for follower in ('cat', 'dog', 'fox'):
+            self.follow(follower, 'star')
+        self.follow('cat', 'dog')
+        self.post('star')
+        self.post('dog')
+        self.post('star')
+        self.assertEqual(db.database.Timeline.find_one({'_id': 'cat'})['posts'][0]['username'], 'dog')
+        self.assertEqual(self.bodies('cat'), (3, ['star 3', 'dog 2', 'star 1']))
+        self.assertEqual(self.bodies('cat', skip=1, limit=1), (3, ['dog 2']))
+
+    def test_entries_pushed_before_an_account_grew_are_not_counted_twice(self):
+        self.follow('cat', 'star')
+        self.post('star')
+        self.post('star')
+        self.follow('dog', 'star')
+        self.follow('fox', 'star')
+        self.post('star')
+        self.assertEqual(len(db.database.Timeline.find_one({'_id': 'cat'})['posts']), 2)
+        self.assertEqual(self.bodies('cat'), (3, ['star 3', 'star 2', 'star 1']))
+
+    def test_rebuild(self):
+        self.follow('cat', 'dog')
+        self.follow('cat', 'fox')
+        self.post('dog', fan_out=False)
+        self.post('fox', fan_out=False)
+        self.assertEqual(self.bodies('cat'), (0, []))
+        timeline.rebuild('cat')
+        self.assertEqual(self.bodies('cat'), (2, ['fox 2', 'dog 1']))
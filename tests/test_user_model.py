@@ -1,6 +1,9 @@
 import unittest
-from app import create_app, db
-from app.models import User
+from pymongo.errors import DuplicateKeyError
+from app import create_app, db, schema
+from app.document import Document
+from app.exceptions import ConcurrentModification
+from app.models import User, UserDocument, Permission, verify_password
 
 
 class UserModelTestCase(unittest.TestCase):
@@ -8,28 +11,81 @@ class UserModelTestCase(unittest.TestCase):
         self.app = create_app('testing')
         self.app_context = self.app.app_context()
         self.app_context.push()
-        db.create_all()
+        schema.ensure_indexes(db.database)
+        schema.seed_roles(db.database)
 
     def tearDown(self):
-        db.session.remove()
-        db.drop_all()
+        db.client.drop_database(self.app.config['MONGO_DBNAME'])
         self.app_context.pop()
 
+    def new_user(self, username='cat'):
+        return User(username, username + '@example.com', 'cat', '', '', '')
+
     def test_password_setter(self):
-        u = User(password='cat')
+        u = self.new_user()
         self.assertTrue(u.password_hash is not None)
 
     def test_no_password_getter(self):
-        u = User(password='cat')
+        u = self.new_user()
         with self.assertRaises(AttributeError):
             u.password
 
     def test_password_verification(self):
-        u = User(password='cat')
-        self.assertTrue(u.verify_password('cat'))
-        self.assertFalse(u.verify_password('dog'))
+        u = self.new_user()
+        self.assertTrue(verify_password(u.password_hash, 'cat'))
+        self.assertFalse(verify_password(u.password_hash, 'dog'))
 
     def test_password_salts_are_random(self):
-        u = User(password='cat')
-        u2 = User(password='cat')
+        u = self.new_user()
+        u2 = self.new_user('dog')
         self.assertTrue(u.password_hash != u2.password_hash)
+
+    def test_default_role(self):
+        u = self.new_user()
+        self.assertEqual(u.role, 'User')
+        u_id = u.new_user()
+        self.assertEqual(db.users.get(u_id).get('role'), 'User')
+
+    def test_duplicate_email_is_rejected_by_index(self):
+        self.new_user().new_user()
+        u = User('other', 'cat@example.com', 'cat', '', '', '')
+        with self.assertRaises(DuplicateKeyError):
+            u.new_user()
+
+    def test_document_coalesces_changes(self):
+        u_id = self.new_user().new_user()
+        u = UserDocument.get(u_id)
+        self.assertFalse(u.save())
+        u.name = 'Cat'
+        u.location = 'Home'
+        u.location = 'Garden'
+        self.assertEqual(u.changes, {'name': 'Cat', 'location': 'Garden'})
+        self.assertTrue(u.save())
+        self.assertEqual(u.changes, {})
+        stored = db.users.get(u_id)
+        self.assertEqual((stored['name'], stored['location'], stored['version']), ('Cat', 'Garden', 1))
+        self.assertEqual(u.version, 1)
+
+    def test_document_rejects_stale_version(self):
+        u_id = self.new_user().new_user()
+        first, second = UserDocument.get(u_id), UserDocument.get(u_id)
+        first.about_me = 'first'
+        first.save()
+        second.about_me = 'second'
+        with self.assertRaises(ConcurrentModification):
+            second.save()
+        self.assertEqual(db.users.get(u_id)['about_me'], 'first')
+
+    def test_document_has_no_instance_dict(self):
+        u = UserDocument.get(self.new_user().new_user())
+        with self.assertRaises(AttributeError):
+            u.nickname = 'cat'
+        self.assertTrue(u.can(Permission.COMMENT))
+        self.assertFalse(u.is_administrator())
+
+    def test_document_subclass_must_name_repository(self):
+        class Incomplete(Document):
+            __slots__ = ()
+
+        with self.assertRaises(TypeError):
+            Incomplete({})